@@ -0,0 +1,188 @@
+"""
+
+Performance telemetry for bauplan models: decorate a model function with @instrumented, below the bauplan
+decorators, and every run emits one JSON line with its wall time, CPU time, peak Arrow memory, peak RSS,
+and the rows and bytes of its input and output tables:
+
+@bauplan.model()
+@bauplan.python('3.11')
+@instrumented
+def my_model(data=bauplan.Model('my_parent'), perf_log=bauplan.Parameter('perf_log')):
+    ...
+
+Recording is opt-in, through the perf_log parameter of the model (declared in bauplan_project.yml, and set
+with bauplan run --param perf_log=-) or, for local runs, the BAUPLAN_PERF_LOG environment variable. Empty
+(the default), the decorated function is called as is, and nothing is measured or printed. Set it to - to
+print the lines (so they show up in the output of bauplan run, next to the other prints), or to a file name
+to append them to that file. perf/model_report.py summarizes them per model, and compares two sets of runs
+to catch regressions.
+
+Each bauplan project only ships the files in its own folder, so 02-data-visualization-app/pipeline,
+03-ml-regression-model/pipeline and 04-data-quality-expectations ship copies of this file.
+
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+
+PERF_LOG_PARAMETER = 'perf_log'
+PERF_LOG_VARIABLE = 'BAUPLAN_PERF_LOG'
+# the value of the parameter or variable printing the records instead of writing them to a file
+PRINT_LOG = '-'
+RECORD_EVENT = 'model_perf'
+
+
+def instrumented(
+    fn=None,
+    sample_every: float = 0.01,
+):
+    """
+
+    Decorator recording the performance of each call of fn, when perf_log or BAUPLAN_PERF_LOG is set (see
+    the module docstring). It can be used as @instrumented or @instrumented(sample_every=...), where
+    sample_every is the interval in seconds at which memory is sampled during the call. The record is emitted even if fn raises,
+    with the error.
+
+    """
+    if fn is None:
+        return functools.partial(instrumented, sample_every=sample_every)
+
+    # functools.wraps keeps the name, the docstring and the signature (with its bauplan.Model and
+    # bauplan.Parameter defaults) of the model function
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        # read at each call, so that the variable can be set after the models are imported
+        destination = kwargs.get(PERF_LOG_PARAMETER) or os.environ.get(PERF_LOG_VARIABLE)
+        if not destination:
+            return fn(*args, **kwargs)
+        sampler = _MemorySampler(sample_every)
+        record = {
+            'event': RECORD_EVENT,
+            'model': fn.__name__,
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'python': '.'.join(map(str, sys.version_info[:3])),
+            'parameters': {k: v for k, v in kwargs.items() if isinstance(v, (str, int, float, bool))},
+            **_table_stats('input', [*args, *kwargs.values()]),
+        }
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        sampler.start()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            record['error'] = f'{type(e).__name__}: {e}'
+            raise
+        else:
+            record.update(_table_stats('output', [result]))
+            return result
+        finally:
+            peaks = sampler.stop()
+            record.update({
+                'wall_s': round(time.perf_counter() - wall_start, 4),
+                'cpu_s': round(time.process_time() - cpu_start, 4),
+                **peaks,
+            })
+            _emit(record, destination)
+
+    return wrapper
+
+
+class _MemorySampler:
+    """
+
+    Sample the Arrow memory pool and the RSS of the process in a background thread, and keep their peaks:
+    the Arrow peak is relative to the start of the call, the RSS peak is the absolute peak of the process.
+
+    """
+
+    def __init__(
+        self,
+        sample_every: float,
+    ):
+        self.sample_every = sample_every
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._sample, daemon=True)
+        self.base_arrow = _arrow_bytes()
+        self.peak_arrow = self.base_arrow
+        self.peak_rss = _rss_bytes()
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> dict:
+        self.done.set()
+        self.thread.join()
+        # the call may have finished between two samples
+        self._update()
+
+        return {
+            'peak_arrow_bytes': self.peak_arrow - self.base_arrow,
+            'peak_rss_bytes': self.peak_rss,
+        }
+
+    def _sample(self) -> None:
+        while not self.done.wait(self.sample_every):
+            self._update()
+
+    def _update(self) -> None:
+        self.peak_arrow = max(self.peak_arrow, _arrow_bytes())
+        self.peak_rss = max(self.peak_rss, _rss_bytes())
+
+
+def _arrow_bytes() -> int:
+    import pyarrow as pa
+
+    return pa.total_allocated_bytes()
+
+
+def _rss_bytes() -> int:
+    # psutil is not installed in every model environment: fall back to the peak RSS reported by the OS
+    try:
+        import psutil
+    except ImportError:
+        import resource
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # kilobytes on Linux, bytes on macOS
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+    return psutil.Process().memory_info().rss
+
+
+def _table_stats(
+    prefix: str,
+    values: list,
+) -> dict:
+    """
+
+    The total rows and bytes of the tables among values: Arrow tables, pandas DataFrames, or lists of dicts
+    (what a bauplan model can return). Anything else, e.g. a parameter, is not counted.
+
+    """
+    rows, size = 0, 0
+    for value in values:
+        if hasattr(value, 'num_rows') and hasattr(value, 'nbytes'):
+            rows, size = rows + value.num_rows, size + value.nbytes
+        elif hasattr(value, 'memory_usage') and hasattr(value, 'columns'):
+            rows, size = rows + len(value), size + int(value.memory_usage(index=False).sum())
+        elif isinstance(value, list):
+            rows += len(value)
+
+    return {f'{prefix}_rows': rows, f'{prefix}_bytes': size}
+
+
+def _emit(
+    record: dict,
+    destination: str,
+) -> None:
+    line = json.dumps(record, default=str)
+    if destination == PRINT_LOG:
+        print(line, flush=True)
+    else:
+        with open(destination, 'a') as f:
+            f.write(line + '\n')
@@ -11,6 +11,9 @@ to keep the pipeline code together.
 # import bauplan to get the decorators available
 import bauplan
 
+# records the time and memory of every model run as a JSON line (see instrumentation.py)
+from instrumentation import instrumented
+
 # this decorator tells Bauplan that this function has the model semantics - input: table, output: table.
 # the input is always an Arrow table, output can be an Arrow table, a pandas dataframe or a list of dictionaries.
 # the materialize flag is used to tell the system whether to persist the output of a function as an Iceberg table in the data catalog
@@ -20,6 +23,7 @@ import bauplan
 # e.g. different functions can run with different packages, different versions of the same packages
 # and/or even different versions of the python interpreter
 @bauplan.python('3.11')
+@instrumented
 def trips_and_zones(
         trips=bauplan.Model(
             'taxi_fhvhv',
@@ -37,51 +41,69 @@ def trips_and_zones(
                 'sales_tax',
                 'tips',
                 ],
-            filter="pickup_datetime >= '2022-12-15T00:00:00-05:00' AND pickup_datetime < '2023-01-01T00:00:00-05:00'"
+            filter="pickup_datetime >= '2022-12-15T00:00:00-05:00' AND pickup_datetime < '2023-01-01T00:00:00-05:00' AND trip_miles > 0.0 AND trip_miles < 200.0"
         ),
         zones=bauplan.Model(
             'taxi_zones',
         ),
+        # '' (the default) records nothing, '-' prints a performance record of each run, next to the
+        # other prints of bauplan run (see instrumentation.py)
+        perf_log=bauplan.Parameter('perf_log'),
 ):
     # the following code is PyArrow https://arrow.apache.org/docs/python/index.html
     # because Bauplan speaks Arrow natively you don't need to import PyArrow explicitly
+    # helper functions can live in any file of the project folder, and be imported as usual
+    from arrow_utils import join_trips_with_zones
 
-    # join 'trips' with 'zones' on 'PULocationID'
-    pickup_location_table = trips.join(zones, 'PULocationID', 'LocationID').combine_chunks()
+    # join 'trips' with 'zones' on 'PULocationID': the trips are streamed batch by batch
+    # through a lookup built from the (small) zones table, so we never hold a second full copy of the data
+    pickup_location_table = join_trips_with_zones(trips, zones, 'PULocationID', 'LocationID')
     return pickup_location_table
 
 
 @bauplan.model()
 # this time notice that we specify one dependency, namely Pandas 2.2.0.
-@bauplan.python('3.11', pip={'pandas': '1.5.3', 'numpy': '1.23.2'})
+# the DuckDB and Polars pins are only used by the backend parameter below
+@bauplan.python('3.11', pip={'pandas': '1.5.3', 'numpy': '1.23.2', 'duckdb': '0.10.3', 'polars': '1.30.0'})
+@instrumented
 def normalized_taxi_trips(
         data=bauplan.Model(
             # this function takes the previous one 'trips_and_zones' as an input
             # functions are chained together to form a DAG by naming convention
             'trips_and_zones',
-        )
+        ),
+        # parameters are declared in bauplan_project.yml and can be set with bauplan run --param backend=polars
+        # 'default' runs the PyArrow code below, 'pandas', 'arrow', 'duckdb' or 'polars' the same filters
+        # with that library (see taxi_backends.py)
+        backend=bauplan.Parameter('backend'),
+        perf_log=bauplan.Parameter('perf_log'),
 ):
-    import pandas as pd
-    import numpy as np
     import math
+    from datetime import datetime, timezone
+    from arrow_utils import filter_and_log_trip_miles
+    from taxi_backends import normalize_trips
 
     # print some debug info - you will see every print statement directly in your terminal
     size_in_gb = round(data.nbytes / math.pow(1024, 3), 3)
     print(f"\nThis table is {size_in_gb} GB and has {data.num_rows} rows\n")
 
-    # convert data from Arrow to Pandas
-    df = data.to_pandas()
     # create time filter on datetime UTC
-    time_filter = pd.to_datetime('2022-01-01')
-    time_filter_utc = time_filter.tz_localize('UTC')
-    # filter df by timestamp
-    df = df[df['pickup_datetime'] >= time_filter_utc]
-    # exclude rows with trip_miles = 0
-    df = df[df['trip_miles'] > 0.0]
-    # exclude rows with trip_miles > 200
-    df = df[df['trip_miles'] < 200.0]
-    # create a new columns with log-transformed trip_miles to better model skewed distribution
-    df['log_trip_miles'] = np.log10(df['trip_miles'])
+    time_filter_utc = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    # filter by timestamp, exclude rows with trip_miles = 0 and rows with trip_miles > 200
+    # all the filters are combined into a single mask over the Arrow columns and applied once,
+    # instead of copying the whole table after each filter
+    filters = [
+        ('pickup_datetime', '>=', time_filter_utc),
+        ('trip_miles', '>', 0.0),
+        ('trip_miles', '<', 200.0),
+    ]
+    if backend != 'default':
+        # the same filters and log transform with the library we picked, to compare them on the same data
+        return normalize_trips(data, filters, backend=backend)
+
+    # then create a new columns with log-transformed trip_miles to better model skewed distribution
+    # pass to_pandas=True to get a Pandas dataframe instead
+    table = filter_and_log_trip_miles(data, filters)
 
-    # return a Pandas dataframe
-    return df
+    # return an Arrow table
+    return table
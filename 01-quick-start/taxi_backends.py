@@ -0,0 +1,108 @@
+"""
+
+The transformation of normalized_taxi_trips, with a pandas, an Arrow, a DuckDB and a Polars implementation
+behind the same function: pick one with the backend argument (the backend parameter of the model), and compare
+them with perf/bench_backends.py.
+
+Every implementation takes and returns Arrow tables, which is what bauplan models receive and return, so
+switching backend never changes the inputs or the outputs of a model, only the library doing the work.
+
+"""
+
+import operator
+
+import pyarrow as pa
+
+
+BACKENDS = ('pandas', 'arrow', 'duckdb', 'polars')
+# comparison operators allowed in filters, as in arrow_utils.COMPARISONS
+OPERATORS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+
+def normalize_trips(
+    table: pa.Table,
+    filters: list, # (column, op, value) tuples, all of which must hold, e.g. ('trip_miles', '>', 0.0)
+    backend: str = 'arrow',
+) -> pa.Table:
+    """
+
+    normalized_taxi_trips (01): the rows matching all the filters, with a log10 of trip_miles as log_trip_miles.
+
+    """
+    return _implementation(_NORMALIZE_TRIPS, backend)(table, filters)
+
+
+def _implementation(
+    implementations: dict,
+    backend: str,
+):
+    if backend not in implementations:
+        raise ValueError(f"Unknown backend {backend}, use one of {list(implementations)}")
+    return implementations[backend]
+
+
+# pandas
+
+def _normalize_trips_pandas(table, filters):
+    import numpy as np
+
+    df = table.to_pandas()
+    mask = np.ones(len(df), dtype=bool)
+    for column, op, value in filters:
+        mask &= OPERATORS[op](df[column], value).to_numpy()
+    df = df[mask]
+    df = df.assign(log_trip_miles=np.log10(df['trip_miles']))
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+# Arrow
+
+def _normalize_trips_arrow(table, filters):
+    from arrow_utils import filter_and_log_trip_miles
+
+    return filter_and_log_trip_miles(table, filters)
+
+
+# DuckDB
+
+def _normalize_trips_duckdb(data, filters):
+    import duckdb
+
+    # the filter values are passed as parameters, not formatted into the query
+    where = ' AND '.join(f'"{column}" {op} ?' for column, op, _ in filters) or 'TRUE'
+    query = f'SELECT *, log10(trip_miles) AS log_trip_miles FROM data WHERE {where}'
+
+    return duckdb.execute(query, [value for _, _, value in filters]).arrow()
+
+
+# Polars
+
+def _normalize_trips_polars(table, filters):
+    import polars as pl
+
+    mask = pl.lit(True)
+    for column, op, value in filters:
+        mask = mask & OPERATORS[op](pl.col(column), pl.lit(value))
+
+    return (
+        pl.from_arrow(table)
+        .filter(mask)
+        .with_columns(pl.col('trip_miles').log10().alias('log_trip_miles'))
+        .to_arrow()
+    )
+
+
+_NORMALIZE_TRIPS = {
+    'pandas': _normalize_trips_pandas,
+    'arrow': _normalize_trips_arrow,
+    'duckdb': _normalize_trips_duckdb,
+    'polars': _normalize_trips_polars,
+}
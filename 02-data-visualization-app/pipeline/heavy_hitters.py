@@ -0,0 +1,139 @@
+"""
+
+Streaming top-k counts over the RecordBatches of an Arrow table, with memory bounded by k rather than by the
+number of rows: we never convert the table to pandas, nor group all its rows at once.
+
+The first pass feeds the per-batch counts of the key into a Space-Saving summary (Metwally, Agrawal, El Abbadi,
+"Efficient Computation of Frequent and Top-k Elements in Data Streams", 2005), which keeps at most `capacity`
+candidate keys. The second pass counts the candidates exactly, so that the counts we return are always exact.
+If the summary cannot guarantee that the top k candidates are the true top k (when counts are close to uniform,
+any key can be in the top k), we fall back to an exact count of all the keys.
+
+"""
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+class SpaceSaving:
+    """
+
+    The Space-Saving summary: at most `capacity` keys with an overestimate of their count. A key that is not in
+    the summary was seen at most min_count() times, and any key seen more than n / capacity times is in it.
+
+    """
+
+    def __init__(
+        self,
+        capacity: int,
+    ):
+        self.capacity = capacity
+        self.counts = {}
+        self.n = 0
+
+    def update(
+        self,
+        keys,
+        weights,
+    ) -> None:
+        """
+
+        Add weights[i] occurrences of keys[i], e.g. the value counts of a RecordBatch.
+
+        """
+        for key, weight in zip(keys, weights):
+            self.n += weight
+            if key in self.counts or len(self.counts) < self.capacity:
+                self.counts[key] = self.counts.get(key, 0) + weight
+            else:
+                # replace the key with the smallest count: the new key may have been seen that many times before
+                smallest = min(self.counts, key=self.counts.get)
+                self.counts[key] = self.counts.pop(smallest) + weight
+
+    def min_count(self) -> int:
+        # an upper bound on the count of the keys that are not in the summary
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+
+def top_k_counts(
+    table: pa.Table,
+    k: int,
+    key: str = 'PULocationID',
+    group_columns: tuple = ('PULocationID', 'Borough', 'Zone'),
+    count_column: str = 'pickup_datetime',
+    capacity: int = None,
+    max_chunksize: int = 131_072,
+) -> pa.Table:
+    """
+
+    The k groups of group_columns (functions of key, e.g. the Borough and Zone of a PULocationID) with the most
+    non-null values of count_column, with their exact counts as number_of_trips, in descending order.
+    Like a pandas group by, rows with a null in any of group_columns are left out. The table is read
+    max_chunksize rows at a time, which bounds the memory used by each pass.
+
+    """
+    if k <= 0:
+        raise ValueError(f"k must be positive, got {k}")
+    capacity = capacity or max(4 * k, 64)
+    columns = list(dict.fromkeys([key, *group_columns, count_column]))
+    summary = SpaceSaving(capacity)
+    for batch in table.select(columns).to_batches(max_chunksize=max_chunksize):
+        batch = _counted_rows(batch, group_columns, count_column)
+        value_counts = pc.value_counts(batch[key])
+        summary.update(value_counts.field('values').to_pylist(), value_counts.field('counts').to_pylist())
+
+    candidates = pa.array(list(summary.counts), type=table.schema.field(key).type)
+    counts = _exact_counts(table.select(columns), key, group_columns, count_column, candidates, max_chunksize)
+    # the top k candidates are the true top k if the k-th exact count is at least the largest possible count
+    # of a key outside the summary
+    if len(counts) > k and counts['number_of_trips'][k - 1].as_py() < summary.min_count():
+        print(f"\nSpace-Saving cannot guarantee the top {k}: counting all the keys exactly\n")
+        counts = _exact_counts(table.select(columns), key, group_columns, count_column, None, max_chunksize)
+
+    return counts.slice(0, k)
+
+
+def _counted_rows(
+    batch: pa.RecordBatch,
+    group_columns: tuple,
+    count_column: str,
+) -> pa.RecordBatch:
+    # the rows a pandas group by and count would see: no nulls in the group columns nor in the counted column
+    mask = pc.is_valid(batch[count_column])
+    for column in group_columns:
+        mask = pc.and_(mask, pc.is_valid(batch[column]))
+
+    return batch.filter(mask)
+
+
+def _exact_counts(
+    table: pa.Table,
+    key: str,
+    group_columns: tuple,
+    count_column: str,
+    candidates,
+    max_chunksize: int,
+) -> pa.Table:
+    """
+
+    The exact counts of the candidate keys (or of all the keys if candidates is None) per group, one batch
+    at a time, sorted by count in descending order.
+
+    """
+    partials = []
+    for batch in table.to_batches(max_chunksize=max_chunksize):
+        batch = _counted_rows(batch, group_columns, count_column)
+        if candidates is not None:
+            batch = batch.filter(pc.is_in(batch[key], value_set=candidates))
+        partial = pa.Table.from_batches([batch]).group_by(list(group_columns)).aggregate([(count_column, 'count')])
+        partials.append(partial)
+    counts = (
+        pa.concat_tables(partials)
+        .group_by(list(group_columns))
+        .aggregate([(f'{count_column}_count', 'sum')])
+        .rename_columns([*group_columns, 'number_of_trips'])
+    )
+
+    return counts.sort_by([('number_of_trips', 'descending')])
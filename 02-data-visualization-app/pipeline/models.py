@@ -12,9 +12,13 @@ to keep the pipeline's code together.
 
 import bauplan
 
+# records the time and memory of every model run as a JSON line (see instrumentation.py)
+from instrumentation import instrumented
+
 
 @bauplan.model()
 @bauplan.python('3.11')
+@instrumented
 def trips_and_zones(
         trips=bauplan.Model(
             'taxi_fhvhv',
@@ -22,37 +26,36 @@ def trips_and_zones(
             # by pushing the filters down to S3 we make the system considerably more performant
             columns=[
                 'pickup_datetime',
-                'dropoff_datetime',
                 'PULocationID',
-                'DOLocationID',
-                'trip_miles',
-                'trip_time',
-                'base_passenger_fare',
-                'tips',
             ],
             filter="pickup_datetime >= '2023-01-01T00:00:00-05:00' AND pickup_datetime < '2023-02-02T00:00:00-05:00'"
         ),
         zones=bauplan.Model(
             'taxi_zones',
         ),
+        # '' (the default) records nothing, '-' prints a performance record of each run, next to the
+        # other prints of bauplan run (see instrumentation.py)
+        perf_log=bauplan.Parameter('perf_log'),
 ):
     """
 
        this function does an S3 scan over two tables - taxi_fhvhv and zones - filtering by pickup_datetime
        it then joins them over PULocationID and LocationID using Pyarrow https://arrow.apache.org/docs/python/index.html
+       (see arrow_utils.py for the streaming join implementation)
        the output is a table with the taxi trip the taxi trips in the relevant period and the corresponding pickup Zones
 
     """
 
     import math
+    from arrow_utils import join_trips_with_zones
 
     # the following code is PyArrow
     # because Bauplan speaks Arrow natively you don't need to import PyArrow explicitly
-    # join 'trips' with 'zones' on 'PULocationID' and 'LocationID'
-    pickup_location_table = (trips
-                             .join(zones, 'PULocationID', 'LocationID')
-                             .combine_chunks()
-                             )
+    # join 'trips' with 'zones' on 'PULocationID' and 'LocationID', streaming the trips batch by batch
+    # the output table stays chunked: we avoid copying every column again into a single chunk
+    # this table is not materialized, so the zone attributes can stay dictionary encoded (a code per trip
+    # instead of a string) all the way to the group by of top_pickup_locations
+    pickup_location_table = join_trips_with_zones(trips, zones, 'PULocationID', 'LocationID', dictionary_encode=True)
     # print the size of the resulting table
     size_in_gb = round(pickup_location_table.nbytes / math.pow(1024, 3), 3)
     print(f"\nThis table is {size_in_gb} GB and has {pickup_location_table.num_rows} rows\n")
@@ -62,8 +65,20 @@ def trips_and_zones(
 
 # this function explicitly requires that its output is materialized in the data catalog as an Iceberg table
 @bauplan.model(materialization_strategy='REPLACE')
-@bauplan.python('3.11', pip={'pandas': '2.2.0'})
-def top_pickup_locations(data=bauplan.Model('trips_and_zones')):
+# the DuckDB and Polars pins are only used by the backend parameter below
+@bauplan.python('3.11', pip={'pandas': '2.2.0', 'duckdb': '0.10.3', 'polars': '1.30.0'})
+@instrumented
+def top_pickup_locations(
+        data=bauplan.Model('trips_and_zones'),
+        # 'none' processes the whole table at once, 'day' or 'week' one time slice at a time
+        slice_by=bauplan.Parameter('slice_by'),
+        # 0 counts the trips of all the pickup locations, N > 0 only returns the top N (with exact counts)
+        top_k=bauplan.Parameter('top_k'),
+        # 'default' runs the pandas group by below, 'pandas', 'arrow', 'duckdb' or 'polars' the same count
+        # with that library (see taxi_backends.py)
+        backend=bauplan.Parameter('backend'),
+        perf_log=bauplan.Parameter('perf_log'),
+):
     """
 
     this function takes the parent table with the taxi trips and the corresponding pickup zones
@@ -73,18 +88,60 @@ def top_pickup_locations(data=bauplan.Model('trips_and_zones')):
     """
 
     import pandas as pd
-
-    # convert the input Arrow table into a Pandas dataframe
-    df = data.to_pandas()
-
-    # group the taxi trips by PULocationID, Borough and Zone and sort in descending order
-    # the result will be a Pandas dataframe with all the pickup locations sorted by number of trips
+    from heavy_hitters import top_k_counts
+    from taxi_backends import count_trips_by_zone
+    from time_slices import sliced_apply
+
+    if top_k > 0:
+        # the app only shows the top locations: we stream the RecordBatches of the table through a small
+        # heavy hitters summary, and then count the candidates exactly, instead of grouping all the rows in pandas
+        return (
+            top_k_counts(data, top_k)
+            .to_pandas()
+            .astype({'Borough': 'object', 'Zone': 'object'})
+        )
+
+    def count_trips(table):
+        if backend != 'default':
+            # the same group by with the library we picked, to compare them on the same data
+            return count_trips_by_zone(table, backend=backend).to_pandas()
+        # convert the input Arrow table into a Pandas dataframe
+        df = table.to_pandas()
+        # group the taxi trips by PULocationID, Borough and Zone
+        # Borough and Zone come in as dictionary arrays, i.e. pandas categoricals, so the group by runs on integer codes:
+        # observed=True only keeps the combinations that actually appear in the data
+        return (
+            df
+            .groupby(['PULocationID', 'Borough', 'Zone'], observed=True)
+            .agg(number_of_trips=('pickup_datetime', 'count'))
+            .reset_index()
+        )
+
+    if slice_by == 'none':
+        trip_counts = count_trips(data)
+    else:
+        # convert and group one day (or week) of trips at a time, so that we never hold a pandas copy
+        # of the whole table: the partial counts are then summed up by location
+        # (the Arrow table itself is scanned for the whole window before the model runs)
+        trip_counts = sliced_apply(
+            data,
+            count_trips,
+            merge=lambda partials: (
+                pd.concat(partials)
+                .groupby(['PULocationID', 'Borough', 'Zone'], observed=True)
+                .agg(number_of_trips=('number_of_trips', 'sum'))
+                .reset_index()
+            ),
+            freq=slice_by,
+        )
+
+    # sort in descending order: the result will be a Pandas dataframe
+    # with all the pickup locations sorted by number of trips
     top_pickup_table = (
-        df
-        .groupby(['PULocationID', 'Borough', 'Zone'])
-        .agg(number_of_trips=('pickup_datetime', 'count'))
-        .reset_index()
+        trip_counts
         .sort_values(by='number_of_trips', ascending=False)
+        # the output table is small, so we store plain strings instead of categoricals
+        .astype({'Borough': 'object', 'Zone': 'object'})
     )
     # we can return a Pandas dataframe
     return top_pickup_table
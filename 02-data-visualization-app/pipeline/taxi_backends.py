@@ -0,0 +1,116 @@
+"""
+
+The transformation of top_pickup_locations, with a pandas, an Arrow, a DuckDB and a Polars implementation
+behind the same function: pick one with the backend argument (the backend parameter of the model), and compare
+them with perf/bench_backends.py.
+
+Every implementation takes and returns Arrow tables, which is what bauplan models receive and return, so
+switching backend never changes the inputs or the outputs of a model, only the library doing the work.
+
+"""
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from arrow_utils import decode_dictionaries
+
+
+BACKENDS = ('pandas', 'arrow', 'duckdb', 'polars')
+ZONE_KEYS = ['PULocationID', 'Borough', 'Zone']
+
+
+def count_trips_by_zone(
+    table: pa.Table,
+    backend: str = 'pandas',
+) -> pa.Table:
+    """
+
+    top_pickup_locations (02): the number of trips per PULocationID, Borough and Zone, in descending order.
+    As in a pandas group by, trips without a known zone are left out.
+
+    """
+    return _implementation(_COUNT_TRIPS_BY_ZONE, backend)(table)
+
+
+def _implementation(
+    implementations: dict,
+    backend: str,
+):
+    if backend not in implementations:
+        raise ValueError(f"Unknown backend {backend}, use one of {list(implementations)}")
+    return implementations[backend]
+
+
+# pandas
+
+def _count_trips_by_zone_pandas(table):
+    df = (
+        table.select(['pickup_datetime', *ZONE_KEYS]).to_pandas()
+        .groupby(ZONE_KEYS, observed=True)
+        .agg(number_of_trips=('pickup_datetime', 'count'))
+        .reset_index()
+        .sort_values(by='number_of_trips', ascending=False)
+        .astype({'Borough': 'object', 'Zone': 'object'})
+    )
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+# Arrow
+
+def _count_trips_by_zone_arrow(table):
+    table = table.select(['pickup_datetime', *ZONE_KEYS])
+    # drop the rows a pandas group by would drop: null keys
+    mask = pc.and_(pc.is_valid(table['Borough']), pc.is_valid(table['Zone']))
+    counts = (
+        table.filter(pc.and_(mask, pc.is_valid(table['PULocationID'])))
+        .group_by(ZONE_KEYS)
+        .aggregate([('pickup_datetime', 'count')])
+        .rename_columns([*ZONE_KEYS, 'number_of_trips'])
+        .sort_by([('number_of_trips', 'descending')])
+    )
+
+    return decode_dictionaries(counts)
+
+
+# DuckDB
+
+def _count_trips_by_zone_duckdb(data):
+    import duckdb
+
+    return duckdb.sql("""
+    SELECT
+        PULocationID,
+        Borough::VARCHAR AS Borough,
+        Zone::VARCHAR AS Zone,
+        COUNT(pickup_datetime) AS number_of_trips
+    FROM data
+    WHERE Borough IS NOT NULL AND Zone IS NOT NULL AND PULocationID IS NOT NULL
+    GROUP BY PULocationID, Borough, Zone
+    ORDER BY number_of_trips DESC
+    """).arrow()
+
+
+# Polars
+
+def _count_trips_by_zone_polars(table):
+    import polars as pl
+
+    return (
+        # dictionary arrays come in as Categorical columns, so we group on their codes
+        pl.from_arrow(table.select(['pickup_datetime', *ZONE_KEYS]))
+        .drop_nulls(ZONE_KEYS)
+        .group_by(ZONE_KEYS)
+        .agg(pl.col('pickup_datetime').count().cast(pl.Int64).alias('number_of_trips'))
+        .sort('number_of_trips', descending=True)
+        .with_columns(pl.col('Borough', 'Zone').cast(pl.String))
+        .to_arrow()
+    )
+
+
+_COUNT_TRIPS_BY_ZONE = {
+    'pandas': _count_trips_by_zone_pandas,
+    'arrow': _count_trips_by_zone_arrow,
+    'duckdb': _count_trips_by_zone_duckdb,
+    'polars': _count_trips_by_zone_polars,
+}
@@ -0,0 +1,65 @@
+"""
+
+Process a table one pickup_datetime slice (a day or a week) at a time, so that the memory a function
+allocates on top of the table is bounded by the size of a slice rather than by the size of the whole window.
+
+The function is applied to each slice on a thread pool (Arrow, Polars and DuckDB release the GIL), and
+the partial results are then merged: concatenated, or combined as partial aggregates (e.g. counts are summed).
+
+The input of a bauplan model is scanned for its whole window before the model runs, so this does not bound
+the table itself: top_pickup_locations uses it to bound its pandas copy of the trips.
+
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+
+SLICE_LENGTHS = {
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+}
+
+
+def sliced_apply(
+    table, # an Arrow table already in memory
+    fn, # the function to apply to each slice
+    merge, # a function merging the list of partial results, in time order
+    freq: str = 'day',
+    column: str = 'pickup_datetime',
+    max_workers: int = 4,
+):
+    """
+
+    Apply fn to each slice of a table that is already in memory (e.g. the input of a bauplan model), with
+    at most max_workers slices in flight at once, then merge the partial results: fn only sees the rows of
+    one slice at a time, so whatever it allocates (e.g. a pandas copy of the data) is bounded by the size
+    of a slice. Slices are UTC days (or weeks) starting from the first day in the table; rows with
+    a null timestamp, if any, are passed to fn as a last slice of their own.
+
+    """
+    import numpy as np
+
+    if freq not in SLICE_LENGTHS:
+        raise ValueError(f"Unknown slice frequency {freq}, use one of {list(SLICE_LENGTHS)}")
+    # one pass over the column to find the slice of each row, then a stable sort groups the rows by slice:
+    # each slice is then a contiguous range of row indices, and take() only copies the rows of that slice
+    values = table[column].to_numpy()
+    missing = np.isnat(values)
+    slice_ids = np.zeros(len(values), dtype=np.int64)
+    if not missing.all():
+        first_day = values[~missing].min().astype('datetime64[D]')
+        slice_ids[~missing] = (values[~missing] - first_day) // np.timedelta64(SLICE_LENGTHS[freq])
+    slice_ids[missing] = slice_ids.max(initial=-1) + 1
+    order = np.argsort(slice_ids, kind='stable')
+    bounds = np.searchsorted(slice_ids[order], np.arange(slice_ids.max(initial=-1) + 2))
+    # an empty table still gets one (empty) slice, so that fn decides what an empty result looks like
+    ranges = [(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:]) if hi > lo] or [(0, 0)]
+
+    def _take_and_apply(row_range):
+        return fn(table.take(order[row_range[0]:row_range[1]]))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        partials = list(executor.map(_take_and_apply, ranges))
+
+    return merge(partials)
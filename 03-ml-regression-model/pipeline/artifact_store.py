@@ -0,0 +1,312 @@
+"""
+
+A versioned store for model artifacts: each version of a model is keyed by a fingerprint of its training data
+and hyperparameters, so a run over unchanged data finds the model it trained last time and can skip training
+altogether.
+
+Numpy weights are stored as .npy files and everything else as JSON: no pickles, so loading a model never runs
+code from the store. The store must outlive a run, or a later run would never find the model it trained, so
+its root is one of:
+
+    s3://bucket/prefix, ...  object storage, through pyarrow.fs, so that every container of every run sees
+                             the same versions
+    /some/folder             a local folder, for tests and local runs: the weights are memory-mapped when
+                             loaded (nothing is read until it is used, and processes loading the same model
+                             share its pages)
+
+There is no default root: open_store fails if it is not given one. bauplan's key, value store (save_obj /
+load_obj) only holds the objects of a run, so it cannot be a root.
+
+Layout, under the root:
+
+    <name>/<fingerprint>/meta.json        class, parameters and scalar attributes of the estimator
+    <name>/<fingerprint>/<attribute>.npy  array attributes of the estimator, e.g. coef_.npy
+    <name>/VERSIONS                       the fingerprints of the saved versions, oldest first
+    <name>/LATEST                         the fingerprint of the last version saved
+
+"""
+
+import hashlib
+import io
+import json
+import os
+from datetime import datetime, timezone
+from importlib import import_module
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.fs
+
+
+LATEST = 'LATEST'
+VERSIONS = 'VERSIONS'
+
+
+def training_fingerprint(
+    table: pa.Table,
+    hyperparameters: dict,
+) -> str:
+    """
+
+    A content hash of the table and of the hyperparameters (anything JSON serializable): the same data and
+    settings always give the same fingerprint, and any change in either gives a new one.
+
+    The table is hashed in a canonical form: column names and (decoded) types, then for each column its
+    null mask, its values (nulls as zeros, dictionaries decoded, strings as their lengths and bytes) and
+    anything else as one JSON value per row. Each of these is a stream of bytes fed chunk by chunk, so
+    the same rows chunked or sliced differently give the same fingerprint.
+
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps(hyperparameters, sort_keys=True, default=str).encode())
+    digest.update(str(table.num_rows).encode())
+    for field, column in zip(table.schema, table.columns):
+        column_type = field.type.value_type if pa.types.is_dictionary(field.type) else field.type
+        digest.update(f'{field.name}: {column_type}\n'.encode())
+        # one digest per stream, so that the bytes of one chunk never end up between those of another
+        streams = [hashlib.blake2b(digest_size=16) for _ in range(3)]
+        for chunk in column.chunks:
+            _update_with_chunk(streams, chunk, with_nulls=column.null_count > 0)
+        for stream in streams:
+            digest.update(stream.digest())
+
+    return digest.hexdigest()
+
+
+def open_store(
+    root: str,
+):
+    """
+
+    The ArtifactStore at root: a URI pyarrow.fs knows (s3://, gs://, ...) for object storage, or a local folder.
+
+    """
+    if not root:
+        raise ValueError("No artifact root: set artifact_root to an object storage URI (e.g. s3://bucket/prefix) "
+                         "or a folder, which every run can read")
+    if root.startswith('bauplan://'):
+        raise ValueError(f"Artifact root {root} does not outlive a run: use object storage or a folder")
+
+    return ArtifactStore(FileSystemBackend(root))
+
+
+class FileSystemBackend:
+    """
+
+    Artifacts as files under a root, on any pyarrow.fs filesystem: object storage (s3://bucket/prefix, ...)
+    or a local folder.
+
+    """
+
+    def __init__(
+        self,
+        root: str,
+    ):
+        if '://' in root:
+            self.filesystem, self.root = pyarrow.fs.FileSystem.from_uri(root)
+        else:
+            self.filesystem = pyarrow.fs.LocalFileSystem()
+            self.root = os.path.abspath(os.path.expanduser(root))
+        self.filesystem.create_dir(self.root, recursive=True)
+
+    def read(
+        self,
+        key: str,
+    ):
+        # the bytes of key, or None if there is no such artifact
+        path = f'{self.root}/{key}'
+        if self.filesystem.get_file_info(path).type != pyarrow.fs.FileType.File:
+            return None
+        with self.filesystem.open_input_stream(path) as stream:
+            return stream.read()
+
+    def write(
+        self,
+        key: str,
+        data: bytes,
+    ) -> None:
+        path = f'{self.root}/{key}'
+        self.filesystem.create_dir(path.rsplit('/', 1)[0], recursive=True)
+        with self.filesystem.open_output_stream(path) as stream:
+            stream.write(data)
+
+    def local_path(
+        self,
+        key: str,
+    ):
+        # a path numpy can memory-map, on a local filesystem only
+        if isinstance(self.filesystem, pyarrow.fs.LocalFileSystem):
+            return f'{self.root}/{key}'
+        return None
+
+
+class ArtifactStore:
+    """
+
+    The artifacts of estimators (e.g. a fitted scikit-learn LinearRegression) in a backend (see the module
+    docstring for the backends and the layout).
+
+    """
+
+    def __init__(
+        self,
+        backend,
+    ):
+        self.backend = backend
+
+    def versions(
+        self,
+        name: str,
+    ) -> list:
+        # the fingerprints of the saved versions of name, oldest first
+        versions = self.backend.read(f'{name}/{VERSIONS}')
+        return json.loads(versions) if versions is not None else []
+
+    def latest(
+        self,
+        name: str,
+    ):
+        latest = self.backend.read(f'{name}/{LATEST}')
+        return latest.decode().strip() if latest is not None else None
+
+    def save_estimator(
+        self,
+        name: str,
+        fingerprint: str,
+        estimator,
+    ) -> str:
+        """
+
+        Save the fitted attributes of estimator (the ones ending with '_', as in scikit-learn) as version
+        fingerprint of name, and make it the latest version. Numeric numpy arrays become .npy files, other
+        values must be JSON serializable.
+
+        """
+        arrays, attributes = {}, {}
+        for attribute, value in vars(estimator).items():
+            if not attribute.endswith('_') or attribute.startswith('_'):
+                continue
+            if isinstance(value, np.ndarray) and value.dtype != object:
+                arrays[attribute] = value
+            else:
+                attributes[attribute] = _to_json(attribute, value)
+        meta = {
+            'class': f'{type(estimator).__module__}:{type(estimator).__qualname__}',
+            'params': estimator.get_params() if hasattr(estimator, 'get_params') else {},
+            'attributes': attributes,
+            'arrays': sorted(arrays),
+            'fingerprint': fingerprint,
+            'saved_at': datetime.now(timezone.utc).isoformat(),
+        }
+
+        # the arrays first, and meta.json last: a version without its meta.json is not a version yet,
+        # so a reader never loads half a model
+        for attribute, value in arrays.items():
+            buffer = io.BytesIO()
+            np.save(buffer, value, allow_pickle=False)
+            self.backend.write(f'{name}/{fingerprint}/{attribute}.npy', buffer.getvalue())
+        self.backend.write(f'{name}/{fingerprint}/meta.json', json.dumps(meta, default=str).encode())
+        versions = [version for version in self.versions(name) if version != fingerprint]
+        self.backend.write(f'{name}/{VERSIONS}', json.dumps(versions + [fingerprint]).encode())
+        self.set_latest(name, fingerprint)
+
+        return f'{name}/{fingerprint}'
+
+    def set_latest(
+        self,
+        name: str,
+        fingerprint: str,
+    ) -> None:
+        # the version load_estimator returns when it is not given one
+        self.backend.write(f'{name}/{LATEST}', fingerprint.encode())
+
+    def load_estimator(
+        self,
+        name: str,
+        fingerprint: str = None,
+    ):
+        """
+
+        The estimator saved as version fingerprint of name (the latest version if fingerprint is None),
+        or None if there is no such version. On a local folder, its arrays are memory-mapped.
+
+        """
+        fingerprint = fingerprint or self.latest(name)
+        meta = self.backend.read(f'{name}/{fingerprint}/meta.json') if fingerprint is not None else None
+        if meta is None:
+            return None
+        meta = json.loads(meta)
+        module, qualname = meta['class'].split(':')
+        cls = getattr(import_module(module), qualname)
+        estimator = cls(**meta['params'])
+        for attribute, value in meta['attributes'].items():
+            setattr(estimator, attribute, _from_json(value))
+        for attribute in meta['arrays']:
+            key = f'{name}/{fingerprint}/{attribute}.npy'
+            path = self.backend.local_path(key)
+            if path is not None:
+                value = np.load(path, mmap_mode='r', allow_pickle=False)
+            else:
+                value = np.load(io.BytesIO(self.backend.read(key)), allow_pickle=False)
+            setattr(estimator, attribute, value)
+
+        return estimator
+
+
+def _update_with_chunk(
+    streams: list,
+    chunk: pa.Array,
+    with_nulls: bool,
+) -> None:
+    # the null mask, values and lengths of the chunk, each appended to its own stream: hashing the
+    # concatenation of the chunks of a column, whatever their offsets, padding or boundaries
+    nulls, values, lengths = streams
+    if pa.types.is_dictionary(chunk.type):
+        chunk = chunk.dictionary_decode()
+    if with_nulls:
+        nulls.update(pc.is_null(chunk).to_numpy(zero_copy_only=False).tobytes())
+    chunk_type = chunk.type
+    if pa.types.is_timestamp(chunk_type) or pa.types.is_date(chunk_type) or pa.types.is_duration(chunk_type):
+        chunk = chunk.cast(pa.int64())
+    if pa.types.is_integer(chunk.type) or pa.types.is_floating(chunk.type) or pa.types.is_boolean(chunk.type):
+        if chunk.null_count:
+            chunk = chunk.fill_null(False if pa.types.is_boolean(chunk.type) else 0)
+        # a view of the Arrow buffer for numbers without nulls: hashing reads the data, it does not copy it
+        values.update(np.ascontiguousarray(chunk.to_numpy(zero_copy_only=False)))
+    elif pa.types.is_string(chunk_type) or pa.types.is_large_string(chunk_type) or pa.types.is_binary(chunk_type) \
+            or pa.types.is_large_binary(chunk_type):
+        # the bytes of the values back to back, and their lengths to tell where each one ends
+        chunk = chunk.cast(pa.large_binary())
+        if chunk.null_count:
+            chunk = chunk.fill_null(b'')
+        offsets = np.frombuffer(chunk.buffers()[1], dtype=np.int64)[chunk.offset: chunk.offset + len(chunk) + 1]
+        lengths.update(np.diff(offsets).tobytes())
+        if offsets[-1] > offsets[0]:
+            values.update(memoryview(chunk.buffers()[2])[offsets[0]: offsets[-1]])
+    else:
+        values.update(''.join(json.dumps(value, default=str) + '\n' for value in chunk.to_pylist()).encode())
+
+
+def _to_json(
+    attribute: str,
+    value,
+):
+    if isinstance(value, np.ndarray):
+        return {'ndarray': value.tolist()}
+    if isinstance(value, np.generic):
+        return value.item()
+    try:
+        json.dumps(value)
+    except TypeError:
+        raise ValueError(f"Cannot store attribute {attribute} of type {type(value).__name__}")
+
+    return value
+
+
+def _from_json(
+    value,
+):
+    if isinstance(value, dict) and set(value) == {'ndarray'}:
+        return np.array(value['ndarray'], dtype=object)
+    return value
@@ -0,0 +1,196 @@
+"""
+
+Batched inference over Arrow RecordBatches: each batch of the scoring set goes through the model on its own,
+in a pool of processes, and its predictions are appended to it as a float32 column. The other columns of the
+batch are not copied (the output batch points to the same buffers), and only a few batches per worker are in
+flight at any time, so the memory of scoring is bounded by the size of the batches, not of the scoring set.
+
+The R^2 score of the predictions is accumulated batch by batch, from the same statistics as sklearn's score.
+
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+
+
+FEATURES = ['log_trip_miles', 'base_passenger_fare', 'trip_time']
+TARGET = 'tips'
+PREDICTION = 'predictions'
+BATCH_SIZE = 250_000
+
+# the model of each worker process, set once by _init_worker instead of being pickled with every batch
+_model = None
+
+
+class ScoreAccumulator:
+    """
+
+    Number of rows, mean and sum of squared deviations of the target, and sum of squared errors of the
+    predictions, merged batch by batch (as the Welford accumulator of feature_scaling.py) into the R^2 score.
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.sse = 0.0
+
+    @classmethod
+    def from_arrays(
+        cls,
+        y: np.ndarray,
+        y_hat: np.ndarray,
+    ) -> 'ScoreAccumulator':
+        score = cls()
+        if len(y) == 0:
+            return score
+        score.count = len(y)
+        score.mean = float(y.mean())
+        score.m2 = float(((y - score.mean) ** 2).sum())
+        score.sse = float(((y - y_hat) ** 2).sum())
+
+        return score
+
+    def merge(
+        self,
+        other: 'ScoreAccumulator',
+    ) -> 'ScoreAccumulator':
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            return other
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        merged = ScoreAccumulator()
+        merged.count = count
+        merged.mean = self.mean + delta * other.count / count
+        merged.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        merged.sse = self.sse + other.sse
+
+        return merged
+
+    @property
+    def r2(self) -> float:
+        return 1.0 - self.sse / self.m2 if self.m2 > 0 else float('nan')
+
+
+def predict_batch(
+    batch: pa.RecordBatch,
+    model,
+    features: list = FEATURES,
+    target: str = TARGET,
+) -> tuple:
+    """
+
+    The features and the target of batch, with the predictions of model appended as a float32 column,
+    and the score statistics of the batch.
+
+    """
+    batch = batch.select([*features, target])
+    predictions, score = _predict(batch, model, features, target)
+
+    # pa.array wraps the float32 numpy buffer, and append_column shares the buffers of the other columns
+    return batch.append_column(PREDICTION, pa.array(predictions)), score
+
+
+def predict_batches(
+    data, # an Arrow table, or any iterable of RecordBatches
+    model,
+    features: list = FEATURES,
+    target: str = TARGET,
+    batch_size: int = BATCH_SIZE,
+    max_workers: int = None,
+) -> tuple:
+    """
+
+    The features and the target of data with a float32 column of predictions, as an Arrow table in the order
+    of data, and the R^2 score of the predictions. Batches of at most batch_size rows are scored in a pool of
+    max_workers processes (one per core by default), or in this process if max_workers is 1.
+
+    """
+    if isinstance(data, pa.Table):
+        data = data.to_batches(max_chunksize=batch_size)
+    max_workers = max_workers or os.cpu_count() or 1
+    batches, score = [], ScoreAccumulator()
+    if max_workers <= 1:
+        for batch in data:
+            scored, batch_score = predict_batch(batch, model, features, target)
+            batches.append(scored)
+            score = score.merge(batch_score)
+    else:
+        # the model is pickled once per worker; each batch goes to its worker as an Arrow IPC message with
+        # only the columns we need, and only its predictions come back, to be appended to the batch here
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(model,)) as executor:
+            futures = []
+            for batch in data:
+                batch = batch.select([*features, target])
+                futures.append((batch, executor.submit(_predict_message, _to_message(batch), features, target)))
+                # keep at most 2 batches per worker in flight, so memory stays bounded
+                if len(futures) >= 2 * max_workers:
+                    batch, future = futures.pop(0)
+                    predictions, batch_score = future.result()
+                    batches.append(batch.append_column(PREDICTION, pa.array(predictions)))
+                    score = score.merge(batch_score)
+            for batch, future in futures:
+                predictions, batch_score = future.result()
+                batches.append(batch.append_column(PREDICTION, pa.array(predictions)))
+                score = score.merge(batch_score)
+
+    if not batches:
+        raise ValueError("Cannot score an empty scoring set")
+
+    return pa.Table.from_batches(batches), score.r2
+
+
+def _predict(
+    batch: pa.RecordBatch,
+    model,
+    features: list,
+    target: str,
+) -> tuple:
+    import pandas as pd
+
+    x = np.column_stack([_to_numpy(batch.column(name)) for name in features])
+    # a DataFrame view of the feature matrix, so that models fitted on named features do not warn
+    y_hat = np.asarray(model.predict(pd.DataFrame(x, columns=features, copy=False)), dtype=np.float64)
+    y = _to_numpy(batch.column(target))
+
+    return y_hat.astype(np.float32), ScoreAccumulator.from_arrays(y, y_hat)
+
+
+def _predict_message(
+    message: pa.Buffer,
+    features: list,
+    target: str,
+) -> tuple:
+    # in a worker process, with the model set by _init_worker
+    return _predict(pa.ipc.open_stream(message).read_next_batch(), _model, features, target)
+
+
+def _to_message(
+    batch: pa.RecordBatch,
+) -> pa.Buffer:
+    # the IPC message only holds the rows of the batch, where pickling a slice of a larger batch would
+    # send the whole buffers it points to
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+
+    return sink.getvalue()
+
+
+def _init_worker(
+    model,
+) -> None:
+    global _model
+    _model = model
+
+
+def _to_numpy(
+    column: pa.Array,
+) -> np.ndarray:
+    return column.to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
@@ -0,0 +1,65 @@
+"""
+
+A compact representation of the taxi trips for the models of this pipeline: location IDs fit in int16, trip times
+(in seconds) in int32, and money and miles in float32, which is more precision than the data has (cents, and
+hundredths of miles). Cast once, in clean_taxi_trips, the narrower Arrow types carry through every later model,
+as they read and write Arrow tables; the pandas conversions keep them (as numpy float32 or int16 columns, or as
+Arrow-backed pandas dtypes, which need no conversion copy at all).
+
+memory_report prints the bytes of each column of the output of a stage, so that the footprint of the two
+representations can be compared stage by stage (the @instrumented records have the totals too).
+
+"""
+
+import pyarrow as pa
+
+
+DTYPES = ('default', 'compact')
+# the narrower type of each column of clean_taxi_trips, when it has one
+COMPACT_TYPES = {
+    'PULocationID': pa.int16(),
+    'DOLocationID': pa.int16(),
+    'trip_miles': pa.float32(),
+    'trip_time': pa.int32(),
+    'base_passenger_fare': pa.float32(),
+    'tolls': pa.float32(),
+    'sales_tax': pa.float32(),
+    'tips': pa.float32(),
+}
+
+
+def compact_table(
+    table: pa.Table,
+) -> pa.Table:
+    """
+
+    The table with the columns of COMPACT_TYPES cast to their narrower type (the other columns are not copied).
+    Integer casts are checked, so an ID or a trip time out of range raises instead of wrapping around.
+
+    """
+    for i, field in enumerate(table.schema):
+        compact_type = COMPACT_TYPES.get(field.name)
+        if compact_type is not None and field.type != compact_type:
+            table = table.set_column(i, pa.field(field.name, compact_type, field.nullable),
+                                     table.column(i).cast(compact_type))
+
+    return table
+
+
+def memory_report(
+    stage: str,
+    data, # an Arrow table or a pandas DataFrame
+) -> dict:
+    """
+
+    Print the total and the per column memory of data, the output of stage, and return the bytes by column.
+
+    """
+    if isinstance(data, pa.Table):
+        column_bytes = {name: data.column(name).nbytes for name in data.column_names}
+    else:
+        column_bytes = data.memory_usage(index=False, deep=True).to_dict()
+    columns = ', '.join(f"{name} {size / 1024 ** 2:.1f}" for name, size in column_bytes.items())
+    print(f"Memory of {stage}: {sum(column_bytes.values()) / 1024 ** 2:.1f} MB ({columns})")
+
+    return column_bytes
@@ -0,0 +1,144 @@
+"""
+
+Out-of-core standard scaling of the training features, over the RecordBatches of an Arrow table: the same output
+as converting the table to pandas, dropping the rows with missing values, and calling StandardScaler.fit_transform,
+but without ever holding a pandas copy of the table, or a float64 copy of the features.
+
+The first pass computes the mean and the variance of each feature with a Welford accumulator, one batch at a time
+(accumulators are mergeable, so batches could also be processed in parallel, and their accumulators merged).
+The second pass scales each batch into preallocated float32 buffers, which become the columns of the output.
+
+"""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# the features of the model, and how to compute them from the columns of clean_taxi_trips
+FEATURES = {
+    'log_trip_miles': lambda batch: np.log10(_to_numpy(batch['trip_miles'])),
+    'base_passenger_fare': lambda batch: _to_numpy(batch['base_passenger_fare']),
+    'trip_time': lambda batch: _to_numpy(batch['trip_time']),
+}
+
+
+class WelfordAccumulator:
+    """
+
+    Count, mean and sum of squared deviations (M2) of each column of a stream of 2D arrays, updated one
+    array at a time with Welford's algorithm, in its batched form (Chan, Golub, LeVeque, "Updating Formulae
+    and a Pairwise Algorithm for Computing Sample Variances", 1979), which is also how two accumulators merge.
+
+    """
+
+    def __init__(
+        self,
+        n_features: int,
+    ):
+        self.count = 0
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+
+    def update(
+        self,
+        values: np.ndarray, # one row per observation, one column per feature
+    ) -> None:
+        if len(values) == 0:
+            return
+        batch = WelfordAccumulator(values.shape[1])
+        batch.count = len(values)
+        batch.mean = values.mean(axis=0)
+        batch.m2 = ((values - batch.mean) ** 2).sum(axis=0)
+        self.merge(batch)
+
+    def merge(
+        self,
+        other: 'WelfordAccumulator',
+    ) -> None:
+        count = self.count + other.count
+        if count == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * other.count / count
+        self.count = count
+
+    @property
+    def variance(self) -> np.ndarray:
+        # the population variance, as StandardScaler
+        return self.m2 / self.count if self.count else np.zeros_like(self.m2)
+
+    @property
+    def scale(self) -> np.ndarray:
+        # as StandardScaler, a feature with no variance is left unscaled
+        std = np.sqrt(self.variance)
+        return np.where(std == 0, 1.0, std)
+
+
+def streaming_standard_scale(
+    table: pa.Table,
+    target: str = 'tips',
+    keep: tuple = ('pickup_datetime',),
+    max_chunksize: int = 1_000_000,
+) -> tuple:
+    """
+
+    The rows of table with no missing values, with the FEATURES scaled to mean 0 and variance 1 (as float32),
+    followed by the target and the keep columns as they are. Return the table and the Welford accumulator
+    with the means and the variances of the features (e.g. to scale new data in the same way).
+
+    """
+    accumulator = WelfordAccumulator(len(FEATURES))
+    for batch in table.to_batches(max_chunksize=max_chunksize):
+        batch = batch.filter(_complete_rows(batch))
+        accumulator.update(_feature_matrix(batch))
+
+    scale = accumulator.scale
+    buffers = [np.empty(accumulator.count, dtype=np.float32) for _ in FEATURES]
+    target_chunks, keep_chunks = [], {column: [] for column in keep}
+    offset = 0
+    for batch in table.to_batches(max_chunksize=max_chunksize):
+        batch = batch.filter(_complete_rows(batch))
+        for i, compute in enumerate(FEATURES.values()):
+            # scale in float64, and only store the float32 result in the output buffer
+            out = buffers[i][offset:offset + batch.num_rows]
+            np.divide(compute(batch) - accumulator.mean[i], scale[i], out=out, casting='same_kind')
+        target_chunks.append(batch[target])
+        for column in keep:
+            keep_chunks[column].append(batch[column])
+        offset += batch.num_rows
+
+    columns = {name: pa.array(buffer) for name, buffer in zip(FEATURES, buffers)}
+    columns[target] = pa.chunked_array(target_chunks, type=table.schema.field(target).type)
+    for column in keep:
+        columns[column] = pa.chunked_array(keep_chunks[column], type=table.schema.field(column).type)
+
+    return pa.table(columns), accumulator
+
+
+def _complete_rows(
+    batch: pa.RecordBatch,
+) -> pa.Array:
+    # the rows pandas dropna keeps: no null in any column, and no NaN in the float columns
+    mask = pa.array(np.ones(batch.num_rows, dtype=bool))
+    for column in batch.columns:
+        mask = pc.and_(mask, pc.is_valid(column))
+        if pa.types.is_floating(column.type):
+            mask = pc.and_(mask, pc.invert(pc.is_nan(column)))
+
+    return pc.fill_null(mask, False)
+
+
+def _feature_matrix(
+    batch: pa.RecordBatch,
+) -> np.ndarray:
+    if batch.num_rows == 0:
+        return np.empty((0, len(FEATURES)))
+    return np.column_stack([compute(batch) for compute in FEATURES.values()])
+
+
+def _to_numpy(
+    column: pa.Array,
+) -> np.ndarray:
+    return column.to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
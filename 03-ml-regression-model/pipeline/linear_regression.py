@@ -0,0 +1,222 @@
+"""
+
+Ordinary least squares from sufficient statistics: with a handful of features, the means and the (co)variances
+of the features and of the target are all we need to solve the normal equations, and they can be accumulated
+one RecordBatch at a time, in parallel, and merged. Training data is then only bounded by the time we are
+willing to wait, not by the memory of the worker.
+
+We keep the statistics centered (as the Welford accumulator of feature_scaling.py), which is numerically much
+safer than summing raw squares and cross products, and hand the solution over as a fitted scikit-learn
+LinearRegression, so that the models downstream (e.g. tip_predictions) do not change.
+
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+
+
+FEATURES = ['log_trip_miles', 'base_passenger_fare', 'trip_time']
+TARGET = 'tips'
+
+
+class SufficientStatistics:
+    """
+
+    Number of rows, means of the features and of the target, and co-moments (sums of products of deviations
+    from the means) of the features with each other and with the target. Merging two of them gives the
+    statistics of the union of their rows (Chan, Golub, LeVeque, 1979, for co-moments).
+
+    """
+
+    def __init__(
+        self,
+        n_features: int,
+    ):
+        self.count = 0
+        self.mean_x = np.zeros(n_features)
+        self.mean_y = 0.0
+        self.cxx = np.zeros((n_features, n_features))
+        self.cxy = np.zeros(n_features)
+
+    @classmethod
+    def from_arrays(
+        cls,
+        x: np.ndarray, # one row per observation, one column per feature
+        y: np.ndarray,
+    ) -> 'SufficientStatistics':
+        stats = cls(x.shape[1])
+        if len(x) == 0:
+            return stats
+        stats.count = len(x)
+        stats.mean_x = x.mean(axis=0)
+        stats.mean_y = float(y.mean())
+        dx = x - stats.mean_x
+        stats.cxx = dx.T @ dx
+        stats.cxy = dx.T @ (y - stats.mean_y)
+
+        return stats
+
+    def merge(
+        self,
+        other: 'SufficientStatistics',
+    ) -> 'SufficientStatistics':
+        count = self.count + other.count
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            return other
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        weight = self.count * other.count / count
+        merged = SufficientStatistics(len(self.mean_x))
+        merged.count = count
+        merged.mean_x = self.mean_x + dx * other.count / count
+        merged.mean_y = self.mean_y + dy * other.count / count
+        merged.cxx = self.cxx + other.cxx + np.outer(dx, dx) * weight
+        merged.cxy = self.cxy + other.cxy + dx * dy * weight
+
+        return merged
+
+    def solve(self) -> tuple:
+        """
+
+        The coefficients and the intercept of the least squares fit: the normal equations on centered data,
+        cxx @ coef = cxy, with a least squares solution if some features are collinear.
+
+        """
+        if self.count == 0:
+            raise ValueError("Cannot fit a linear regression on 0 rows")
+        coef, _, _, _ = np.linalg.lstsq(self.cxx, self.cxy, rcond=None)
+
+        return coef, self.mean_y - self.mean_x @ coef
+
+
+def batch_statistics(
+    batch: pa.RecordBatch,
+    features: list = FEATURES,
+    target: str = TARGET,
+) -> SufficientStatistics:
+    """
+
+    The sufficient statistics of one batch, skipping the rows with a missing feature or target
+    (a top level function, so that it can run in a process pool).
+
+    """
+    if batch.num_rows == 0:
+        return SufficientStatistics(len(features))
+    x = np.column_stack([_to_numpy(batch.column(name)) for name in features])
+    y = _to_numpy(batch.column(target))
+    complete = np.isfinite(x).all(axis=1) & np.isfinite(y)
+    if not complete.all():
+        x, y = x[complete], y[complete]
+
+    return SufficientStatistics.from_arrays(x, y)
+
+
+def fit_linear_regression(
+    data, # an Arrow table, a pandas DataFrame, or any iterable of RecordBatches
+    features: list = FEATURES,
+    target: str = TARGET,
+    max_chunksize: int = 1_000_000,
+    max_workers: int = None,
+    processes: bool = True,
+):
+    """
+
+    A scikit-learn LinearRegression fitted on data, from the sufficient statistics of its batches, computed
+    max_workers batches at a time (one per core by default, in this process if max_workers is 1), in a process
+    pool (or a thread pool if processes is False: numpy releases the GIL for the heavy lifting, and threads do
+    not copy the batches).
+
+    """
+    batches = _batches(data, [*features, target], max_chunksize)
+    max_workers = max_workers or os.cpu_count() or 1
+    stats = SufficientStatistics(len(features))
+    if max_workers <= 1:
+        for batch in batches:
+            stats = stats.merge(batch_statistics(batch, features, target))
+    else:
+        executor_class = ProcessPoolExecutor if processes else ThreadPoolExecutor
+        with executor_class(max_workers=max_workers) as executor:
+            futures = []
+            for batch in batches:
+                if processes:
+                    # only the rows of the batch cross to the worker, not the buffers of the whole table
+                    futures.append(executor.submit(_message_statistics, _to_message(batch), features, target))
+                else:
+                    futures.append(executor.submit(batch_statistics, batch, features, target))
+                # keep at most 2 batches per worker in flight, so memory stays bounded
+                if len(futures) >= 2 * max_workers:
+                    stats = stats.merge(futures.pop(0).result())
+            for future in futures:
+                stats = stats.merge(future.result())
+
+    return to_estimator(stats, features)
+
+
+def to_estimator(
+    stats: SufficientStatistics,
+    features: list = FEATURES,
+):
+    """
+
+    A fitted scikit-learn LinearRegression with the least squares solution of stats: predict and score work
+    as usual, on DataFrames with the features as columns, or on arrays with the features in that order.
+
+    """
+    from sklearn.linear_model import LinearRegression
+
+    coef, intercept = stats.solve()
+    reg = LinearRegression()
+    reg.coef_ = coef
+    reg.intercept_ = float(intercept)
+    reg.n_features_in_ = len(features)
+    reg.feature_names_in_ = np.array(features, dtype=object)
+    reg.rank_ = int(np.linalg.matrix_rank(stats.cxx))
+    # the singular values of the centered features are the square roots of the eigenvalues of their co-moments
+    reg.singular_ = np.sqrt(np.clip(np.linalg.eigvalsh(stats.cxx)[::-1], 0.0, None))
+
+    return reg
+
+
+def _batches(
+    data,
+    columns: list,
+    max_chunksize: int,
+):
+    if isinstance(data, pa.Table):
+        return data.select(columns).to_batches(max_chunksize=max_chunksize)
+    if hasattr(data, 'columns') and hasattr(data, 'iloc'):
+        # a pandas DataFrame, e.g. the training set of train_test_split
+        return pa.Table.from_pandas(data[columns], preserve_index=False).to_batches(max_chunksize=max_chunksize)
+    return data
+
+
+def _message_statistics(
+    message: pa.Buffer,
+    features: list,
+    target: str,
+) -> SufficientStatistics:
+    # in a worker process
+    return batch_statistics(pa.ipc.open_stream(message).read_next_batch(), features, target)
+
+
+def _to_message(
+    batch: pa.RecordBatch,
+) -> pa.Buffer:
+    # the IPC message only holds the rows of the batch, where pickling a slice of a larger batch would
+    # send the whole buffers it points to
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+
+    return sink.getvalue()
+
+
+def _to_numpy(
+    column: pa.Array,
+) -> np.ndarray:
+    return column.to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
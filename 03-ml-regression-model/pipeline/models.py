@@ -9,7 +9,7 @@ training_dataset:
 Prepares a training dataset using Pandas and Scikit-learn by selecting features, defining target variables, and normalizing the data distribution.
 
 train_regression_model:
-Splits the dataset into train, validation, and test sets, then trains a Linear Regression model. The model is saved in a key-value store, and the test set is returned for use in the next step.
+Splits the dataset into train, validation, and test sets, then trains a Linear Regression model. The model is saved in a key-value store (or in a versioned artifact store, see artifact_store.py), and the test set is returned for use in the next step.
 
 tip_predictions:
 Retrieves the trained regression model from the key-value store and uses it to generate predictions on the test set, producing a table of results.
@@ -20,10 +20,14 @@ While it is not mandatory to group all models in a single models.py file, we rec
 
 import bauplan
 
+# records the time and memory of every model run as a JSON line (see instrumentation.py)
+from instrumentation import instrumented
+
 
 @bauplan.model()
 # for this function we specify one dependency, Pandas 2.2.0
 @bauplan.python('3.11', pip={'pandas': '2.2.0'})
+@instrumented
 def clean_taxi_trips(
         data=bauplan.Model(
             'taxi_fhvhv',
@@ -40,19 +44,32 @@ def clean_taxi_trips(
                 'tolls',
                 'sales_tax',
                 'tips'],
-            filter="pickup_datetime >= '2023-01-01T00:00:00-05:00' AND pickup_datetime < '2023-03-31T00:00:00-05:00'"
-        )
+            filter="pickup_datetime >= '2023-01-01T00:00:00-05:00' AND pickup_datetime < '2023-03-31T00:00:00-05:00' AND trip_miles > 1.0 AND tips > 0.0 AND base_passenger_fare > 1.0"
+        ),
+        # 'default' converts the table to pandas as is, 'compact' casts location IDs to int16, trip times to int32
+        # and money and miles to float32, and keeps them in Arrow-backed pandas columns (see compact_dtypes.py)
+        dtypes=bauplan.Parameter('dtypes'),
+        # '' (the default) records nothing, '-' prints a performance record of each run, next to the
+        # other prints of bauplan run (see instrumentation.py)
+        perf_log=bauplan.Parameter('perf_log'),
 ):
     import math
     import pandas as pd
+    from compact_dtypes import compact_table, memory_report
 
     # debugging lines to check print the version of Python interpreter and the size of the table
     size_in_gb = data.nbytes / math.pow(1024, 3)
     print(f"This table is {size_in_gb} GB and has {data.num_rows} rows")
-    # input data is always an Arrow table, so if you wish to use pandas, you need an explicit conversion
-    df = data.to_pandas()
+    if dtypes == 'compact':
+        # the narrower types carry through the next models, and ArrowDtype columns share the Arrow buffers
+        # instead of being converted (e.g. timestamps are not copied into nanoseconds)
+        df = compact_table(data).to_pandas(types_mapper=pd.ArrowDtype)
+    else:
+        # input data is always an Arrow table, so if you wish to use pandas, you need an explicit conversion
+        df = data.to_pandas()
     # exclude rows based on multiple conditions
     df = df[(df['trip_miles'] > 1.0) & (df['tips'] > 0.0) & (df['base_passenger_fare'] > 1.0)]
+    memory_report('clean_taxi_trips', df)
 
     # output the data as a Pandas dataframe
     return df
@@ -61,14 +78,32 @@ def clean_taxi_trips(
 @bauplan.model()
 # for this function we specify two dependencies, Pandas 2.2.0 and Scikit-Learn 1.3.2
 @bauplan.python('3.10', pip={'pandas': '1.5.3', 'scikit-learn': '1.3.2'})
+@instrumented
 def training_dataset(
         data=bauplan.Model(
             'clean_taxi_trips',
-        )
+        ),
+        # 'pandas' scales the features with scikit-learn on a pandas copy of the table,
+        # 'streaming' scales them batch by batch, with the same result in float32 (see feature_scaling.py)
+        scaling=bauplan.Parameter('scaling'),
+        # with 'compact' clean_taxi_trips, the pandas scaling keeps the features in float32 (see compact_dtypes.py)
+        dtypes=bauplan.Parameter('dtypes'),
+        perf_log=bauplan.Parameter('perf_log'),
 ):
     import pandas as pd
     import numpy as np
     from sklearn.preprocessing import StandardScaler
+    from feature_scaling import streaming_standard_scale
+    from compact_dtypes import memory_report
+
+    if scaling == 'streaming':
+        # one pass over the Arrow batches for the means and the variances of the features, and a second one to
+        # scale them into float32 buffers: we never hold a pandas copy of the table, nor a float64 feature matrix
+        scaled_table, accumulator = streaming_standard_scale(data)
+        print(f"The training dataset has {scaled_table.num_rows} rows")
+        print(f"Feature means: {accumulator.mean}, standard deviations: {accumulator.scale}")
+        memory_report('training_dataset', scaled_table)
+        return scaled_table
 
     # convert data from Arrow to Pandas
     df = data.to_pandas()
@@ -79,6 +114,9 @@ def training_dataset(
     df['log_trip_miles'] = np.log10(df['trip_miles'])
     # define training and target features
     features = df[['log_trip_miles', 'base_passenger_fare', 'trip_time']]
+    if dtypes == 'compact':
+        # StandardScaler keeps float32 features in float32 (it accumulates the means and variances in float64)
+        features = features.astype(np.float32)
     target = df['tips']
     pickup_dates = df['pickup_datetime']
 
@@ -93,6 +131,7 @@ def training_dataset(
 
     # print the size of the training dataset
     print(f"The training dataset has {len(scaled_df)} rows")
+    memory_report('training_dataset', scaled_df)
 
     # The result is a new array where each feature will have a mean of 0 and a standard deviation of 1
     return scaled_df
@@ -101,38 +140,98 @@ def training_dataset(
 @bauplan.model()
 # for this function we specify two dependencies, Pandas 2.2.0 and Scikit-Learn 1.3.2
 @bauplan.python('3.11', pip={'pandas': '2.2.0', 'scikit-learn': '1.3.2'})
+@instrumented
 def train_regression_model(
         data=bauplan.Model(
             'training_dataset',
-        )
+        ),
+        # 'sklearn' shuffles the rows with train_test_split, 'hash' and 'random' give each row a split label
+        # and take the splits from the table in its order (see splits.py)
+        split=bauplan.Parameter('split'),
+        # 'sklearn' fits LinearRegression on a pandas copy of the training set, 'sufficient_statistics' accumulates
+        # the (co)variances of the features batch by batch, and solves the normal equations (see linear_regression.py)
+        trainer=bauplan.Parameter('trainer'),
+        # 'bauplan' pickles the model in the key, value store, 'artifacts' saves it in a versioned artifact store
+        # at artifact_root (an s3:// URI, which every run sees, so that a later run finds the model), keyed by a
+        # hash of the training data and of the parameters (see artifact_store.py)
+        model_store=bauplan.Parameter('model_store'),
+        artifact_root=bauplan.Parameter('artifact_root'),
+        # with 'compact' clean_taxi_trips, the splits keep their float32 columns, and so do the predictions
+        dtypes=bauplan.Parameter('dtypes'),
+        perf_log=bauplan.Parameter('perf_log'),
 ):
     from sklearn.model_selection import train_test_split
     from sklearn.linear_model import LinearRegression
-
-    # convert arrow input into a Pandas DataFrame
-    df = data.to_pandas()
-
-    # Define the training and validation set sizes
-    training_threshold = 0.8
-    validation_threshold = 0.1  # This will implicitly define the test size as the remaining percentage
-    # Split the dataset into training and remaining sets first
-    train_set, remaining_set = train_test_split(df, train_size=training_threshold, random_state=42)
-    # Split the remaining set into validation and test sets
-    validation_threshold_adjusted = validation_threshold / (1 - training_threshold)
-    validation_set, test_set = train_test_split(remaining_set, test_size=validation_threshold_adjusted, random_state=42)
+    from linear_regression import fit_linear_regression
+    import numpy as np
+    from splits import split_labels, split_mask, split_tables
+    from artifact_store import open_store, training_fingerprint
+    from compact_dtypes import memory_report
+
+    if model_store == 'artifacts':
+        # the same training data and parameters always give the same model: if we trained it in a previous run,
+        # we load it instead of training it again
+        store = open_store(artifact_root)
+        fingerprint = training_fingerprint(data, {'split': split, 'trainer': trainer})
+        reg = store.load_estimator('regression', fingerprint)
+        print(f"Model {fingerprint} {'found in' if reg is not None else 'not in'} the artifact store")
+        if reg is not None:
+            # the model is already saved, we only make it the latest version: all we need is the test set,
+            # taken from the Arrow table without converting the rest to pandas
+            store.set_latest('regression', fingerprint)
+            if split == 'sklearn':
+                # train_test_split shuffles positions: splitting the row numbers gives the rows of the test set
+                _, remaining = train_test_split(np.arange(data.num_rows), train_size=0.8, random_state=42)
+                _, test_rows = train_test_split(remaining, test_size=0.1 / (1 - 0.8), random_state=42)
+                test_set = data.take(test_rows)
+            else:
+                test_set = data.filter(split_mask(split_labels(data, method=split), 'test'))
+            print(f"Skipping training, the test set has {test_set.num_rows} rows")
+            return test_set
+
+    if split == 'sklearn':
+        # convert arrow input into a Pandas DataFrame
+        df = data.to_pandas()
+
+        # Define the training and validation set sizes
+        training_threshold = 0.8
+        validation_threshold = 0.1  # This will implicitly define the test size as the remaining percentage
+        # Split the dataset into training and remaining sets first
+        train_set, remaining_set = train_test_split(df, train_size=training_threshold, random_state=42)
+        # Split the remaining set into validation and test sets
+        validation_threshold_adjusted = validation_threshold / (1 - training_threshold)
+        validation_set, test_set = train_test_split(remaining_set, test_size=validation_threshold_adjusted, random_state=42)
+    else:
+        # the same 80% / 10% / 10% split, without shuffling the whole table twice: each row is copied once,
+        # into its split, and only the training and the validation rows are converted to pandas
+        # (self_destruct frees each Arrow column as soon as it is converted, so we never hold both copies)
+        train_set, validation_set, test_set = split_tables(data, method=split)
+        validation_set = validation_set.to_pandas(split_blocks=True, self_destruct=True)
+        if trainer == 'sklearn':
+            train_set = train_set.to_pandas(split_blocks=True, self_destruct=True)
     # print(f"The training dataset has {len(train_set)} rows")
     print(f"The validation set has {len(validation_set)} rows")
     print(f"The test set has {len(test_set)} rows (remaining)")
 
-    # prepare the feature matrix (X) and target vector (y) for training
-    X_train = train_set[['log_trip_miles', 'base_passenger_fare', 'trip_time']]
-    y_train = train_set['tips']
-    # Train the linear regression model
-    reg = LinearRegression().fit(X_train, y_train)
-
-    # persist the model in a key, value store so we can use it later in the DAG
-    from bauplan.store import save_obj
-    save_obj("regression", reg)
+    if trainer == 'sufficient_statistics':
+        # the same least squares fit, one batch of the training set at a time: the result is a LinearRegression
+        # with the fitted coefficients, so the rest of the pipeline does not change (the batches are spread over
+        # one worker process per core)
+        reg = fit_linear_regression(train_set, ['log_trip_miles', 'base_passenger_fare', 'trip_time'], 'tips')
+    else:
+        # prepare the feature matrix (X) and target vector (y) for training
+        X_train = train_set[['log_trip_miles', 'base_passenger_fare', 'trip_time']]
+        y_train = train_set['tips']
+        # Train the linear regression model
+        reg = LinearRegression().fit(X_train, y_train)
+
+    if model_store == 'artifacts':
+        # saving the model also makes it the latest version, the one tip_predictions loads
+        store.save_estimator('regression', fingerprint, reg)
+    else:
+        # persist the model in a key, value store so we can use it later in the DAG
+        from bauplan.store import save_obj
+        save_obj("regression", reg)
 
     # Prepare the feature matrix (X) and target vector (y) for validation
     X_test = validation_set[['log_trip_miles', 'base_passenger_fare', 'trip_time']]
@@ -145,10 +244,12 @@ def train_regression_model(
 
     # Prepare the output table with predictions
     validation_df = validation_set[['log_trip_miles', 'base_passenger_fare', 'trip_time', 'tips']]
-    validation_df['predictions'] = y_hat
+    validation_df['predictions'] = y_hat.astype('float32') if dtypes == 'compact' else y_hat
 
     # Display the validation set with predictions
     print(validation_df.head())
+    memory_report('train_regression_model training set', train_set)
+    memory_report('train_regression_model', test_set)
 
     return test_set
 
@@ -156,18 +257,45 @@ def train_regression_model(
 @bauplan.model(materialization_strategy='REPLACE')
 # for this function we specify two dependencies, Pandas 2.2.0 and Scikit-Learn 1.3.2
 @bauplan.python('3.11', pip={'scikit-learn': '1.3.2', 'pandas': '2.1.0'})
+@instrumented
 def tip_predictions(
         data=bauplan.Model(
             'train_regression_model',
-        )
-
+        ),
+        split=bauplan.Parameter('split'),
+        model_store=bauplan.Parameter('model_store'),
+        artifact_root=bauplan.Parameter('artifact_root'),
+        # 'pandas' predicts on a pandas copy of the whole test set, 'batches' streams its Arrow batches
+        # through the model on a process pool, one core per worker (see batch_inference.py)
+        inference=bauplan.Parameter('inference'),
+        perf_log=bauplan.Parameter('perf_log'),
 ):
 
-    # retrieve the model trained in the previous step of the DAG from the key, value store
-    from bauplan.store import load_obj
-    reg = load_obj("regression")
+    from splits import split_labels, split_mask
+    from batch_inference import predict_batches
+    if model_store == 'artifacts':
+        # the latest version saved (or found) by train_regression_model, rebuilt from its arrays instead of unpickled
+        from artifact_store import open_store
+        reg = open_store(artifact_root).load_estimator('regression')
+        if reg is None:
+            raise ValueError(f"No regression model in the artifact store at {artifact_root}")
+    else:
+        # retrieve the model trained in the previous step of the DAG from the key, value store
+        from bauplan.store import load_obj
+        reg = load_obj("regression")
     print(type(reg))
 
+    if split == 'hash':
+        # hash splits can be recomputed from the rows alone: we make sure we only score test rows,
+        # e.g. if this model is pointed at the whole training_dataset
+        data = data.filter(split_mask(split_labels(data, method='hash'), 'test'))
+
+    if inference == 'batches':
+        # each batch comes back with a float32 column of predictions appended, its other columns are not copied
+        prediction_table, r2 = predict_batches(data, reg)
+        print("Mean accuracy: {}".format(r2))
+        return prediction_table
+
     # convert the test set from an Arrow table to a Pandas DataFrame
     test_set = data.to_pandas()
 
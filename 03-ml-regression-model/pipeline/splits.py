@@ -0,0 +1,123 @@
+"""
+
+Deterministic train / validation / test splits of an Arrow table, without shuffling or copying it: every row gets
+a split label, and each split is then taken from the table in its original order (a boolean mask, or the indices
+of its rows).
+
+Labels come either from a hash of key columns of the row (method='hash'), so that a row always lands in the same
+split, whatever the other rows and their order (e.g. in tip_predictions, or in the next run over more data),
+or from a seeded random mask over the positions of the rows (method='random'), which only depends on the
+number of rows.
+
+"""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+SPLITS = ('train', 'validation', 'test')
+# the fractions of train_regression_model: 80% training, 10% validation, 10% test
+FRACTIONS = (0.8, 0.1, 0.1)
+# unscaled columns of training_dataset, so that the split does not depend on how the features were scaled
+KEY_COLUMNS = ('pickup_datetime', 'tips')
+METHODS = ('hash', 'random')
+
+
+def split_labels(
+    table: pa.Table,
+    method: str = 'hash',
+    seed: int = 42,
+    fractions: tuple = FRACTIONS,
+    key_columns: tuple = KEY_COLUMNS,
+) -> np.ndarray:
+    """
+
+    The split of each row, as an index in SPLITS (a uint8 array with one value per row of table).
+
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown split method {method}, use one of {METHODS}")
+    if len(fractions) != len(SPLITS) or not np.isclose(sum(fractions), 1.0):
+        raise ValueError(f"fractions must be {len(SPLITS)} numbers adding up to 1, got {fractions}")
+
+    if method == 'random':
+        uniform = np.random.default_rng(seed).random(table.num_rows)
+    else:
+        # each key column is mixed into the hash of the previous ones (and of the seed)
+        hashes = np.full(table.num_rows, seed, dtype=np.uint64)
+        for column in key_columns:
+            hashes ^= _as_uint64(table[column])
+            hashes = _splitmix64(hashes)
+        # the hashes are uniform over the 64 bits integers: compare them with the split boundaries scaled
+        # to that range, instead of converting them to floats in [0, 1)
+        boundaries = [np.uint64(min(int(b * 2.0 ** 64), 2 ** 64 - 1)) for b in np.cumsum(fractions)[:-1]]
+        labels = np.zeros(table.num_rows, dtype=np.uint8)
+        for boundary in boundaries:
+            labels += hashes >= boundary
+        return labels
+
+    return np.searchsorted(np.cumsum(fractions)[:-1], uniform, side='right').astype(np.uint8)
+
+
+def split_mask(
+    labels: np.ndarray,
+    split: str,
+) -> pa.Array:
+    # a boolean Arrow mask selecting the rows of one split, for table.filter
+    return pa.array(labels == SPLITS.index(split))
+
+
+def split_indices(
+    labels: np.ndarray,
+    split: str,
+) -> np.ndarray:
+    # the positions of the rows of one split, in order, e.g. to index numpy arrays of the features
+    return np.flatnonzero(labels == SPLITS.index(split))
+
+
+def split_tables(
+    table: pa.Table,
+    method: str = 'hash',
+    seed: int = 42,
+    fractions: tuple = FRACTIONS,
+    key_columns: tuple = KEY_COLUMNS,
+) -> tuple:
+    """
+
+    The train, validation and test rows of table, as three Arrow tables in the order of table: each row
+    is copied once, into its own split.
+
+    """
+    labels = split_labels(table, method, seed, fractions, key_columns)
+
+    return tuple(table.filter(split_mask(labels, split)) for split in SPLITS)
+
+
+def _as_uint64(
+    column: pa.ChunkedArray,
+) -> np.ndarray:
+    # the 64 bits of each value (timestamps and integers as int64, floats as their float64 bit pattern)
+    if pa.types.is_floating(column.type):
+        values = pc.fill_null(column.cast(pa.float64()), 0.0).to_numpy()
+        return values.view(np.uint64)
+    values = pc.fill_null(column.cast(pa.int64()), 0).to_numpy()
+
+    return values.view(np.uint64)
+
+
+def _splitmix64(
+    x: np.ndarray,
+) -> np.ndarray:
+    # the SplitMix64 finalizer: a fast, well mixed 64 bits hash, the same on every platform and Python run
+    # (computed in place on a single copy of x, as the arrays have one value per row)
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    shifted = np.empty_like(x)
+    for shift, multiplier in ((30, 0xBF58476D1CE4E5B9), (27, 0x94D049BB133111EB)):
+        np.right_shift(x, np.uint64(shift), out=shifted)
+        x ^= shifted
+        np.multiply(x, np.uint64(multiplier), out=x)
+    np.right_shift(x, np.uint64(31), out=shifted)
+    x ^= shifted
+
+    return x
@@ -0,0 +1,168 @@
+"""
+
+Arrow helpers for the taxi pipelines. We keep them out of models.py so the DAG logic stays readable,
+and so the same implementation can be re-used by every model that joins trips with zones.
+
+"""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+def join_trips_with_zones(
+    trips, # an Arrow table (or any iterable of RecordBatches) with the taxi trips
+    zones: pa.Table,
+    trips_key: str = 'PULocationID',
+    zones_key: str = 'LocationID',
+    max_chunksize: int = None,
+    dictionary_encode: bool = False,
+) -> pa.Table:
+    """
+
+    Equivalent to trips.join(zones, trips_key, zones_key) (a left outer join), but the trips are
+    streamed through a small lookup built once from the zones table, one RecordBatch at a time.
+
+    The output is a chunked table (one chunk per input batch) which re-uses the trip columns as they are:
+    only the zone columns are allocated, and there is no final combine_chunks step copying everything again.
+
+    If dictionary_encode is True, string zone attributes (Borough, Zone, service_zone) are returned as
+    dictionary arrays pointing back at the zones table, instead of repeating the strings on every trip:
+    each row then costs a 4 bytes code, and group bys on these columns run on integer codes. It is off by
+    default, because it changes the schema of the table: use it for tables that stay in memory, and decode
+    them before a model materializes them.
+
+    """
+    schema = _joined_schema(trips.schema, zones, zones_key, dictionary_encode)
+    batches = iter_trips_with_zones(trips, zones, trips_key, zones_key, max_chunksize, dictionary_encode)
+
+    return pa.Table.from_batches(batches, schema=schema)
+
+
+def iter_trips_with_zones(
+    trips, # an Arrow table (or any iterable of RecordBatches) with the taxi trips
+    zones: pa.Table,
+    trips_key: str = 'PULocationID',
+    zones_key: str = 'LocationID',
+    max_chunksize: int = None,
+    dictionary_encode: bool = False,
+):
+    """
+
+    Generator version of join_trips_with_zones: yield each trip RecordBatch with the zone columns
+    of its trips_key appended. Trips with no matching zone get null zone attributes, as in a left join.
+
+    """
+    lookup = _build_zone_lookup(zones[zones_key])
+    # zones is tiny (~265 rows), so we can afford a contiguous copy of its attributes
+    zone_names = [name for name in zones.column_names if name != zones_key]
+    zone_columns = [zones[name].combine_chunks() for name in zone_names]
+    if dictionary_encode:
+        zone_columns = [c.dictionary_encode() if _is_string(c.type) else c for c in zone_columns]
+
+    batches = trips.to_batches(max_chunksize=max_chunksize) if isinstance(trips, pa.Table) else trips
+    for batch in batches:
+        positions = _lookup_positions(lookup, batch.column(trips_key))
+        yield pa.RecordBatch.from_arrays(
+            batch.columns + [_gather(column, positions, dictionary_encode) for column in zone_columns],
+            names=batch.schema.names + zone_names
+        )
+
+
+def decode_dictionaries(
+    table: pa.Table,
+) -> pa.Table:
+    """
+
+    The table with its dictionary columns (e.g. the zone attributes of join_trips_with_zones with
+    dictionary_encode=True) cast back to their plain value types.
+
+    """
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table[field.name].cast(field.type.value_type))
+
+    return table
+
+
+def _joined_schema(
+    trips_schema: pa.Schema,
+    zones: pa.Table,
+    zones_key: str,
+    dictionary_encode: bool,
+) -> pa.Schema:
+    zone_fields = [
+        field.with_type(pa.dictionary(pa.int32(), field.type))
+        if dictionary_encode and _is_string(field.type) else field
+        for field in zones.schema if field.name != zones_key
+    ]
+
+    return pa.schema(list(trips_schema) + zone_fields)
+
+
+def _gather(
+    column: pa.Array,
+    positions: pa.Array,
+    dictionary_encode: bool,
+) -> pa.Array:
+    """
+
+    Get the zone attribute of each trip. Dictionary encoded zone columns are encoded once, up front
+    (a dictionary must hold distinct values, and many zones share a Borough): for each trip we only gather
+    the integer code of its zone, and re-use the same small dictionary in every batch.
+
+    """
+    if dictionary_encode and pa.types.is_dictionary(column.type):
+        return pa.DictionaryArray.from_arrays(column.indices.take(positions), column.dictionary)
+
+    return column.take(positions)
+
+
+def _is_string(
+    arrow_type: pa.DataType
+) -> bool:
+    return pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+
+
+def _build_zone_lookup(
+    zone_keys: pa.ChunkedArray
+) -> np.ndarray:
+    """
+
+    Build a dense array mapping each zone key to its row position in the zones table (-1 if absent):
+    location ids are small non-negative integers, so a lookup is a single vectorized gather per batch.
+
+    """
+    keys = zone_keys.combine_chunks()
+    if keys.null_count or not pa.types.is_integer(keys.type):
+        raise ValueError(f"Zone keys must be non-null integers, got {keys.type}")
+    keys = keys.to_numpy()
+    if len(keys) and keys.min() < 0:
+        raise ValueError("Zone keys must be non-negative")
+    if len(np.unique(keys)) != len(keys):
+        raise ValueError("Zone keys must be unique")
+
+    lookup = np.full(int(keys.max()) + 1 if len(keys) else 0, -1, dtype=np.int32)
+    lookup[keys] = np.arange(len(keys), dtype=np.int32)
+
+    return lookup
+
+
+def _lookup_positions(
+    lookup: np.ndarray,
+    keys: pa.Array,
+) -> pa.Array:
+    """
+
+    Map a batch of trip keys to row positions in the zones table: unknown or null keys become
+    null positions, which take() turns into null zone attributes.
+
+    """
+    if keys.null_count:
+        keys = keys.fill_null(-1)
+    keys = keys.to_numpy()
+    in_range = (keys >= 0) & (keys < len(lookup))
+    positions = np.full(len(keys), -1, dtype=np.int32)
+    positions[in_range] = lookup[keys[in_range]]
+
+    return pa.array(positions, mask=positions < 0)
@@ -0,0 +1,497 @@
+"""
+
+An expectation suite runner: a declarative list of checks, evaluated together in one pass over the RecordBatches
+of a table, instead of one @bauplan.expectation function (and one scan of the table) per check.
+
+Each check is a dict with the name of the check, the column it applies to, and its arguments, e.g.
+
+    {'check': 'no_nulls', 'column': 'on_scene_datetime'}
+    {'check': 'unique', 'column': 'trip_id'}
+    {'check': 'between', 'column': 'PULocationID', 'min': 1, 'max': 265}
+    {'check': 'in_set', 'column': 'Borough', 'values': ['Manhattan', 'Brooklyn']}
+    {'check': 'match_regex', 'column': 'service_zone', 'pattern': '^[A-Z]'}
+
+As in the standard expectations of bauplan, null values only fail no_nulls: the other checks look at the
+values that are there. Checks on dictionary encoded columns (e.g. Borough and Zone after join_trips_with_zones)
+are evaluated once on the dictionary, and mapped to the rows through their integer codes.
+
+run_suite returns one row per check: whether it passed, how many rows it looked at, how many failed it,
+and what it observed (e.g. the minimum and the maximum of the column).
+
+Given column statistics (the null count of Arrow columns, which is O(chunks), or the null counts and min / max
+that Parquet files keep for each row group), no_nulls and between are answered from the statistics first, and
+the data is only scanned for the checks the statistics cannot decide: a between check whose bounds are crossed
+by the minimum or the maximum fails without a scan, but its number of failing rows is then unknown (null).
+
+first_failure is the fail fast version, for when a failing expectation should stop the pipeline as soon as
+possible: it goes through the batches in order and stops at the first one with a failing row, returning where
+that batch starts and a sample of its failing rows (or None, after a full scan, if every check passes).
+
+"""
+
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+RESULT_SCHEMA = pa.schema([
+    ('check', pa.string()),
+    ('column', pa.string()),
+    ('passed', pa.bool_()),
+    ('rows', pa.int64()),
+    ('failing_rows', pa.int64()),
+    ('observed', pa.string()),
+    # 'statistics' if the check was decided from column statistics, 'scan' if we had to read the data
+    ('source', pa.string()),
+])
+
+
+class NoNulls:
+
+    def __init__(self, column: str):
+        self.column = column
+        self.failing = 0
+
+    def update(self, array: pa.Array) -> None:
+        # the validity bitmap already knows, nothing to compute
+        self.failing += array.null_count
+
+    def from_statistics(self, statistics: dict) -> bool:
+        if statistics.get('null_count') is None:
+            return False
+        self.failing = statistics['null_count']
+        return True
+
+    def failing_mask(self, array: pa.Array) -> pa.Array:
+        return pc.is_null(array)
+
+    def observed(self) -> str:
+        return f"{self.failing} nulls"
+
+
+class Unique:
+    """
+
+    Exact uniqueness: the batches of the column are kept (by reference, they are not copied) and their distinct
+    values counted once at the end, as a value seen in one batch may come back in any later one. Numbers and
+    timestamps are sorted, and equal neighbours counted, which is faster and much smaller than a hash table
+    of the values; other types go through pyarrow's count_distinct.
+
+    """
+
+    def __init__(self, column: str):
+        self.column = column
+        self.chunks = []
+        self.failing = 0
+
+    def update(self, array: pa.Array) -> None:
+        self.chunks.append(array)
+
+    def from_statistics(self, statistics: dict) -> bool:
+        return False
+
+    def observed(self) -> str:
+        if not self.chunks:
+            return "0 distinct values"
+        values = pa.chunked_array(self.chunks)
+        if pa.types.is_dictionary(values.type):
+            values = _dictionary_codes(values)
+        value_type = values.type
+        if pa.types.is_timestamp(value_type) or pa.types.is_date(value_type) or pa.types.is_duration(value_type):
+            values = values.cast(pa.int64())
+        if pa.types.is_integer(values.type) or pa.types.is_floating(values.type):
+            ordered = np.sort(pc.drop_null(values).to_numpy())
+            # each value equal to the one before it is a duplicate
+            self.failing = int(np.count_nonzero(ordered[1:] == ordered[:-1]))
+            distinct = len(ordered) - self.failing
+        else:
+            distinct = pc.count_distinct(values, mode='only_valid').as_py()
+            # each value beyond the first copy of a distinct value is a duplicate
+            self.failing = len(values) - values.null_count - distinct
+
+        return f"{distinct} distinct values"
+
+
+class Between:
+
+    def __init__(self, column: str, min=None, max=None):
+        if min is None and max is None:
+            raise ValueError(f"between on {column} needs a min, a max or both")
+        self.column = column
+        self.min, self.max = min, max
+        self.failing = 0
+        self.lowest = self.highest = None
+
+    def update(self, array: pa.Array) -> None:
+        if len(array) == array.null_count:
+            return
+        # compare the bounds of the batch first: most batches are all in range, and need no mask
+        bounds = pc.min_max(array)
+        lowest, highest = bounds['min'], bounds['max']
+        self.lowest = lowest if self.lowest is None or pc.less(lowest, self.lowest).as_py() else self.lowest
+        self.highest = highest if self.highest is None or pc.greater(highest, self.highest).as_py() else self.highest
+        low = self.min is not None and pc.less(lowest, _as_scalar(self.min, array.type)).as_py()
+        high = self.max is not None and pc.greater(highest, _as_scalar(self.max, array.type)).as_py()
+        if low or high:
+            self.failing += pc.sum(self._out_of_range(array)).as_py() or 0
+
+    def from_statistics(self, statistics: dict) -> bool:
+        lowest, highest = statistics.get('min'), statistics.get('max')
+        if lowest is None or highest is None:
+            return False
+        try:
+            below = self.min is not None and lowest < _as_value(self.min)
+            above = self.max is not None and highest > _as_value(self.max)
+            all_below = self.min is not None and highest < _as_value(self.min)
+            all_above = self.max is not None and lowest > _as_value(self.max)
+        except TypeError:
+            # e.g. bounds with a time zone against naive timestamps: let the scan compare them
+            return False
+        self.lowest, self.highest = pa.scalar(lowest), pa.scalar(highest)
+        if not below and not above:
+            self.failing = 0
+        elif (all_below or all_above) and statistics.get('null_count') is not None:
+            self.failing = statistics['rows'] - statistics['null_count']
+        else:
+            # some rows are out of range, but only a scan can tell how many
+            self.failing = None
+        return True
+
+    def _out_of_range(self, array: pa.Array) -> pa.Array:
+        masks = []
+        if self.min is not None:
+            masks.append(pc.less(array, _as_scalar(self.min, array.type)))
+        if self.max is not None:
+            masks.append(pc.greater(array, _as_scalar(self.max, array.type)))
+        return masks[0] if len(masks) == 1 else pc.or_(masks[0], masks[1])
+
+    def failing_mask(self, array: pa.Array) -> pa.Array:
+        # nulls are not out of range
+        return pc.fill_null(self._out_of_range(array), False)
+
+    def observed(self) -> str:
+        lowest = self.lowest.as_py() if self.lowest is not None else None
+        highest = self.highest.as_py() if self.highest is not None else None
+        return f"min {lowest}, max {highest}"
+
+
+class _ValueCheck:
+    # a check of each non null value on its own, evaluated on the dictionary of dictionary encoded columns
+
+    def __init__(self, column: str):
+        self.column = column
+        self.failing = 0
+
+    def from_statistics(self, statistics: dict) -> bool:
+        # min / max and null counts cannot tell whether the values are allowed
+        return False
+
+    def update(self, array: pa.Array) -> None:
+        if pa.types.is_dictionary(array.type):
+            passing = pc.sum(self._passes(array.dictionary).take(array.indices)).as_py() or 0
+        else:
+            passing = pc.sum(self._passes(array)).as_py() or 0
+        self.failing += len(array) - array.null_count - passing
+
+    def failing_mask(self, array: pa.Array) -> pa.Array:
+        if pa.types.is_dictionary(array.type):
+            passes = self._passes(array.dictionary).take(array.indices)
+        else:
+            passes = self._passes(array)
+        # nulls pass, as in update
+        return pc.fill_null(pc.invert(passes), False)
+
+
+class InSet(_ValueCheck):
+
+    def __init__(self, column: str, values: list):
+        super().__init__(column)
+        self.values = values
+
+    def _passes(self, array: pa.Array) -> pa.Array:
+        return pc.is_in(array, value_set=pa.array(self.values, type=array.type))
+
+    def observed(self) -> str:
+        return f"{self.failing} values not in {self.values}"
+
+
+class MatchRegex(_ValueCheck):
+
+    def __init__(self, column: str, pattern: str):
+        super().__init__(column)
+        self.pattern = pattern
+
+    def _passes(self, array: pa.Array) -> pa.Array:
+        return pc.match_substring_regex(array, self.pattern)
+
+    def observed(self) -> str:
+        return f"{self.failing} values not matching {self.pattern}"
+
+
+CHECKS = {
+    'no_nulls': NoNulls,
+    'unique': Unique,
+    'between': Between,
+    'in_set': InSet,
+    'match_regex': MatchRegex,
+}
+
+
+def build_checks(
+    checks: list,
+    schema: pa.Schema,
+) -> list:
+    # one accumulator per check, validated against the schema before we read any data
+    accumulators = []
+    for spec in checks:
+        spec = dict(spec)
+        name, column = spec.pop('check', None), spec.pop('column', None)
+        if name not in CHECKS:
+            raise ValueError(f"Unknown check {name}, use one of {list(CHECKS)}")
+        if column not in schema.names:
+            raise ValueError(f"Check {name} is on column {column}, which is not in the table")
+        accumulators.append((name, CHECKS[name](column, **spec)))
+
+    return accumulators
+
+
+def run_suite(
+    table: pa.Table,
+    checks: list,
+    max_chunksize: int = None,
+    statistics: dict = None,
+) -> pa.Table:
+    """
+
+    Evaluate all checks in one pass over the batches of table, and return a table with one row per check
+    (see RESULT_SCHEMA). With statistics (a dict of column statistics, e.g. from arrow_statistics), the checks
+    they decide are not scanned, and if they decide all of them, table is not read at all.
+
+    """
+    accumulators = build_checks(checks, table.schema)
+    decided = _decide_from_statistics(accumulators, statistics)
+    scanned = [accumulator for i, (_, accumulator) in enumerate(accumulators) if i not in decided]
+    if scanned:
+        # only the columns of the checks left
+        columns = list(dict.fromkeys(accumulator.column for accumulator in scanned))
+        for batch in table.select(columns).to_batches(max_chunksize=max_chunksize):
+            for accumulator in scanned:
+                accumulator.update(batch.column(accumulator.column))
+
+    return _results(accumulators, decided, table.num_rows)
+
+
+def first_failure(
+    table: pa.Table,
+    checks: list,
+    max_chunksize: int = None,
+    sample_size: int = 5,
+) -> dict:
+    """
+
+    Evaluate checks over the batches of table in order, and stop at the first batch with a failing row: return
+    the check and the column that failed, the index of the batch and the offset of its first row in table, the
+    number of failing rows in that batch, and a sample of them (as dicts of all the columns, with their row
+    number in table). Return None if every check passes, which takes a full scan, as in run_suite.
+
+    unique is refused: a duplicate is only a duplicate of a value in another batch, see run_suite.
+
+    """
+    accumulators = build_checks(checks, table.schema)
+    for name, accumulator in accumulators:
+        if not hasattr(accumulator, 'failing_mask'):
+            raise ValueError(f"Check {name} cannot fail on one batch, use run_suite for it")
+
+    columns = list(dict.fromkeys(accumulator.column for _, accumulator in accumulators))
+    offset = 0
+    for index, batch in enumerate(table.select(columns).to_batches(max_chunksize=max_chunksize)):
+        for name, accumulator in accumulators:
+            array = batch.column(accumulator.column)
+            # the counting pass of run_suite first (a null count, a min / max): the mask is only computed for
+            # the batch that fails
+            accumulator.update(array)
+            if accumulator.failing == 0:
+                continue
+            rows = pc.indices_nonzero(accumulator.failing_mask(array))[:sample_size]
+            # all the columns of the failing rows, from the slice of the batch (taking from table would
+            # concatenate its chunks)
+            sample = table.slice(offset, batch.num_rows).take(rows).to_pylist()
+            for row_number, row in zip(rows.to_pylist(), sample):
+                row['row'] = offset + row_number
+
+            return {
+                'check': name,
+                'column': accumulator.column,
+                'chunk': index,
+                'offset': offset,
+                'failing_rows': accumulator.failing,
+                'sample': sample,
+            }
+        offset += batch.num_rows
+
+    return None
+
+
+def run_suite_on_parquet(
+    paths: list,
+    checks: list,
+    max_chunksize: int = None,
+) -> pa.Table:
+    """
+
+    run_suite over Parquet files, statistics first: the footers of the files decide what they can, and we
+    only read the columns of the checks they cannot decide (nothing at all if they decide every check).
+
+    """
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(paths[0])
+    accumulators = build_checks(checks, schema)
+    statistics = parquet_statistics(paths)
+    decided = _decide_from_statistics(accumulators, statistics)
+    scanned = [accumulator for i, (_, accumulator) in enumerate(accumulators) if i not in decided]
+    if scanned:
+        columns = list(dict.fromkeys(accumulator.column for accumulator in scanned))
+        for path in paths:
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=max_chunksize or 1_000_000, columns=columns):
+                for accumulator in scanned:
+                    accumulator.update(batch.column(accumulator.column))
+    rows = next(iter(statistics.values()))['rows'] if statistics else 0
+
+    return _results(accumulators, decided, rows)
+
+
+def arrow_statistics(
+    table: pa.Table,
+) -> dict:
+    """
+
+    The statistics an Arrow table carries for free: its number of rows and the null count of each column
+    (kept by every array, so summing them is O(chunks)). Arrow arrays have no min / max.
+
+    """
+    return {
+        name: {'rows': table.num_rows, 'null_count': table.column(name).null_count, 'min': None, 'max': None}
+        for name in table.column_names
+    }
+
+
+def parquet_statistics(
+    paths: list,
+) -> dict:
+    """
+
+    The statistics of each column over Parquet files, merged from the footer of every row group (no data is
+    read): rows, null count, min and max, each None if a row group of a file does not have it.
+
+    """
+    import pyarrow.parquet as pq
+
+    statistics = {}
+    for path in paths:
+        metadata = pq.ParquetFile(path).metadata
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            for j in range(row_group.num_columns):
+                chunk = row_group.column(j)
+                name = chunk.path_in_schema
+                column = statistics.setdefault(name, {'rows': 0, 'null_count': 0, 'min': None, 'max': None,
+                                                      'has_min_max': True})
+                column['rows'] += row_group.num_rows
+                chunk_statistics = chunk.statistics
+                if chunk_statistics is None or not chunk_statistics.has_null_count:
+                    column['null_count'] = None
+                elif column['null_count'] is not None:
+                    column['null_count'] += chunk_statistics.null_count
+                if chunk_statistics is None or not chunk_statistics.has_min_max:
+                    # a row group with only nulls has no min / max, and does not change them
+                    if chunk_statistics is None or chunk_statistics.null_count != row_group.num_rows:
+                        column['has_min_max'] = False
+                    continue
+                if column['min'] is None or chunk_statistics.min < column['min']:
+                    column['min'] = chunk_statistics.min
+                if column['max'] is None or chunk_statistics.max > column['max']:
+                    column['max'] = chunk_statistics.max
+
+    for column in statistics.values():
+        if not column.pop('has_min_max'):
+            column['min'] = column['max'] = None
+
+    return statistics
+
+
+def suite_passed(
+    results: pa.Table,
+) -> bool:
+    return pc.all(results['passed']).as_py() is not False
+
+
+def _decide_from_statistics(
+    accumulators: list,
+    statistics: dict,
+) -> set:
+    # the positions of the checks the statistics of their column decide
+    if not statistics:
+        return set()
+    return {
+        i for i, (_, accumulator) in enumerate(accumulators)
+        if accumulator.column in statistics and accumulator.from_statistics(statistics[accumulator.column])
+    }
+
+
+def _results(
+    accumulators: list,
+    decided: set,
+    num_rows: int,
+) -> pa.Table:
+    rows = []
+    for i, (name, accumulator) in enumerate(accumulators):
+        # observed() comes first: some checks only know how many rows failed once they have seen them all
+        observed = accumulator.observed()
+        rows.append({
+            'check': name,
+            'column': accumulator.column,
+            # failing is None when the statistics tell us some rows fail, but not how many
+            'passed': accumulator.failing == 0,
+            'rows': num_rows,
+            'failing_rows': accumulator.failing,
+            'observed': observed,
+            'source': 'statistics' if i in decided else 'scan',
+        })
+
+    return pa.Table.from_pylist(rows, schema=RESULT_SCHEMA)
+
+
+def _dictionary_codes(
+    values: pa.ChunkedArray,
+) -> pa.ChunkedArray:
+    # dictionary columns (e.g. Borough and Zone) have no count_distinct kernel: once the chunks share one
+    # dictionary, equal values have equal integer codes, unless the dictionary repeats a value, then we decode
+    values = values.unify_dictionaries()
+    dictionary = values.chunk(0).dictionary if values.num_chunks else pa.array([])
+    if pc.count_distinct(dictionary, mode='all').as_py() < len(dictionary):
+        return values.cast(values.type.value_type)
+
+    return pa.chunked_array([chunk.indices for chunk in values.chunks], type=values.type.index_type)
+
+
+def _as_value(
+    value,
+):
+    # bounds as python values, to compare them with the min / max of statistics
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def _as_scalar(
+    value,
+    arrow_type: pa.DataType,
+) -> pa.Scalar:
+    # bounds can be given as ISO strings for timestamp columns, e.g. '2022-12-01T00:00:00-05:00'
+    if isinstance(value, str) and pa.types.is_timestamp(arrow_type):
+        value = datetime.fromisoformat(value)
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+
+    return pa.scalar(value, type=arrow_type)
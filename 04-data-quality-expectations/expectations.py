@@ -4,8 +4,8 @@ This script collects bauplan expectations, that is statistical / quality checks
 against Bauplan models to ensure the data is correct and avoid wasteful computation
 or (even worse) non-compliant data artifacts.
 
-This example showcases how you can use the standard expectations provided by bauplan to test your
-data in the most efficient way possible.
+This example showcases how you can test your data in the most efficient way possible: checks that
+stop at the first failing batch, and many checks evaluated together in one pass over the table.
 
 Note that collecting all expectations in a single file is not required, but we find it useful
 to keep the pipeline code clean and separate from the expectations code.
@@ -13,8 +13,6 @@ to keep the pipeline code clean and separate from the expectations code.
 """
 
 import bauplan
-# import the standard expectations from the library to use them in the functions below
-from bauplan.standard_expectations import expect_column_no_nulls
 
 
 # expectations are identified by a special decorator
@@ -30,19 +28,31 @@ def test_null_values_on_scene_datetime(
     """
 
     As we are calculating the difference between request_datetime and on_scene_datetime
-    we want toe make sure that on_scene_datetime has no null values.
+    we want to make sure that on_scene_datetime has no null values.
+
+    The check fails fast: first_failure (see expectation_suite.py) goes through the batches of the
+    table in order and stops at the first one with a null, so a failing run does not scan to the end
+    before the assert fires, and the error says where the first nulls are and shows some of their rows.
 
     """
 
-    # just return the result of the standard expectation (True if passed), passing to it
-    # the input data, the column name to check, and the reference value
+    from expectation_suite import first_failure
+
     # here is where we declare the columns we want to check
     column_to_check = 'on_scene_datetime'
-    _is_expectation_correct = expect_column_no_nulls(data, column_to_check)
+    failure = first_failure(data, [{'check': 'no_nulls', 'column': column_to_check}])
+    _is_expectation_correct = failure is None
 
     # assert the result of the test. In this way, the pipeline will stop running if the expectation tests fails
     # in this way we can prevent data quality issues to become part of our production environment set up alerts.
-    assert _is_expectation_correct, f"expectation test failed: we expected {column_to_check} to have no null values"
+    if failure is not None:
+        # a sample of the failing rows, with their row number in the table
+        for row in failure['sample']:
+            print(row)
+        assert _is_expectation_correct, (
+            f"expectation test failed: {failure['failing_rows']} null values of {column_to_check} in the batch "
+            f"starting at row {failure['offset']} (batch {failure['chunk']})"
+        )
 
     # print the result of the test. In this way, the pipeline will not stop even if the expectation tests fails
     # in case of failure we are simply printing out the result of the test.
@@ -53,3 +63,65 @@ def test_null_values_on_scene_datetime(
     #     print(f"expectation test failed! {column_to_check} has null values in it.")
 
     return _is_expectation_correct  # return a boolean
+
+
+def normalized_taxi_trips_suite(
+        zones,
+) -> list:
+    """
+
+    The checks of test_normalized_taxi_trips_suite: adding one is adding a line here, not a new function.
+    The allowed pickup locations are those of zones (the taxi_zones table), rather than a list of our own.
+
+    """
+
+    import pyarrow.compute as pc
+
+    return [
+        {'check': 'no_nulls', 'column': 'request_datetime'},
+        {'check': 'no_nulls', 'column': 'pickup_datetime'},
+        # the time window of the scan of normalized_taxi_trips
+        {'check': 'between', 'column': 'pickup_datetime', 'min': '2022-12-01T00:00:00-05:00', 'max': '2023-01-01T00:00:00-05:00'},
+        # a trip with any other location ID gets no Borough or Zone from the join
+        {'check': 'in_set', 'column': 'PULocationID', 'values': pc.unique(zones['LocationID']).to_pylist()},
+    ]
+
+
+@bauplan.expectation()
+@bauplan.python('3.11')
+def test_normalized_taxi_trips_suite(
+        data=bauplan.Model(
+            'normalized_taxi_trips',
+        ),
+        zones=bauplan.Model(
+            'taxi_zones',
+            columns=['LocationID'],
+        ),
+):
+    """
+
+    All the checks of normalized_taxi_trips_suite, evaluated together in one pass over the batches of the table
+    (see expectation_suite.py), instead of one expectation function, and one scan of the table, per check.
+
+    The results are only printed: unlike test_null_values_on_scene_datetime, this expectation never stops
+    the pipeline.
+
+    """
+
+    from expectation_suite import arrow_statistics, run_suite, suite_passed
+
+    # the null checks are answered from the null counts Arrow keeps, without reading the columns
+    results = run_suite(data, normalized_taxi_trips_suite(zones), statistics=arrow_statistics(data))
+    # one row per check, with the number of failing rows and what we observed in the column
+    for row in results.to_pylist():
+        print(row)
+    _is_expectation_correct = suite_passed(results)
+
+    # print the result of the test. In this way, the pipeline will not stop even if some checks fail
+    if _is_expectation_correct:
+        print('expectation suite passed with flying colors')
+    else:
+        failed = [f"{row['check']} on {row['column']}" for row in results.to_pylist() if not row['passed']]
+        print(f"expectation suite failed: {failed}")
+
+    return _is_expectation_correct  # return a boolean
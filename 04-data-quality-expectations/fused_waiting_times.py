@@ -0,0 +1,93 @@
+"""
+
+zone_avg_waiting_times with waiting_times='fused', i.e. taxi_trip_waiting_times and zone_avg_waiting_times fused:
+instead of averaging the rows of taxi_trip_waiting_times, which appends waiting_time_minutes to every row of
+normalized_taxi_trips, by Borough and Zone, we compute the minutes and the per zone sums and counts batch by batch,
+in one streaming pass over normalized_taxi_trips, and only keep the running totals of each zone.
+
+The group by runs on the codes of the zone columns: Borough and Zone come out of join_trips_with_zones
+dictionary encoded, so each batch is aggregated with np.bincount over its (small) dictionaries, and only the
+few hundred zones it has are merged into the totals by value. Plain string columns are dictionary encoded
+one batch at a time first.
+
+"""
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# the values of the waiting_times parameter of zone_avg_waiting_times
+WAITING_TIMES = ('chain', 'fused')
+KEYS = ['Borough', 'Zone']
+
+
+def fused_avg_waiting_times(
+    table: pa.Table,
+    max_chunksize: int = None,
+) -> pa.Table:
+    """
+
+    Return the average waiting_time_minutes per Borough and Zone of table (a normalized_taxi_trips table),
+    in descending order, as zone_avg_waiting_times does after taxi_trip_waiting_times.
+
+    As in SQL, null waiting times are left out of the averages, a zone with none has a null average (listed
+    last), and trips with no zone are averaged together under null Borough and Zone.
+
+    """
+    totals = {}
+    for batch in table.select(KEYS + ['request_datetime', 'on_scene_datetime']).to_batches(max_chunksize=max_chunksize):
+        minutes = pc.minutes_between(batch.column('request_datetime'), batch.column('on_scene_datetime'))
+        _add_to_totals(totals, batch.column('Borough'), batch.column('Zone'), minutes)
+
+    return _averages(totals)
+
+
+def _add_to_totals(
+    totals: dict,
+    boroughs: pa.Array,
+    zones: pa.Array,
+    minutes: pa.Array,
+) -> None:
+    # sum and count the minutes of each (Borough, Zone) code pair of the batch, then merge them by value
+    borough_values, borough_codes = _codes(boroughs)
+    zone_values, zone_codes = _codes(zones)
+    keys = borough_codes * len(zone_values) + zone_codes
+    size = len(borough_values) * len(zone_values)
+    valid = pc.is_valid(minutes).to_numpy(zero_copy_only=False)
+    values = pc.fill_null(minutes, 0).to_numpy(zero_copy_only=False).astype(np.float64)
+    sums = np.bincount(keys, weights=values, minlength=size)
+    counts = np.bincount(keys, weights=valid, minlength=size)
+    trips = np.bincount(keys, minlength=size)
+    for key in np.flatnonzero(trips):
+        borough, zone = divmod(int(key), len(zone_values))
+        total = totals.setdefault((borough_values[borough], zone_values[zone]), [0.0, 0])
+        total[0] += sums[key]
+        total[1] += int(counts[key])
+
+
+def _codes(
+    array: pa.Array,
+) -> tuple:
+    # the values of the dictionary of array (plus None, for the nulls) and the code of each row in them
+    if not pa.types.is_dictionary(array.type):
+        array = pc.dictionary_encode(array)
+    values = array.dictionary.to_pylist() + [None]
+    codes = pc.fill_null(array.indices, len(values) - 1).to_numpy(zero_copy_only=False).astype(np.int64)
+
+    return values, codes
+
+
+def _averages(
+    totals: dict,
+) -> pa.Table:
+    keys = list(totals)
+    averages = pa.array([total / count if count else None for total, count in totals.values()], type=pa.float64())
+    table = pa.table({
+        'Borough': pa.array([borough for borough, _ in keys], type=pa.string()),
+        'Zone': pa.array([zone for _, zone in keys], type=pa.string()),
+        'avg_waiting_time': averages,
+    })
+
+    # nulls sort last, as with ORDER BY in DuckDB
+    return table.sort_by([('avg_waiting_time', 'descending')])
@@ -6,9 +6,13 @@ This pipeline computes a table with the zones of NY ordered by how long it takes
 
 import bauplan
 
+# records the time and memory of every model run as a JSON line (see instrumentation.py)
+from instrumentation import instrumented
+
 
 @bauplan.model()
 @bauplan.python('3.11', pip={'pandas': '2.2.0'})
+@instrumented
 def normalized_taxi_trips(
         trips=bauplan.Model(
             'taxi_fhvhv',
@@ -24,6 +28,9 @@ def normalized_taxi_trips(
         zones=bauplan.Model(
             'taxi_zones'
         ),
+        # '' (the default) records nothing, '-' prints a performance record of each run, next to the
+        # other prints of bauplan run (see instrumentation.py)
+        perf_log=bauplan.Parameter('perf_log'),
 ):
     """
 
@@ -34,13 +41,17 @@ def normalized_taxi_trips(
 
     import math
     import pyarrow.compute as pc
+    from arrow_utils import join_trips_with_zones
 
     # print some debug info - like the size and the number of rows of the table obtained from taxi_fhvhv
     size_in_gb = round(trips.nbytes / math.pow(1024, 3), 3)
     print(f"\nTaxi trips table is {size_in_gb} GB and has {trips.num_rows} rows\n")
 
     # join 'trips' with 'zones' on 'PULocationID' so get all the Zones and the Boroughs associated to each pickup location
-    pickup_location_table = trips.join(zones, 'PULocationID', 'LocationID').combine_chunks()
+    # the trips are streamed through a lookup built once from the zones table, and the output stays chunked
+    # this table is not materialized, so the zone attributes can stay dictionary encoded: the fused averages
+    # group on their codes, and taxi_trip_waiting_times decodes them before it is materialized
+    pickup_location_table = join_trips_with_zones(trips, zones, 'PULocationID', 'LocationID', dictionary_encode=True)
     #pickup_location_table = pc.drop_null(pickup_location_table)
 
     # return an arrow table
@@ -48,11 +59,17 @@ def normalized_taxi_trips(
 
 
 @bauplan.model(materialization_strategy='REPLACE')
-@bauplan.python('3.11', pip={'pandas': '2.2.0'})
+# the DuckDB and Polars pins are only used by the backend parameter below
+@bauplan.python('3.11', pip={'pandas': '2.2.0', 'duckdb': '0.10.3', 'polars': '1.30.0'})
+@instrumented
 def taxi_trip_waiting_times(
         data=bauplan.Model(
             'normalized_taxi_trips',
-        )
+        ),
+        # 'default' runs the PyArrow code below, 'pandas', 'arrow', 'duckdb' or 'polars' the same computation
+        # with that library (see taxi_backends.py)
+        backend=bauplan.Parameter('backend'),
+        perf_log=bauplan.Parameter('perf_log'),
 ):
     """
 
@@ -65,12 +82,22 @@ def taxi_trip_waiting_times(
     """
 
     import pyarrow.compute as pc
-
-    # compute the difference between request_datetime and on_scene_datetime
-    # which tells us the waiting time between the call and the taxi arrival on site
-    waiting_time_min = pc.minutes_between(data['request_datetime'], data['on_scene_datetime'])
-    # append the new columns to the table
-    data = data.append_column('waiting_time_minutes', waiting_time_min)
+    from arrow_utils import decode_dictionaries
+    from taxi_backends import add_waiting_times
+
+    if backend != 'default':
+        # the same waiting times with the library we picked, to compare them on the same data
+        data = add_waiting_times(data, backend=backend)
+    else:
+        # compute the difference between request_datetime and on_scene_datetime
+        # which tells us the waiting time between the call and the taxi arrival on site
+        waiting_time_min = pc.minutes_between(data['request_datetime'], data['on_scene_datetime'])
+        # append the new columns to the table
+        data = data.append_column('waiting_time_minutes', waiting_time_min)
+
+    # the zone attributes come in dictionary encoded (see normalized_taxi_trips): this table is materialized,
+    # so we store them as plain strings, as in its usual schema
+    data = decode_dictionaries(data)
 
     # return an arrow table
     return data
@@ -79,11 +106,24 @@ def taxi_trip_waiting_times(
 @bauplan.model(
     materialization_strategy='REPLACE'
 )
-@bauplan.python('3.11', pip={'duckdb': '0.10.3'})
+# the pandas and Polars pins are only used by the backend parameter below
+@bauplan.python('3.11', pip={'duckdb': '0.10.3', 'pandas': '2.2.0', 'polars': '1.30.0'})
+@instrumented
 def zone_avg_waiting_times(
         taxi_trip_waiting_times=bauplan.Model(
             'taxi_trip_waiting_times'
-        )
+        ),
+        # only read with waiting_times='fused'
+        trips=bauplan.Model(
+            'normalized_taxi_trips',
+        ),
+        # 'default' runs the DuckDB query below, 'pandas', 'arrow', 'duckdb' or 'polars' the same average
+        # with that library (see taxi_backends.py)
+        backend=bauplan.Parameter('backend'),
+        # 'chain' averages the rows of taxi_trip_waiting_times, 'fused' computes the waiting times and their
+        # per zone sums and counts from the trips, in one streaming pass (see fused_waiting_times.py)
+        waiting_times=bauplan.Parameter('waiting_times'),
+        perf_log=bauplan.Parameter('perf_log'),
 ):
     """
 
@@ -93,6 +133,18 @@ def zone_avg_waiting_times(
     """
 
     import duckdb
+    from fused_waiting_times import WAITING_TIMES, fused_avg_waiting_times
+    from taxi_backends import avg_waiting_time_by_zone
+
+    if waiting_times not in WAITING_TIMES:
+        raise ValueError(f"Unknown waiting_times {waiting_times}, use one of {WAITING_TIMES}")
+    if waiting_times == 'fused':
+        # only the running totals of each zone are kept while we stream the trips
+        return fused_avg_waiting_times(trips)
+
+    if backend != 'default':
+        # the same averages with the library we picked, to compare them on the same data
+        return avg_waiting_time_by_zone(taxi_trip_waiting_times, backend=backend)
 
     # the following code uses DuckDB
     # because DuckDB can query directly Arrow tables we do not need to do anything and can query directly the input tables
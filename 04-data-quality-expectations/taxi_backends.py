@@ -0,0 +1,167 @@
+"""
+
+The transformations of taxi_trip_waiting_times and zone_avg_waiting_times, each with a pandas, an Arrow,
+a DuckDB and a Polars implementation behind the same function: pick one with the backend argument (the backend
+parameter of the models), and compare them with perf/bench_backends.py.
+
+Every implementation takes and returns Arrow tables, which is what bauplan models receive and return, so
+switching backend never changes the inputs or the outputs of a model, only the library doing the work.
+
+"""
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from arrow_utils import decode_dictionaries
+
+
+BACKENDS = ('pandas', 'arrow', 'duckdb', 'polars')
+
+
+def add_waiting_times(
+    table: pa.Table,
+    backend: str = 'arrow',
+) -> pa.Table:
+    """
+
+    taxi_trip_waiting_times (04): the table with waiting_time_minutes, the number of minute boundaries between
+    request_datetime and on_scene_datetime (as pyarrow.compute.minutes_between).
+
+    """
+    return _implementation(_ADD_WAITING_TIMES, backend)(table)
+
+
+def avg_waiting_time_by_zone(
+    table: pa.Table,
+    backend: str = 'duckdb',
+) -> pa.Table:
+    """
+
+    zone_avg_waiting_times (04): the average waiting_time_minutes per Borough and Zone, in descending order.
+
+    """
+    return _implementation(_AVG_WAITING_TIME_BY_ZONE, backend)(table)
+
+
+def _implementation(
+    implementations: dict,
+    backend: str,
+):
+    if backend not in implementations:
+        raise ValueError(f"Unknown backend {backend}, use one of {list(implementations)}")
+    return implementations[backend]
+
+
+# pandas
+
+def _add_waiting_times_pandas(table):
+    import pandas as pd
+
+    df = table.select(['request_datetime', 'on_scene_datetime']).to_pandas()
+    # minute boundaries crossed: the difference of the timestamps truncated to the minute
+    minutes = (df['on_scene_datetime'].dt.floor('min') - df['request_datetime'].dt.floor('min')) // pd.Timedelta(minutes=1)
+
+    return table.append_column('waiting_time_minutes', pa.array(minutes, type=pa.int64(), from_pandas=True))
+
+
+def _avg_waiting_time_by_zone_pandas(table):
+    df = (
+        table.select(['Borough', 'Zone', 'waiting_time_minutes']).to_pandas()
+        .astype({'Borough': 'object', 'Zone': 'object'})
+        .groupby(['Borough', 'Zone'], dropna=False)
+        .agg(avg_waiting_time=('waiting_time_minutes', 'mean'))
+        .reset_index()
+        .sort_values(by='avg_waiting_time', ascending=False)
+    )
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+# Arrow
+
+def _add_waiting_times_arrow(table):
+    waiting_time_min = pc.minutes_between(table['request_datetime'], table['on_scene_datetime'])
+
+    return table.append_column('waiting_time_minutes', waiting_time_min)
+
+
+def _avg_waiting_time_by_zone_arrow(table):
+    return decode_dictionaries(
+        table.select(['Borough', 'Zone', 'waiting_time_minutes'])
+        .group_by(['Borough', 'Zone'])
+        .aggregate([('waiting_time_minutes', 'mean')])
+        .rename_columns(['Borough', 'Zone', 'avg_waiting_time'])
+        .sort_by([('avg_waiting_time', 'descending')])
+    )
+
+
+# DuckDB
+
+def _add_waiting_times_duckdb(data):
+    import duckdb
+
+    # the minute boundaries are counted on the epoch microseconds: date_diff('minute', ...) gives the same
+    # result on (post 1970) UTC timestamps, but goes through the calendar of the time zone for every row
+    waiting_times = duckdb.sql("""
+    SELECT
+        epoch_us(on_scene_datetime) // 60000000 - epoch_us(request_datetime) // 60000000 AS waiting_time_minutes
+    FROM data
+    """).arrow()
+
+    return data.append_column('waiting_time_minutes', waiting_times['waiting_time_minutes'])
+
+
+def _avg_waiting_time_by_zone_duckdb(data):
+    import duckdb
+
+    return duckdb.sql("""
+    SELECT
+        Borough::VARCHAR AS Borough,
+        Zone::VARCHAR AS Zone,
+        AVG(waiting_time_minutes) AS avg_waiting_time
+    FROM data
+    GROUP BY Borough, Zone
+    ORDER BY avg_waiting_time DESC
+    """).arrow()
+
+
+# Polars
+
+def _add_waiting_times_polars(table):
+    import polars as pl
+
+    df = pl.from_arrow(table.select(['request_datetime', 'on_scene_datetime']))
+    waiting_times = df.select(
+        (pl.col('on_scene_datetime').dt.truncate('1m') - pl.col('request_datetime').dt.truncate('1m'))
+        .dt.total_minutes()
+        .alias('waiting_time_minutes')
+    )
+
+    return table.append_column('waiting_time_minutes', waiting_times.to_arrow()['waiting_time_minutes'])
+
+
+def _avg_waiting_time_by_zone_polars(table):
+    import polars as pl
+
+    return (
+        pl.from_arrow(table.select(['Borough', 'Zone', 'waiting_time_minutes']))
+        .group_by(['Borough', 'Zone'])
+        .agg(pl.col('waiting_time_minutes').mean().alias('avg_waiting_time'))
+        .sort('avg_waiting_time', descending=True, nulls_last=True)
+        .with_columns(pl.col('Borough', 'Zone').cast(pl.String))
+        .to_arrow()
+    )
+
+
+_ADD_WAITING_TIMES = {
+    'pandas': _add_waiting_times_pandas,
+    'arrow': _add_waiting_times_arrow,
+    'duckdb': _add_waiting_times_duckdb,
+    'polars': _add_waiting_times_polars,
+}
+_AVG_WAITING_TIME_BY_ZONE = {
+    'pandas': _avg_waiting_time_by_zone_pandas,
+    'arrow': _avg_waiting_time_by_zone_arrow,
+    'duckdb': _avg_waiting_time_by_zone_duckdb,
+    'polars': _avg_waiting_time_by_zone_polars,
+}
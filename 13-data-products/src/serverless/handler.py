@@ -3,6 +3,7 @@ import uuid
 import tempfile
 import bauplan
 import os
+import shutil
 import subprocess
 from datetime import datetime, timezone
 import json
@@ -18,6 +19,11 @@ NUMERICAL_COLUMNS = [ 'Tip_amount', 'Tolls_amount']
 # here for the mock generation of the streaming of new data
 INPUT_PORT_TABLE = 'tripsTable'
 INPUT_PORT_NAMESPACE = 'tlc_trip_record'
+# peak memory of the uniqueness checks on top of the data (see unique_check.py): above it, values are
+# hash partitioned to local disk and checked one partition at a time
+UNIQUE_CHECK_MAX_MEMORY_MB = 256
+# the helper module the generated uniqueness checks import, copied next to the generated expectations
+UNIQUE_CHECK_MODULE = 'unique_check.py'
 
 
 #### CODE GEN SECTION ####
@@ -30,7 +36,7 @@ import bauplan
 {imports}
 
 @bauplan.expectation()
-@bauplan.python('3.11')
+@bauplan.python('3.11'{pip})
 def {product_name}_quality_checks(
     data=bauplan.Model('{product_name}'),
     # we need the parameter for table level quality check!
@@ -49,6 +55,17 @@ check_template = """
     assert {exp_method}(data, '{column_to_check}')
 """
 
+# duplicateCount == 0 runs the memory bounded uniqueness check of unique_check.py, which needs numpy
+unique_import = """
+from unique_check import expect_column_all_unique_bounded
+"""
+
+unique_check_template = """
+    assert expect_column_all_unique_bounded(data, '{column_to_check}', max_memory_mb={max_memory_mb})
+"""
+
+unique_pip = ", pip={'numpy': '2.2.2'}"
+
 freshness_template = """
     now_utc = datetime.now(timezone.utc)
     parsed_date = datetime.strptime(trip_date, "%d/%m/%Y").replace(tzinfo=timezone.utc)
@@ -85,6 +102,9 @@ def _property_quality_to_code(
     Take the property quality checks and generate the code for the expectations.
     We return two strings, one representing the imports and the other the asserts.
 
+    Uniqueness checks use unique_check.py, which is memory bounded, and must be copied
+    next to the generated file (see lambda_handler).
+
     If we encounter a quality check that is not supported, we throw an error.
 
     """ 
@@ -94,8 +114,9 @@ def _property_quality_to_code(
     for col, checks in property_to_qualities.items():
         for c in checks:
             if c['rule'] == 'duplicateCount' and int(c['mustBeEqualTo']) == 0:
-                imports.append(import_template.format(exp_method='expect_column_all_unique'))
-                asserts.append(check_template.format(exp_method='expect_column_all_unique', column_to_check=col))
+                # instead of expect_column_all_unique, which needs all the values in a hash set
+                imports.append(unique_import)
+                asserts.append(unique_check_template.format(column_to_check=col, max_memory_mb=UNIQUE_CHECK_MAX_MEMORY_MB))
             elif c['rule'] == 'null' and int(c['mustBeEqualTo']) == 0:
                 imports.append(import_template.format(exp_method='expect_column_no_nulls'))
                 asserts.append(check_template.format(exp_method='expect_column_no_nulls', column_to_check=col))
@@ -116,6 +137,7 @@ def _generate_expectation_file_as_str(
     full_code = expectation_function_template.format(
         product_name=product_name,
         imports=column_quality_imports,
+        pip=unique_pip if unique_import in column_quality_imports else '',
         function_body=table_quality_code + column_quality_checks
     )
     
@@ -287,6 +309,9 @@ def lambda_handler(event, context):
         # write the expectation file to the pipeline_project_path as a py file
         with open(os.path.join(pipeline_project_path, "expectations.py"), 'w') as f:
             f.write(_exp_code)
+        # the uniqueness checks import unique_check, which ships with this function, not with the product code
+        if unique_import in _exp_code:
+            shutil.copy(os.path.join(os.path.dirname(os.path.abspath(__file__)), UNIQUE_CHECK_MODULE), pipeline_project_path)
         
         # 3.c: run the pipeline and merge the branch if successful
         # make sure to catch any error and delete the branch if something goes wrong
@@ -0,0 +1,317 @@
+"""
+
+A memory bounded version of expect_column_all_unique, for the duplicateCount == 0 rules of the data product
+contract: the generated expectation code (see _property_quality_to_code in handler.py) calls it instead of the
+standard expectation, and the handler copies this file next to the generated expectations.py.
+
+An exact check needs to keep every distinct value around (in a hash set, or sorted), which does not fit in memory
+on a billion rows column. So we check in two steps:
+
+1. one pass over the column to estimate its number of distinct values with a HyperLogLog sketch (16K registers
+of one byte, ~0.8% standard error): if the estimate is below the number of values by more than Z_SCORE standard
+errors, the column confidently has duplicates, and we stop there;
+2. otherwise, an exact check: in memory if the column fits in max_memory_mb, or else by hash partitioning, i.e.
+writing each value to one of N Arrow IPC files in a local spill directory according to its hash, so that equal
+values land in the same partition, and checking the partitions one at a time, each of them fitting in
+max_memory_mb.
+
+As with the standard expectations, null values are not checked (that is what the null rule is for). The data is
+read twice when the sketch is not conclusive: pass an Arrow table, or a function returning the batches anew.
+
+"""
+
+import math
+import os
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# 2^14 registers: the sketch is 16KB, whatever the number of rows
+PRECISION = 14
+# how many standard errors below the number of values the estimate must be for us to trust it
+Z_SCORE = 5.0
+# the peak memory of an exact check, as a multiple of the size of the values it checks (a hash table of strings
+# takes ~4.5 times their size)
+MEMORY_FACTOR = 5
+BATCH_SIZE = 1_000_000
+# the polynomial string hash works on at most this many bytes at once: its buffers take ~32 bytes per byte, and
+# stay in the CPU caches
+STRING_SLICE_BYTES = 1 << 18
+
+
+class HyperLogLog:
+    """
+
+    The HyperLogLog cardinality sketch (Flajolet et al., 2007) over 64 bit hashes: the first PRECISION bits of a
+    hash pick a register, which keeps the longest run of leading zeros (plus one) seen in the remaining bits.
+
+    """
+
+    def __init__(self, precision: int = PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, hashes: np.ndarray) -> None:
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.intp)
+        # the position of the first 1 bit after the register bits (past the end if there is none)
+        bits = _bit_length(hashes << np.uint64(self.precision))
+        ranks = np.where(bits == 0, 65 - self.precision, 65 - bits)
+        np.maximum.at(self.registers, index, ranks.astype(np.uint8))
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        merged = HyperLogLog(self.precision)
+        merged.registers = np.maximum(self.registers, other.registers)
+        return merged
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = np.count_nonzero(self.registers == 0)
+        if raw <= 2.5 * m and zeros:
+            # linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return float(raw)
+
+
+def expect_column_all_unique_bounded(
+    data, # an Arrow table, or a function returning an iterable of RecordBatches (called once per pass)
+    column: str,
+    max_memory_mb: float = 256,
+    spill_dir: str = None,
+) -> bool:
+    """
+
+    True if the non null values of column are all distinct, as expect_column_all_unique, in at most about
+    max_memory_mb on top of the batches being read (see check_unique for the details of the decision).
+
+    """
+    return check_unique(data, column, max_memory_mb, spill_dir)['unique']
+
+
+def check_unique(
+    data,
+    column: str,
+    max_memory_mb: float = 256,
+    spill_dir: str = None,
+    batch_size: int = BATCH_SIZE,
+) -> dict:
+    """
+
+    Check that the non null values of column are all distinct, and return how we decided: a dict with unique,
+    method ('sketch', 'memory' or 'partitions'), the number of values and the distinct estimate of the sketch,
+    and the number of partitions spilled to spill_dir (a temporary directory by default).
+
+    """
+    if max_memory_mb <= 0:
+        raise ValueError(f"max_memory_mb must be positive, got {max_memory_mb}")
+    budget = max_memory_mb * 1024 ** 2
+
+    # 1. the sketch
+    sketch = HyperLogLog()
+    values, value_bytes = 0, 0
+    for array in _column_batches(data, column, batch_size):
+        sketch.update(hash_array(array))
+        values += len(array)
+        value_bytes += array.nbytes
+    estimate = sketch.estimate()
+    result = {'unique': True, 'method': 'sketch', 'values': values, 'estimate': round(estimate), 'partitions': 0}
+    # below 2.5 * registers the exact check is cheap anyway, and linear counting has a different error
+    if values > 2.5 * len(sketch.registers) and estimate < values * (1 - Z_SCORE * sketch.relative_error):
+        result['unique'] = False
+        return result
+
+    # 2. the exact check
+    if value_bytes * MEMORY_FACTOR <= budget:
+        result['method'] = 'memory'
+        arrays = list(_column_batches(data, column, batch_size))
+        result['unique'] = not arrays or not _has_duplicates(pa.chunked_array(arrays))
+        return result
+
+    partitions = math.ceil(value_bytes * MEMORY_FACTOR / budget)
+    result.update(method='partitions', partitions=partitions)
+    with tempfile.TemporaryDirectory(dir=spill_dir) as root:
+        paths = _spill_partitions(data, column, batch_size, partitions, root)
+        for path in paths:
+            if path is None:
+                continue
+            with pa.memory_map(path) as source:
+                partition = pa.ipc.open_stream(source).read_all().column(0)
+            duplicated = _has_duplicates(partition)
+            del partition
+            os.remove(path)
+            if duplicated:
+                result['unique'] = False
+                break
+
+    return result
+
+
+def hash_array(
+    array: pa.Array,
+) -> np.ndarray:
+    """
+
+    A 64 bit hash (as uint64) of each value of array, which must have no nulls: numbers and timestamps are
+    hashed from their bits, strings and binaries from their bytes, anything else from its Python value.
+
+    """
+    value_type = array.type
+    if pa.types.is_dictionary(value_type):
+        array, value_type = array.dictionary_decode(), value_type.value_type
+    if pa.types.is_floating(value_type):
+        # -0.0 == 0.0, so they must hash the same
+        bits = (array.to_numpy(zero_copy_only=False).astype(np.float64) + 0.0).view(np.uint64)
+        return _mix(bits)
+    if pa.types.is_integer(value_type) or pa.types.is_temporal(value_type) or pa.types.is_boolean(value_type):
+        if not pa.types.is_integer(value_type):
+            array = array.cast(pa.int64()) if not pa.types.is_boolean(value_type) else array.cast(pa.int8())
+        return _mix(array.to_numpy(zero_copy_only=False).astype(np.int64).view(np.uint64))
+    if pa.types.is_string(value_type) or pa.types.is_binary(value_type) \
+            or pa.types.is_large_string(value_type) or pa.types.is_large_binary(value_type):
+        return _hash_strings(array)
+
+    return _mix(np.array([hash(value) for value in array.to_pylist()], dtype=np.int64).view(np.uint64))
+
+
+def _column_batches(
+    data,
+    column: str,
+    batch_size: int,
+):
+    # the non null values of column, batch by batch
+    if isinstance(data, pa.Table):
+        batches = data.select([column]).to_batches(max_chunksize=batch_size)
+    else:
+        batches = data()
+    for batch in batches:
+        array = batch.column(column) if isinstance(batch, pa.RecordBatch) else batch
+        if pa.types.is_dictionary(array.type):
+            # each batch can have its own dictionary: we check (and spill) the values
+            array = array.dictionary_decode()
+        if array.null_count:
+            array = pc.drop_null(array)
+        if len(array):
+            yield array
+
+
+def _spill_partitions(
+    data,
+    column: str,
+    batch_size: int,
+    partitions: int,
+    root: str,
+) -> list:
+    # write each value to the partition of its hash, one IPC stream file per partition, and return their paths
+    # (None for the partitions no value went to)
+    paths, writers = [None] * partitions, [None] * partitions
+    try:
+        for array in _column_batches(data, column, batch_size):
+            # equal values have equal hashes, so they end up in the same partition
+            partition = (hash_array(array) % np.uint64(partitions)).astype(np.int64)
+            order = np.argsort(partition, kind='stable')
+            ends = np.cumsum(np.bincount(partition, minlength=partitions))
+            grouped = array.take(pa.array(order))
+            start = 0
+            for i, end in enumerate(ends):
+                if end > start:
+                    if writers[i] is None:
+                        paths[i] = os.path.join(root, f'partition-{i}.arrow')
+                        writers[i] = pa.ipc.new_stream(paths[i], pa.schema([(column, array.type)]))
+                    writers[i].write_batch(pa.record_batch([grouped.slice(start, end - start)], names=[column]))
+                start = end
+    finally:
+        for writer in writers:
+            if writer is not None:
+                writer.close()
+
+    return paths
+
+
+def _has_duplicates(
+    values: pa.ChunkedArray,
+) -> bool:
+    # exact: numbers and timestamps are sorted and compared to their neighbour, the rest counted with a hash table
+    value_type = values.type
+    if pa.types.is_temporal(value_type):
+        values, value_type = values.cast(pa.int64()), pa.int64()
+    if pa.types.is_integer(value_type) or pa.types.is_floating(value_type):
+        ordered = np.sort(values.to_numpy())
+        return bool(np.any(ordered[1:] == ordered[:-1]))
+
+    return pc.count_distinct(values, mode='only_valid').as_py() < len(values) - values.null_count
+
+
+def _hash_strings(
+    array: pa.Array,
+) -> np.ndarray:
+    # a polynomial hash of the bytes of each string, sum(byte_i * P^i) mod 2^64, for all the strings at once from
+    # prefix sums over the data buffer, a slice of at most STRING_SLICE_BYTES bytes at a time
+    offsets_type = np.int64 if pa.types.is_large_string(array.type) or pa.types.is_large_binary(array.type) else np.int32
+    offsets = np.frombuffer(array.buffers()[1], dtype=offsets_type)[array.offset:array.offset + len(array) + 1].astype(np.int64)
+    data = np.frombuffer(array.buffers()[2], dtype=np.uint8) if array.buffers()[2] is not None else np.zeros(0, np.uint8)
+    hashes = np.empty(len(array), dtype=np.uint64)
+    start = 0
+    while start < len(array):
+        # as many strings as fit in the slice (at least one)
+        end = max(int(np.searchsorted(offsets, offsets[start] + STRING_SLICE_BYTES, side='right')) - 1, start + 1)
+        end = min(end, len(array))
+        first, last = offsets[start], offsets[end]
+        weights, inverses = _powers(last - first)
+        with np.errstate(over='ignore'):
+            prefix = np.zeros(last - first + 1, dtype=np.uint64)
+            np.cumsum(data[first:last].astype(np.uint64) * weights, out=prefix[1:])
+            starts, ends = offsets[start:end] - first, offsets[start + 1:end + 1] - first
+            # shift each sum back to start at P^0, so that a string hashes the same wherever it is
+            polynomial = (prefix[ends] - prefix[starts]) * inverses[starts]
+            hashes[start:end] = polynomial + (ends - starts).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        start = end
+
+    return _mix(hashes)
+
+
+_PRIME = 0x100000001B3
+_POWERS = {'weights': np.ones(1, dtype=np.uint64), 'inverses': np.ones(1, dtype=np.uint64)}
+
+
+def _powers(
+    n: int,
+) -> tuple:
+    # P^i and P^-i mod 2^64 for i < n (P is odd, so it has an inverse), computed once and grown as needed
+    if len(_POWERS['weights']) < n:
+        size = max(n, STRING_SLICE_BYTES)
+        with np.errstate(over='ignore'):
+            for name, base in (('weights', _PRIME), ('inverses', pow(_PRIME, -1, 2 ** 64))):
+                powers = np.full(size, base, dtype=np.uint64)
+                powers[0] = 1
+                _POWERS[name] = np.cumprod(powers, dtype=np.uint64)
+
+    return _POWERS['weights'][:n], _POWERS['inverses'][:n]
+
+
+def _mix(
+    values: np.ndarray,
+) -> np.ndarray:
+    # the splitmix64 finalizer: spreads every input bit over the 64 bits of the hash
+    with np.errstate(over='ignore'):
+        z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return z ^ (z >> np.uint64(31))
+
+
+def _bit_length(
+    values: np.ndarray,
+) -> np.ndarray:
+    # the number of bits of each uint64 (0 for 0), exact: each 32 bit half is exactly representable as a float
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    high_bits = np.frexp(high)[1]
+    return np.where(high_bits > 0, high_bits + 32, np.frexp(low)[1])
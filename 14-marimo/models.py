@@ -13,12 +13,17 @@ def trips_and_zones(
         'taxi_zones',
         columns=['LocationID', 'Zone']
     ),
+    # 'eager' runs the Polars DataFrame functions, 'in-memory' or 'streaming' the lazy ones with that engine
+    polars_engine=bauplan.Parameter('polars_engine'),
 ):
     # import the necessary libraries
     import polars as pl
     # make sure to import the marimo function you want to use
-    from taxi_notebook import join_taxi_tables
+    from taxi_notebook import join_taxi_tables, join_taxi_tables_lazy
 
+    if polars_engine != 'eager':
+        # the streaming engine joins the trips in batches, instead of all at once
+        return join_taxi_tables_lazy(trips, zones).collect(engine=polars_engine).to_arrow()
     # re-use marimo function - it accepts polars DataFrames as input
     # note that this is zero-copy, so the conversion is free
     return join_taxi_tables(pl.from_arrow(trips), pl.from_arrow(zones)).to_arrow() # we return Arrow
@@ -27,12 +32,34 @@ def trips_and_zones(
 @bauplan.model(materialization_strategy='REPLACE')
 @bauplan.python('3.11', pip={'polars': '1.30.0', 'marimo': '0.13.14'})
 def stats_by_taxi_zones(
-    data=bauplan.Model('trips_and_zones')
+    data=bauplan.Model('trips_and_zones'),
+    # 'none' processes the whole year at once, 'day' or 'week' one time slice at a time
+    slice_by=bauplan.Parameter('slice_by'),
+    polars_engine=bauplan.Parameter('polars_engine'),
+    # 0.0 computes exact medians, e.g. 0.01 approximate ones within 1% of the true median in rank
+    median_rank_error=bauplan.Parameter('median_rank_error'),
 ):
     # import the necessary libraries
     import polars as pl
     # make sure to import the marimo function you want to use
-    from taxi_notebook import compute_stats_by_zone
+    from taxi_notebook import (
+        compute_stats_by_zone,
+        compute_stats_by_zone_approx,
+        compute_stats_by_zone_sliced,
+        to_lazy_frame,
+    )
+    if slice_by != 'none':
+        # clean the trips one slice at a time, to bound the memory used by the intermediate results
+        # (data itself is scanned for the whole window before the model runs: to bound the scan too, the
+        # notebook scans one slice at a time, see compute_stats_by_zone_scanned)
+        return compute_stats_by_zone_sliced(data, freq=slice_by, rank_error=median_rank_error).to_arrow()
+    if median_rank_error:
+        # approximate medians from a small sketch per zone, instead of sorting all the trips of each zone
+        return compute_stats_by_zone_approx(pl.from_arrow(data), rank_error=median_rank_error).to_arrow()
+    if polars_engine != 'eager':
+        # the same function over a LazyFrame: the filter, the log and the group by run as one optimized query,
+        # and only the Zone and trip_miles columns of the filtered rows are ever materialized
+        return compute_stats_by_zone(to_lazy_frame(data)).collect(engine=polars_engine).to_arrow()
     # re-use marimo function - it accepts a polars DataFrame as input
     # note that this is zero-copy, so the conversion is free
     return compute_stats_by_zone(pl.from_arrow(data)).to_arrow() # we return Arrow
@@ -0,0 +1,264 @@
+"""
+
+A KLL quantile sketch (Karnin, Lang, Liberty, "Optimal Quantile Approximation in Streams", 2016), to compute
+approximate medians per group without holding and sorting all the values of each group.
+
+A sketch keeps a few hundred values per group, whatever the number of rows, and two sketches can be merged:
+sketches built per day (or per time slice) combine into the sketch of the whole year without rescanning the
+trips, and can be stored as a table in between (see sketches_to_frame and sketches_from_frame).
+
+The error is on ranks: the median returned by a sketch is a value whose rank among all the values is within
+rank_error * n of n / 2 for about 95% of the sketches: perf/bench_median_sketch.py checks that at least 95% of
+the per zone medians are within the bound.
+
+"""
+
+import math
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# capacities shrink by this factor from the top level down, as in the KLL paper
+CAPACITY_DECAY = 2 / 3
+# empirical constant relating k and the rank error (for about 95% of the sketches) of this implementation,
+# see perf/bench_median_sketch.py
+RANK_ERROR_CONSTANT = 2.5
+# values added to level 0 at a time: each compaction sorts at most this many values, whatever the update
+UPDATE_SIZE = 1 << 16
+# rows of the DataFrame read at a time by sketches_by_group
+BATCH_SIZE = 1_000_000
+
+
+def k_for_rank_error(rank_error: float) -> int:
+    """
+
+    The size parameter k of a sketch whose rank error is about rank_error, e.g. 250 for 0.01.
+
+    """
+    if not 0.0 < rank_error < 1.0:
+        raise ValueError(f"rank_error must be between 0 and 1, got {rank_error}")
+
+    return max(8, math.ceil(RANK_ERROR_CONSTANT / rank_error))
+
+
+class KLLSketch:
+    """
+
+    A mergeable quantile sketch over float values: values are added to level 0, and when a level is full
+    it is sorted and every other value (starting at a random offset) moves up one level, where each value
+    stands for twice as many. The levels hold O(k log(n / k)) values in total.
+
+    """
+
+    def __init__(
+        self,
+        k: int = 200,
+        seed: int = None,
+    ):
+        self.k = k
+        self.levels = [np.empty(0, dtype=np.float64)]
+        self._rng = np.random.default_rng(seed)
+
+    @property
+    def n(self) -> int:
+        # the number of values summarized by the sketch
+        return sum(len(level) << h for h, level in enumerate(self.levels))
+
+    @property
+    def nbytes(self) -> int:
+        # the memory held by the retained values
+        return sum(level.nbytes for level in self.levels)
+
+    def update(
+        self,
+        values,
+    ) -> 'KLLSketch':
+        """
+
+        Add an array of values (NaNs are ignored) to the sketch, UPDATE_SIZE values at a time.
+
+        """
+        values = np.asarray(values, dtype=np.float64)
+        values = values[~np.isnan(values)]
+        for start in range(0, len(values), UPDATE_SIZE):
+            self.levels[0] = np.concatenate([self.levels[0], values[start:start + UPDATE_SIZE]])
+            self._compress()
+
+        return self
+
+    def merge(
+        self,
+        other: 'KLLSketch',
+    ) -> 'KLLSketch':
+        """
+
+        Add all the values summarized by another sketch to this one, in place.
+
+        """
+        if other.k != self.k:
+            raise ValueError(f"Cannot merge sketches with different k: {self.k} and {other.k}")
+        for h, level in enumerate(other.levels):
+            if h == len(self.levels):
+                self.levels.append(np.empty(0, dtype=np.float64))
+            self.levels[h] = np.concatenate([self.levels[h], level])
+        self._compress()
+
+        return self
+
+    def quantile(
+        self,
+        q: float,
+    ) -> float:
+        """
+
+        The approximate q-quantile of the values added so far (NaN for an empty sketch).
+
+        """
+        values, weights = self._weighted_values()
+        if len(values) == 0:
+            return math.nan
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        position = np.searchsorted(cumulative, q * cumulative[-1], side='left')
+
+        return float(values[order][min(position, len(values) - 1)])
+
+    def median(self) -> float:
+        return self.quantile(0.5)
+
+    def _weighted_values(self):
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 1 << h, dtype=np.int64) for h, level in enumerate(self.levels)])
+
+        return values, weights
+
+    def _capacity(
+        self,
+        h: int,
+    ) -> int:
+        depth = len(self.levels) - 1 - h
+        return max(2, math.ceil(self.k * CAPACITY_DECAY ** depth))
+
+    def _compress(self) -> None:
+        # compact the lowest level over capacity until all levels fit: one compaction of a large level
+        # (e.g. after a large update or a merge) is as accurate as many small ones
+        while True:
+            h = next((h for h, level in enumerate(self.levels) if len(level) > self._capacity(h)), None)
+            if h is None:
+                return
+            if h == len(self.levels) - 1:
+                self.levels.append(np.empty(0, dtype=np.float64))
+            level = np.sort(self.levels[h])
+            # with an odd number of values, the largest one stays at this level
+            even = len(level) - len(level) % 2
+            promoted = level[self._rng.integers(2):even:2]
+            self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+            self.levels[h] = level[even:]
+
+
+def sketches_by_group(
+    df,
+    group_column: str,
+    value_column: str,
+    k: int = 200,
+    batch_size: int = BATCH_SIZE,
+) -> dict:
+    """
+
+    Build one sketch of value_column per distinct value of group_column in a Polars DataFrame,
+    and return a dict from group key to sketch.
+
+    The frame is read batch_size rows at a time: the rows of each batch are ordered by the code of their
+    group (group_column dictionary encoded), and each sketch gets the values of its group in the batch.
+    Nothing is copied beyond a batch, and no sort runs over more than a batch.
+
+    """
+    sketches = {}
+    for batch in df.select([group_column, value_column]).iter_slices(n_rows=batch_size):
+        keys, codes = _group_codes(batch[group_column].to_arrow())
+        values = batch[value_column].to_numpy()
+        counts = np.bincount(codes, minlength=len(keys))
+        groups = np.split(values[np.argsort(codes, kind='stable')], np.cumsum(counts)[:-1])
+        for code in np.flatnonzero(counts):
+            if keys[code] not in sketches:
+                # no seed: sketches that will be merged (e.g. one per day) must not share their random choices
+                sketches[keys[code]] = KLLSketch(k)
+            sketches[keys[code]].update(groups[code])
+
+    return sketches
+
+
+def _group_codes(
+    array: pa.Array,
+) -> tuple:
+    # the distinct values of array (plus None, for the nulls) and the code of each row in them
+    if not pa.types.is_dictionary(array.type):
+        array = pc.dictionary_encode(array)
+    keys = array.dictionary.to_pylist() + [None]
+    codes = pc.fill_null(array.indices, len(keys) - 1).to_numpy(zero_copy_only=False).astype(np.int64)
+
+    return keys, codes
+
+
+def merge_sketches(
+    sketches_list: list,
+) -> dict:
+    """
+
+    Merge a list of {group key: sketch} dicts (e.g. one per day) into a single dict, without modifying them.
+
+    """
+    merged = {}
+    for sketches in sketches_list:
+        for key, sketch in sketches.items():
+            if key not in merged:
+                merged[key] = KLLSketch(sketch.k)
+            merged[key].merge(sketch)
+
+    return merged
+
+
+def sketches_to_frame(
+    sketches: dict,
+    group_column: str = 'Zone',
+):
+    """
+
+    Store a {group key: sketch} dict as a Polars DataFrame with one row per retained value:
+    the group key, k, the level and the value.
+
+    """
+    import polars as pl
+
+    rows = {group_column: [], 'k': [], 'level': [], 'value': []}
+    for key, sketch in sketches.items():
+        for h, level in enumerate(sketch.levels):
+            rows[group_column].extend([key] * len(level))
+            rows['k'].extend([sketch.k] * len(level))
+            rows['level'].extend([h] * len(level))
+            rows['value'].extend(level.tolist())
+
+    return pl.DataFrame(rows, schema={group_column: pl.Utf8, 'k': pl.Int32, 'level': pl.Int8, 'value': pl.Float64})
+
+
+def sketches_from_frame(
+    df,
+    group_column: str = 'Zone',
+) -> dict:
+    """
+
+    The inverse of sketches_to_frame.
+
+    """
+    sketches = {}
+    for (key, k), group in df.group_by([group_column, 'k']):
+        sketch = KLLSketch(k)
+        levels = group['level'].to_numpy()
+        values = group['value'].to_numpy()
+        sketch.levels = [values[levels == h].astype(np.float64) for h in range(int(levels.max()) + 1)]
+        sketches[key] = sketch
+
+    return sketches
+
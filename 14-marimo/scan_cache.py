@@ -0,0 +1,286 @@
+"""
+
+A local Parquet cache in front of bauplan.Client().scan, for notebooks that re-run the same scans all day.
+
+Entries are keyed by (table, commit hash of the ref, columns, filter, other arguments of scan, e.g. namespace
+or limit): the ref is resolved to the commit it points to, so that a scan of a branch that moved is never
+answered with stale data. A request is answered from disk when a cached entry of the same table and commit,
+with the same other arguments, has all the requested columns, the same filter apart from time ranges, and time
+ranges that contain the requested ones: the cached Parquet file is then read with pyarrow.dataset, selecting
+the columns and filtering the rows of the narrower time range. A scan with a limit is only answered by an
+entry with the same limit and time ranges: the first rows of a wider range are not those of a narrower one.
+
+Entries are evicted least recently used first, when the cache grows over max_bytes on disk.
+
+"""
+
+import hashlib
+import json
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+
+
+DEFAULT_CACHE_DIR = Path.home() / '.cache' / 'bauplan_scan_cache'
+INDEX_FILE = 'index.json'
+# a conjunct of a filter comparing a column with a timestamp literal, e.g. pickup_datetime >= '2022-12-21T00:00:00-05:00'
+TIME_COMPARISON = re.compile(r"^\s*(\w+)\s*(>=|>|<=|<)\s*'([^']+)'\s*$")
+AND_PATTERN = re.compile(r'\s+AND\s+', re.IGNORECASE)
+
+
+class ScanCache:
+    """
+
+    Wrap a bauplan client: ScanCache(client).scan(...) takes the same arguments as client.scan(...), and
+    returns the same Arrow table, from the local cache whenever it can.
+
+    """
+
+    def __init__(
+        self,
+        client,
+        cache_dir: Path = DEFAULT_CACHE_DIR,
+        max_bytes: int = 2 * 1024 ** 3,
+    ):
+        self.client = client
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        index_path = self.cache_dir / INDEX_FILE
+        self._entries = json.loads(index_path.read_text()) if index_path.exists() else {}
+
+    def scan(
+        self,
+        table: str,
+        ref: str = 'main',
+        columns: list = None,
+        filters: str = None,
+        **kwargs,
+    ):
+        """
+
+        Same as client.scan(table=table, ref=ref, columns=columns, filters=filters, **kwargs),
+        answered from the cache if a cached entry covers the request.
+
+        """
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+
+        commit = self.resolve_ref(ref)
+        ranges, rest = parse_filter(filters)
+        # as they are stored in the index, e.g. with tuples as lists
+        scan_kwargs = json.loads(json.dumps(kwargs, sort_keys=True, default=str))
+        for entry in self._entries.values():
+            if not (self.cache_dir / entry['file']).exists():
+                continue
+            row_filter = _covering_filter(entry, table, commit, columns, ranges, rest, scan_kwargs)
+            if row_filter is not False:
+                self.hits += 1
+                entry['last_used'] = time.time()
+                self._save_index()
+                dataset = ds.dataset(self.cache_dir / entry['file'])
+                return dataset.to_table(columns=columns, filter=row_filter)
+
+        self.misses += 1
+        result = self.client.scan(table=table, ref=ref, columns=columns, filters=filters, **kwargs)
+        key = _entry_key(table, commit, columns, filters, scan_kwargs)
+        path = self.cache_dir / f'{key}.parquet'
+        pq.write_table(result, path)
+        self._entries[key] = {
+            'table': table,
+            'commit': commit,
+            'columns': columns,
+            'filter': filters,
+            'kwargs': scan_kwargs,
+            'file': path.name,
+            'nbytes': path.stat().st_size,
+            'last_used': time.time(),
+        }
+        self._evict()
+        self._save_index()
+
+        return result
+
+    def resolve_ref(
+        self,
+        ref: str,
+    ) -> str:
+        """
+
+        The commit a ref points to: a ref with an explicit commit (e.g. 'main@<hash>') is already immutable,
+        a branch is resolved to its current head.
+
+        """
+        if '@' in ref:
+            return ref
+        return self.client.get_branch(ref).hash
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self._entries),
+            'nbytes': sum(entry['nbytes'] for entry in self._entries.values()),
+        }
+
+    def clear(self) -> None:
+        for entry in self._entries.values():
+            (self.cache_dir / entry['file']).unlink(missing_ok=True)
+        self._entries = {}
+        self._save_index()
+
+    def _evict(self) -> None:
+        # drop the least recently used entries until the cache fits in max_bytes
+        total = sum(entry['nbytes'] for entry in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k]['last_used']):
+            if total <= self.max_bytes:
+                break
+            entry = self._entries.pop(key)
+            (self.cache_dir / entry['file']).unlink(missing_ok=True)
+            total -= entry['nbytes']
+
+    def _save_index(self) -> None:
+        # write to a temporary file first, so that an interrupted write never leaves a broken index behind
+        index_path = self.cache_dir / INDEX_FILE
+        tmp_path = index_path.with_suffix('.tmp')
+        tmp_path.write_text(json.dumps(self._entries, indent=2))
+        tmp_path.replace(index_path)
+
+
+def parse_filter(
+    filters: str,
+):
+    """
+
+    Split a filter string into the time ranges it selects, as a dict from column to (lower, upper) bounds,
+    and the list of its other conjuncts. A bound is a (datetime, inclusive) tuple, or None if unbounded.
+    Filters with OR or parentheses are kept whole in the other conjuncts.
+
+    """
+    if not filters:
+        return {}, []
+    if re.search(r'\bOR\b|\(', filters, re.IGNORECASE):
+        return {}, [filters.strip()]
+
+    ranges, rest = {}, []
+    for conjunct in AND_PATTERN.split(filters.strip()):
+        match = TIME_COMPARISON.match(conjunct)
+        value = _parse_datetime(match.group(3)) if match else None
+        if value is None:
+            rest.append(' '.join(conjunct.split()))
+            continue
+        column, op = match.group(1), match.group(2)
+        lower, upper = ranges.get(column, (None, None))
+        if op in ('>=', '>'):
+            lower = _tighter(lower, (value, op == '>='), lower_bound=True)
+        else:
+            upper = _tighter(upper, (value, op == '<='), lower_bound=False)
+        ranges[column] = (lower, upper)
+
+    return ranges, sorted(rest)
+
+
+def _covering_filter(
+    entry: dict,
+    table: str,
+    commit: str,
+    columns: list,
+    ranges: dict,
+    rest: list,
+    scan_kwargs: dict,
+):
+    """
+
+    If the cached entry covers the request, return the Arrow dataset filter to apply to it (None if all its
+    rows are needed), otherwise return False.
+
+    """
+    import pyarrow.dataset as ds
+
+    if entry['table'] != table or entry['commit'] != commit or entry.get('kwargs', {}) != scan_kwargs:
+        return False
+    if entry['columns'] is not None and (columns is None or not set(columns) <= set(entry['columns'])):
+        return False
+    entry_ranges, entry_rest = parse_filter(entry['filter'])
+    if entry_rest != rest or not set(entry_ranges) <= set(ranges):
+        return False
+
+    row_filter = None
+    for column, (lower, upper) in ranges.items():
+        entry_lower, entry_upper = entry_ranges.get(column, (None, None))
+        if not _contains(entry_lower, lower, lower_bound=True) or not _contains(entry_upper, upper, lower_bound=False):
+            return False
+        if (lower, upper) == (entry_lower, entry_upper):
+            continue
+        # the first rows of the cached range are not the first rows of a narrower one
+        if 'limit' in scan_kwargs:
+            return False
+        # the requested range is narrower: filter the cached rows, which needs the column in the cached file
+        if entry['columns'] is not None and column not in entry['columns']:
+            return False
+        for bound, is_lower in ((lower, True), (upper, False)):
+            if bound is None:
+                continue
+            value, inclusive = bound
+            field = ds.field(column)
+            if is_lower:
+                condition = field >= value if inclusive else field > value
+            else:
+                condition = field <= value if inclusive else field < value
+            row_filter = condition if row_filter is None else row_filter & condition
+
+    return row_filter
+
+
+def _contains(
+    outer,
+    inner,
+    lower_bound: bool,
+) -> bool:
+    # True if the cached bound (outer) lets through everything the requested bound (inner) lets through
+    if outer is None:
+        return True
+    if inner is None:
+        return False
+    (outer_value, outer_inclusive), (inner_value, inner_inclusive) = outer, inner
+    try:
+        if outer_value == inner_value:
+            return outer_inclusive or not inner_inclusive
+        return outer_value < inner_value if lower_bound else outer_value > inner_value
+    except TypeError:
+        # naive and timezone aware datetimes do not compare
+        return False
+
+
+def _tighter(
+    current,
+    new,
+    lower_bound: bool,
+):
+    # the tighter of two bounds on the same column
+    if current is None:
+        return new
+    return current if _contains(new, current, lower_bound) else new
+
+
+def _parse_datetime(
+    value: str,
+):
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def _entry_key(
+    table: str,
+    commit: str,
+    columns: list,
+    filters: str,
+    scan_kwargs: dict,
+) -> str:
+    key = json.dumps([table, commit, columns, filters, scan_kwargs], sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
@@ -12,13 +12,16 @@ with app.setup:
 def _():
     # import bauplan SDK as usual
     import bauplan
+    # keep a local copy of the scans, so that re-running the notebook does not scan the lake again
+    from scan_cache import ScanCache
 
     bpln_client = bauplan.Client()
-    return (bpln_client,)
+    scan_cache = ScanCache(bpln_client)
+    return (scan_cache,)
 
 
 @app.cell
-def _(bpln_client):
+def _(scan_cache):
     # get data from the data lake by using Bauplan Python SDK
     branch = 'main' # since we are just reading now, we get the tables directly from main: the "prod" version of the tables
     taxi_trips = 'taxi_fhvhv'
@@ -27,8 +30,9 @@ def _(bpln_client):
     taxi_zones = 'taxi_zones'
     columns_taxi_zones = ['LocationID', 'Zone']
 
-    # get first table with the data from taxi trips
-    taxi_trips_df = pl.from_arrow(bpln_client.scan(
+    # get first table with the data from taxi trips: scan_cache.scan takes the same arguments as bpln_client.scan,
+    # and reads from disk when a previous scan of the same commit had these columns and a wider time range
+    taxi_trips_df = pl.from_arrow(scan_cache.scan(
         table=taxi_trips,
         ref=branch,
         columns=columns_taxi_trips,
@@ -36,11 +40,13 @@ def _(bpln_client):
     ))
 
     # get second table with data from nyc zones and neighborhoods
-    taxi_zones_df = pl.from_arrow(bpln_client.scan(
+    taxi_zones_df = pl.from_arrow(scan_cache.scan(
         table=taxi_zones,
         ref=branch,
         columns=columns_taxi_zones
     ))
+    # hits and misses of the cache since the notebook started
+    print(scan_cache.stats())
     return taxi_trips_df, taxi_zones_df
 
 
@@ -74,29 +80,132 @@ def _(parent_df):
 
 
 @app.function
-def compute_stats_by_zone(df: pl.DataFrame) -> pl.DataFrame:
+def valid_trips() -> pl.Expr:
     from datetime import datetime, timezone
     # clean up the dataset by excluding certain rows
     time_filter = datetime(2022, 1, 1, tzinfo=timezone.utc)
     # filter df by timestamp, exclude rows with trip_miles = 0 and trip_miles > 200
-    df = df.filter(
+    return (
         (pl.col("pickup_datetime") >= pl.lit(time_filter))
         & (pl.col("trip_miles") > 0.0)
         & (pl.col("trip_miles") < 200.0)
-    ).with_columns(
+    )
+
+
+@app.function
+def clean_trips_by_zone(df: pl.DataFrame) -> pl.DataFrame:
+    return log_trip_miles_by_zone(df.filter(valid_trips()))
+
+
+@app.function
+def log_trip_miles_by_zone(df: pl.DataFrame) -> pl.DataFrame:
+    df = df.with_columns(
         # create a new columns with log-transformed trip_miles to better model skewed distribution
         pl.col("trip_miles").log10().alias("log_trip_miles")
-    )    
-    result = (
+    )
+    # keep only the columns we need for the stats
+    return df.select(["Zone", "log_trip_miles"])
+
+
+@app.function
+def median_by_zone(df: pl.DataFrame) -> pl.DataFrame:
+    return (
         df
-        .select(["Zone", "log_trip_miles"])
         .group_by("Zone")
         .agg(
             pl.col("log_trip_miles").median().alias("log_trip_miles")
         )
     )
+
+
+@app.function
+def compute_stats_by_zone(df: pl.DataFrame) -> pl.DataFrame:
     # return a polars
-    return result
+    return median_by_zone(clean_trips_by_zone(df))
+
+
+@app.function
+def sketch_by_zone(df: pl.DataFrame, rank_error: float = 0.01) -> dict:
+    # one KLL sketch of log_trip_miles per Zone: a few hundred values per zone, whatever the number of trips
+    from quantile_sketch import k_for_rank_error, sketches_by_group
+    return sketches_by_group(df, "Zone", "log_trip_miles", k=k_for_rank_error(rank_error))
+
+
+@app.function
+def median_from_sketches(sketches: dict) -> pl.DataFrame:
+    # same schema as median_by_zone
+    return pl.DataFrame(
+        {
+            "Zone": list(sketches),
+            "log_trip_miles": [sketch.median() for sketch in sketches.values()],
+        },
+        schema={"Zone": pl.Utf8, "log_trip_miles": pl.Float64},
+    )
+
+
+@app.function
+def compute_stats_by_zone_approx(df: pl.DataFrame, rank_error: float = 0.01) -> pl.DataFrame:
+    # same as compute_stats_by_zone, with approximate medians: the rank of each median among the trips of
+    # its zone is within rank_error of the true median (e.g. 0.01 means between the 49th and 51st percentile)
+    return median_from_sketches(sketch_by_zone(clean_trips_by_zone(df), rank_error))
+
+
+@app.function
+def compute_stats_by_zone_sliced(table, freq: str = "day", rank_error: float = None) -> pl.DataFrame:
+    # same as compute_stats_by_zone, for an Arrow table covering a long time window:
+    # rows are cleaned one day (or week) at a time, so only the Zone and log_trip_miles columns
+    # of the whole window are ever held in memory, and the medians are computed on them at the end
+    from time_slices import sliced_apply
+    if rank_error:
+        # with approximate medians, each slice is summarized by its sketches,
+        # and the sketches of all the slices are merged: the cleaned slices are never concatenated
+        from quantile_sketch import merge_sketches
+        return sliced_apply(
+            table,
+            lambda trips: sketch_by_zone(clean_trips_by_zone(pl.from_arrow(trips)), rank_error),
+            merge=lambda partials: median_from_sketches(merge_sketches(partials)),
+            freq=freq,
+        )
+    return sliced_apply(
+        table,
+        lambda trips: clean_trips_by_zone(pl.from_arrow(trips)),
+        merge=lambda partials: median_by_zone(pl.concat(partials)),
+        freq=freq,
+    )
+
+
+@app.function
+def compute_stats_by_zone_scanned(
+    scan_trips, zones: pl.DataFrame, start, end, freq: str = "day", rank_error: float = None, max_workers: int = 4
+) -> pl.DataFrame:
+    # same as compute_stats_by_zone, for the trips of [start, end) scanned one day (or week) at a time with
+    # scan_trips(slice_start, slice_end), e.g. a bpln_client.scan with the filter of the slice: the trips of the
+    # whole window are never in memory, only the slices in flight and their cleaned rows (or their sketches)
+    from time_slices import sliced_scan
+
+    def clean(trips):
+        return clean_trips_by_zone(join_taxi_tables(pl.from_arrow(trips), zones))
+
+    if rank_error:
+        from quantile_sketch import merge_sketches
+        return sliced_scan(
+            scan_trips,
+            lambda trips: sketch_by_zone(clean(trips), rank_error),
+            merge=lambda partials: median_from_sketches(merge_sketches(partials)),
+            start=start,
+            end=end,
+            freq=freq,
+            max_workers=max_workers,
+        )
+    return sliced_scan(
+        scan_trips,
+        clean,
+        merge=lambda partials: median_by_zone(pl.concat(partials)),
+        start=start,
+        end=end,
+        freq=freq,
+        max_workers=max_workers,
+    )
 
 
 @app.cell
@@ -111,5 +220,68 @@ def _(child_df):
     return
 
 
+@app.function
+def to_lazy_frame(table) -> pl.LazyFrame:
+    # accept Arrow tables (e.g. from bauplan) as well as Polars DataFrames: both conversions are zero-copy
+    if isinstance(table, pl.LazyFrame):
+        return table
+    if isinstance(table, pl.DataFrame):
+        return table.lazy()
+    return pl.from_arrow(table).lazy()
+
+
+@app.function
+def join_taxi_tables_lazy(table_1, table_2) -> pl.LazyFrame:
+    # same as join_taxi_tables, but nothing runs until we call collect() on the result
+    # note that the functions above work on LazyFrames too: they only use methods shared by DataFrame and LazyFrame
+    return join_taxi_tables(to_lazy_frame(table_1), to_lazy_frame(table_2))
+
+
+@app.function
+def compute_stats_by_zone_lazy(trips, zones) -> pl.LazyFrame:
+    # join_taxi_tables + compute_stats_by_zone as a single query plan over the trips and zones tables
+    # the Polars optimizer does not push filters below a full join, so we do it here: the filter only looks at
+    # trip columns and drops the zones without trips, so filtering the trips and then doing a left join
+    # gives the same rows as filtering after the full join, without ever building the full join
+    trips_lf = to_lazy_frame(trips).filter(valid_trips())
+    joined_lf = trips_lf.join(to_lazy_frame(zones), left_on="PULocationID", right_on="LocationID", how="left")
+    return median_by_zone(log_trip_miles_by_zone(joined_lf))
+
+
+@app.cell
+def _(scan_cache, taxi_zones_df):
+    # the same stats as child_df, with the trips scanned one day at a time: each scan only has the filter of its
+    # day, so the memory needed stays the same on a window of a year (here, each day is answered by the cache)
+    from datetime import datetime as _datetime, timedelta as _timedelta, timezone as _timezone
+    from time_slices import slice_filter as _slice_filter
+
+    _eastern = _timezone(_timedelta(hours=-5))
+
+    def _scan_day(slice_start, slice_end):
+        return scan_cache.scan(
+            table='taxi_fhvhv',
+            ref='main',
+            columns=['pickup_datetime', 'PULocationID', 'trip_miles'],
+            filters=_slice_filter(slice_start, slice_end),
+        )
+
+    # one slice at a time: the scan cache is not thread safe
+    child_scanned_df = compute_stats_by_zone_scanned(
+        _scan_day, taxi_zones_df, _datetime(2022, 12, 21, tzinfo=_eastern), _datetime(2023, 1, 1, tzinfo=_eastern),
+        max_workers=1,
+    )
+    child_scanned_df.head()
+    return
+
+
+@app.cell
+def _(taxi_trips_df, taxi_zones_df):
+    # the same stats as child_df, from a single lazy query over the two scans
+    # engine="streaming" processes the trips in batches, instead of loading all of them at once
+    child_lazy_df = compute_stats_by_zone_lazy(taxi_trips_df, taxi_zones_df).collect(engine="streaming")
+    child_lazy_df.head()
+    return
+
+
 if __name__ == "__main__":
     app.run()
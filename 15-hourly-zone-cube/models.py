@@ -0,0 +1,137 @@
+"""
+
+This pipeline scans the taxi trips once, and aggregates them into an hourly zone cube: one row per pickup hour,
+pickup location and dropoff location, with counts, sums and sums of squares of trip_miles, base_passenger_fare,
+tips and waiting_time_minutes (see zone_cube.py).
+
+The per-zone tables of other examples are then computed from the cube, instead of scanning the trips again:
+- top_pickup_locations_from_cube, as top_pickup_locations in 02-data-visualization-app
+- zone_avg_waiting_times_from_cube, as zone_avg_waiting_times in 04-data-quality-expectations
+- stats_by_taxi_zones_from_cube, as stats_by_taxi_zones in 14-marimo, with the mean and the standard deviation
+  of log_trip_miles instead of its median (medians cannot be computed from the cube)
+
+"""
+
+import bauplan
+
+
+@bauplan.model(materialization_strategy='REPLACE')
+@bauplan.python('3.11', pip={'duckdb': '0.10.3'})
+def hourly_zone_cube(
+        trips=bauplan.Model(
+            'taxi_fhvhv',
+            columns=[
+                'pickup_datetime',
+                'request_datetime',
+                'on_scene_datetime',
+                'PULocationID',
+                'DOLocationID',
+                'trip_miles',
+                'base_passenger_fare',
+                'tips',
+            ],
+            # the union of the time windows of the models we serve
+            filter="pickup_datetime >= '2022-01-01T00:00:00-05:00' AND pickup_datetime < '2023-02-02T00:00:00-05:00'"
+        ),
+):
+    """
+
+    this function aggregates the trips into the hourly zone cube using DuckDB https://duckdb.org/docs/
+    the cube is materialized, so it is built once and read by all the models below
+
+    """
+
+    from zone_cube import build_zone_cube
+
+    cube = build_zone_cube(trips)
+    print(f"\n{trips.num_rows} trips aggregated into {cube.num_rows} cube rows\n")
+
+    return cube
+
+
+@bauplan.model(materialization_strategy='REPLACE')
+@bauplan.python('3.11', pip={'duckdb': '0.10.3'})
+def hourly_pickup_cube(
+        cube=bauplan.Model(
+            'hourly_zone_cube',
+        ),
+):
+    """
+
+    this function sums the hourly zone cube over the dropoff locations: one row per hour and pickup location,
+    which is all the models below need
+
+    """
+
+    from zone_cube import roll_up
+
+    return roll_up(cube, ['hour', 'PULocationID'])
+
+
+@bauplan.model(materialization_strategy='REPLACE')
+@bauplan.python('3.11', pip={'duckdb': '0.10.3'})
+def top_pickup_locations_from_cube(
+        cube=bauplan.Model(
+            'hourly_pickup_cube',
+            # the time window of top_pickup_locations in 02
+            filter="hour >= '2023-01-01T00:00:00-05:00' AND hour < '2023-02-02T00:00:00-05:00'"
+        ),
+        zones=bauplan.Model(
+            'taxi_zones',
+        ),
+):
+    """
+
+    the number of trips per pickup location, as top_pickup_locations in 02-data-visualization-app
+
+    """
+
+    from zone_cube import top_pickup_locations
+
+    return top_pickup_locations(cube, zones)
+
+
+@bauplan.model(materialization_strategy='REPLACE')
+@bauplan.python('3.11', pip={'duckdb': '0.10.3'})
+def zone_avg_waiting_times_from_cube(
+        cube=bauplan.Model(
+            'hourly_pickup_cube',
+            # the time window of normalized_taxi_trips in 04
+            filter="hour >= '2022-12-01T00:00:00-05:00' AND hour < '2023-01-01T00:00:00-05:00'"
+        ),
+        zones=bauplan.Model(
+            'taxi_zones',
+        ),
+):
+    """
+
+    the average waiting time per pickup zone, as zone_avg_waiting_times in 04-data-quality-expectations
+
+    """
+
+    from zone_cube import zone_avg_waiting_times
+
+    return zone_avg_waiting_times(cube, zones)
+
+
+@bauplan.model(materialization_strategy='REPLACE')
+@bauplan.python('3.11', pip={'duckdb': '0.10.3'})
+def stats_by_taxi_zones_from_cube(
+        cube=bauplan.Model(
+            'hourly_pickup_cube',
+            # the time window of trips_and_zones in 14
+            filter="hour >= '2022-01-01T00:00:00-05:00' AND hour < '2023-01-01T00:00:00-05:00'"
+        ),
+        zones=bauplan.Model(
+            'taxi_zones',
+        ),
+):
+    """
+
+    the mean and the standard deviation of log_trip_miles per zone, to compare with stats_by_taxi_zones in 14-marimo
+
+    """
+
+    from zone_cube import stats_by_taxi_zones
+
+    return stats_by_taxi_zones(cube, zones)
@@ -0,0 +1,170 @@
+"""
+
+The hourly zone cube: one row per (pickup hour, PULocationID, DOLocationID) with counts, sums and sums of
+squares of the trip measures. These aggregates are mergeable: the cube rows of any set of hours and zones add up
+to the same counts, sums and sums of squares as the trips they summarize, so counts, means and standard
+deviations over any time window (made of whole hours) and any group of zones come from the cube alone.
+
+Medians are not mergeable, so stats_by_taxi_zones (14) is served with the mean and the standard deviation of
+log_trip_miles instead of its median.
+
+The models serving 02, 04 and 14 only look at pickup locations, so they read a roll up of the cube over the
+dropoff locations (one row per hour and PULocationID), which is much smaller than the trips.
+
+The functions below are used by the models in models.py, and take and return Arrow tables.
+
+"""
+
+import duckdb
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# the measures summarized by the cube: for each of them we store <measure>_count (non null values),
+# <measure>_sum and <measure>_sum_sq
+MEASURES = ['trip_miles', 'base_passenger_fare', 'tips', 'waiting_time_minutes', 'log_trip_miles']
+# DuckDB sums integers into 128 bit integers: we keep these sums as 64 bit integers, exact for a year of minutes
+INTEGER_MEASURES = {'waiting_time_minutes'}
+
+
+def build_zone_cube(trips):
+    """
+
+    Aggregate the trips (an Arrow table with pickup_datetime, request_datetime, on_scene_datetime,
+    PULocationID, DOLocationID, trip_miles, base_passenger_fare and tips) into the hourly zone cube.
+
+    """
+    # the same definitions as the models we serve: waiting times as in taxi_trip_waiting_times (04),
+    # and log_trip_miles only for the trips kept by compute_stats_by_zone (14)
+    trips = trips.append_column('hour', pc.floor_temporal(trips['pickup_datetime'], unit='hour'))
+    trips = trips.append_column(
+        'waiting_time_minutes',
+        pc.minutes_between(trips['request_datetime'], trips['on_scene_datetime'])
+    )
+    valid_miles = pc.and_(pc.greater(trips['trip_miles'], 0.0), pc.less(trips['trip_miles'], 200.0))
+    trips = trips.append_column(
+        'log_trip_miles',
+        pc.if_else(valid_miles, pc.log10(pc.if_else(valid_miles, trips['trip_miles'], 1.0)), None)
+    )
+
+    aggregates = ',\n        '.join(
+        f'COUNT({m}) AS {m}_count, '
+        f'SUM({m}){cast} AS {m}_sum, '
+        f'SUM({m} * {m}){cast} AS {m}_sum_sq'
+        for m in MEASURES
+        for cast in ['::BIGINT' if m in INTEGER_MEASURES else '']
+    )
+    # DuckDB queries the Arrow table directly
+    sql_query = f"""
+    SELECT
+        hour,
+        PULocationID,
+        DOLocationID,
+        COUNT(*) AS trip_count,
+        {aggregates}
+    FROM trips
+    GROUP BY hour, PULocationID, DOLocationID
+    ORDER BY hour, PULocationID, DOLocationID
+    """
+
+    return duckdb.sql(sql_query).arrow()
+
+
+def roll_up(hourly_zone_cube, keys: list):
+    """
+
+    Sum the cube over the columns not in keys, e.g. keys=['hour', 'PULocationID'] sums over the dropoff
+    locations: the result has the same aggregate columns, and answers the same questions on those keys
+    from fewer rows.
+
+    """
+    aggregate_columns = [name for name in hourly_zone_cube.column_names if name.endswith(('_count', '_sum', '_sum_sq'))]
+    sums = ',\n        '.join(
+        f'SUM({name})' + ('::BIGINT' if pa.types.is_integer(hourly_zone_cube.schema.field(name).type) else '') + f' AS {name}'
+        for name in aggregate_columns
+    )
+    sql_query = f"""
+    SELECT
+        {', '.join(keys)},
+        {sums}
+    FROM hourly_zone_cube
+    GROUP BY {', '.join(keys)}
+    ORDER BY {', '.join(keys)}
+    """
+
+    return duckdb.sql(sql_query).arrow()
+
+
+def top_pickup_locations(hourly_zone_cube, zones):
+    """
+
+    Same output as top_pickup_locations (02): the number of trips per pickup location, with its Borough and Zone,
+    in descending order. The cube is joined with the zones as in the other models, and like the pandas group by
+    of the original model, trips without a known Borough and Zone are then left out.
+
+    """
+    sql_query = """
+    SELECT
+        cube.PULocationID,
+        zones.Borough,
+        zones.Zone,
+        SUM(cube.trip_count)::BIGINT AS number_of_trips
+    FROM hourly_zone_cube AS cube
+    LEFT JOIN zones ON cube.PULocationID = zones.LocationID
+    WHERE zones.Borough IS NOT NULL AND zones.Zone IS NOT NULL
+    GROUP BY cube.PULocationID, zones.Borough, zones.Zone
+    ORDER BY number_of_trips DESC
+    """
+
+    return duckdb.sql(sql_query).arrow()
+
+
+def zone_avg_waiting_times(hourly_zone_cube, zones):
+    """
+
+    Same output as zone_avg_waiting_times (04): the average waiting time per Borough and Zone, in descending order.
+
+    """
+    sql_query = """
+    SELECT
+        zones.Borough,
+        zones.Zone,
+        SUM(cube.waiting_time_minutes_sum) / NULLIF(SUM(cube.waiting_time_minutes_count), 0) AS avg_waiting_time
+    FROM hourly_zone_cube AS cube
+    LEFT JOIN zones ON cube.PULocationID = zones.LocationID
+    GROUP BY zones.Borough, zones.Zone
+    ORDER BY avg_waiting_time DESC
+    """
+
+    return duckdb.sql(sql_query).arrow()
+
+
+def stats_by_taxi_zones(hourly_zone_cube, zones):
+    """
+
+    The stats of stats_by_taxi_zones (14) that the cube can serve: the number of trips, the mean and the (sample)
+    standard deviation of log_trip_miles per Zone, over the trips with 0 < trip_miles < 200.
+
+    """
+    sql_query = """
+    WITH by_zone AS (
+        SELECT
+            zones.Zone,
+            SUM(cube.log_trip_miles_count)::BIGINT AS n,
+            SUM(cube.log_trip_miles_sum) AS s,
+            SUM(cube.log_trip_miles_sum_sq) AS ss
+        FROM hourly_zone_cube AS cube
+        LEFT JOIN zones ON cube.PULocationID = zones.LocationID
+        GROUP BY zones.Zone
+    )
+    SELECT
+        Zone,
+        n AS number_of_trips,
+        s / n AS mean_log_trip_miles,
+        -- the variance from the sums, clipped at 0 against rounding errors
+        SQRT(GREATEST(ss - s * s / n, 0) / NULLIF(n - 1, 0)) AS std_log_trip_miles
+    FROM by_zone
+    WHERE n > 0
+    """
+
+    return duckdb.sql(sql_query).arrow()
@@ -0,0 +1,217 @@
+"""
+
+Static (AST-based) view of a bauplan project folder: which functions are models or expectations, which
+tables they read through bauplan.Model(...) parameters, with which columns and filters, and how they are
+chained into a DAG. This is what the static analysis tools in this folder build on: nothing is imported
+or executed, so no bauplan installation is needed.
+
+"""
+
+import ast
+from dataclasses import dataclass, field
+from pathlib import Path
+
+
+@dataclass
+class ModelInput:
+    param: str  # the name of the function parameter
+    table: str  # the table or model read by bauplan.Model
+    columns: list  # the columns=[...] list, or None if all columns are read
+    filter: str  # the filter= string, or None
+    call: ast.Call  # the bauplan.Model(...) call node, to locate its arguments in the source
+
+
+@dataclass
+class ModelFunction:
+    name: str  # the name of the output table
+    path: Path
+    node: ast.FunctionDef
+    kind: str  # 'model' or 'expectation'
+    materialized: bool
+    inputs: list = field(default_factory=list)
+
+
+def find_projects(
+    root: Path
+) -> list:
+    """
+
+    Return all the bauplan project folders (i.e. folders with a bauplan_project.yml file) under root.
+
+    """
+    return sorted(p.parent for p in Path(root).rglob('bauplan_project.yml'))
+
+
+def parse_project(
+    project_dir: Path
+) -> dict:
+    """
+
+    Parse all the Python files at the top level of a project folder, and return a dict from
+    output table name to ModelFunction, for every function decorated with bauplan.model or bauplan.expectation.
+
+    """
+    models = {}
+    for path in sorted(Path(project_dir).glob('*.py')):
+        tree = ast.parse(path.read_text(), filename=str(path))
+        for node in tree.body:
+            if isinstance(node, ast.FunctionDef):
+                model = _parse_function(node, path)
+                if model is not None:
+                    models[model.name] = model
+
+    return models
+
+
+def children_of(
+    models: dict
+) -> dict:
+    """
+
+    Return a dict from model name to the list of functions (models or expectations) in the project reading it.
+
+    """
+    children = {name: [] for name in models}
+    for model in models.values():
+        for model_input in model.inputs:
+            if model_input.table in children:
+                children[model_input.table].append(model.name)
+
+    return children
+
+
+def literal_value(
+    node: ast.AST
+):
+    """
+
+    Return the Python value of a literal node (numbers, strings, booleans, negative numbers),
+    or raise ValueError if the node is not a literal.
+
+    """
+    value = ast.literal_eval(node)
+    if not isinstance(value, (int, float, str, bool)):
+        raise ValueError(f"Not a scalar literal: {ast.dump(node)}")
+
+    return value
+
+
+def is_bauplan_call(
+    node: ast.AST,
+    attribute: str,
+) -> bool:
+    """
+
+    True if node is a call to bauplan.<attribute>(...), e.g. bauplan.Model('taxi_fhvhv').
+
+    """
+    return (
+        isinstance(node, ast.Call)
+        and isinstance(node.func, ast.Attribute)
+        and node.func.attr == attribute
+        and isinstance(node.func.value, ast.Name)
+        and node.func.value.id == 'bauplan'
+    )
+
+
+def with_helpers(
+    function: ast.FunctionDef,
+    helpers: dict,
+) -> list:
+    """
+
+    Return the function together with the local helper functions it imports (from a file of the project
+    folder) and calls, and the helpers those call in turn: a helper imported but never called, e.g. in a
+    branch that was removed, does not count.
+
+    """
+    found = [function]
+    # the name each helper is imported as, e.g. 'from taxi_backends import add_waiting_times as add'
+    imported = {
+        alias.asname or alias.name: (node.module, alias.name)
+        for node in ast.walk(function) if isinstance(node, ast.ImportFrom) and node.module in helpers
+        for alias in node.names
+    }
+    called = {node.func.id for node in ast.walk(function) if isinstance(node, ast.Call) and isinstance(node.func, ast.Name)}
+    to_visit = [imported[name][1] for name in called if name in imported]
+    modules = {imported[name][1]: imported[name][0] for name in called if name in imported}
+    seen = set()
+    while to_visit:
+        name = to_visit.pop()
+        module = modules.get(name)
+        if name in seen or module is None or name not in helpers[module]:
+            continue
+        seen.add(name)
+        helper = helpers[module][name]
+        found.append(helper)
+        # functions of the same module called by the helper
+        for node in ast.walk(helper):
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in helpers[module]:
+                modules.setdefault(node.func.id, module)
+                to_visit.append(node.func.id)
+
+    return found
+
+
+def local_functions(
+    project_dir: Path
+) -> dict:
+    """
+
+    Return a dict from module name to {function name: FunctionDef} for the Python files of a project folder.
+
+    """
+    return {
+        path.stem: {
+            node.name: node
+            for node in ast.parse(path.read_text(), filename=str(path)).body
+            if isinstance(node, ast.FunctionDef)
+        }
+        for path in Path(project_dir).glob('*.py')
+    }
+
+
+def _parse_function(
+    node: ast.FunctionDef,
+    path: Path,
+):
+    decorator = next(
+        (d for d in node.decorator_list if is_bauplan_call(d, 'model') or is_bauplan_call(d, 'expectation')),
+        None
+    )
+    if decorator is None:
+        return None
+
+    keywords = {k.arg: k.value for k in decorator.keywords}
+    name = literal_value(keywords['name']) if 'name' in keywords else node.name
+    strategy = literal_value(keywords['materialization_strategy']) if 'materialization_strategy' in keywords else 'NONE'
+    model = ModelFunction(
+        name=name,
+        path=path,
+        node=node,
+        kind=decorator.func.attr,
+        materialized=strategy.upper() != 'NONE',
+    )
+    args = node.args.args
+    defaults = [None] * (len(args) - len(node.args.defaults)) + node.args.defaults
+    for arg, default in zip(args, defaults):
+        if is_bauplan_call(default, 'Model'):
+            model.inputs.append(_parse_model_input(arg.arg, default))
+
+    return model
+
+
+def _parse_model_input(
+    param: str,
+    call: ast.Call,
+) -> ModelInput:
+    keywords = {k.arg: k.value for k in call.keywords}
+    columns = keywords.get('columns')
+
+    return ModelInput(
+        param=param,
+        table=literal_value(call.args[0]),
+        columns=[literal_value(c) for c in columns.elts] if columns is not None else None,
+        filter=literal_value(keywords['filter']) if 'filter' in keywords else None,
+        call=call,
+    )
@@ -0,0 +1,201 @@
+"""
+
+Benchmark how train_regression_model (03) and tip_predictions get their model, with model_store='bauplan' or
+'artifacts' (see artifact_store.py):
+
+* train_sklearn / train_statistics: fit the linear regression on the training set, with trainer='sklearn' or
+  'sufficient_statistics', as every run does with model_store='bauplan'
+* rerun: fingerprint the training set and load the model saved by a previous run, as a rerun over unchanged
+  data does with model_store='artifacts'
+* pickle_load / artifact_load: load the model, unpickled (as load_obj does) or with its weights memory-mapped
+
+Each variant runs in its own process over the same synthetic training set (the store lives in a temporary
+folder), and we report wall time and the peak RSS and Arrow memory on top of the input data.
+
+Before timing anything, we check on a local store that a saved model loads back with the same predictions and
+memory-mapped weights, and on an in-memory pyarrow filesystem (standing for object storage) that it loads back
+without them, that the fingerprint does not depend on how the table is chunked (with strings, dictionaries and
+nulls) but changes with the data or the parameters, that versions and the latest pointer are kept as expected,
+that the test set of a cache hit is the one train_test_split gives, and that a root which does not outlive a
+run (none, or bauplan://) is an error.
+
+To run:
+
+python bench_artifact_store.py --rows 10000000 30000000
+
+"""
+
+import pickle
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+from bench_utils import REPO_ROOT, measure, run_isolated, print_table
+from bench_linear_regression import FEATURES, training_set
+
+
+PARAMETERS = {'split': 'hash', 'trainer': 'sufficient_statistics'}
+
+
+def _pipeline_module(name: str):
+    # imported under their own names, so that the stored class paths and the pickles resolve as in the pipeline
+    sys.path.insert(0, str(REPO_ROOT / '03-ml-regression-model' / 'pipeline'))
+    return __import__(name)
+
+
+def train_sklearn(data: pa.Table, root: str):
+    from sklearn.linear_model import LinearRegression
+
+    df = data.to_pandas()
+    return LinearRegression().fit(df[FEATURES], df['tips'])
+
+
+def train_statistics(data: pa.Table, root: str):
+    return _pipeline_module('linear_regression').fit_linear_regression(data, FEATURES, 'tips')
+
+
+def rerun(data: pa.Table, root: str):
+    artifact_store = _pipeline_module('artifact_store')
+    fingerprint = artifact_store.training_fingerprint(data, PARAMETERS)
+    return artifact_store.open_store(root).load_estimator('regression', fingerprint)
+
+
+def pickle_load(data: pa.Table, root: str):
+    return pickle.loads((Path(root) / 'regression.pkl').read_bytes())
+
+
+def artifact_load(data: pa.Table, root: str):
+    return _pipeline_module('artifact_store').open_store(root).load_estimator('regression')
+
+
+VARIANTS = {
+    'train_sklearn': train_sklearn,
+    'train_statistics': train_statistics,
+    'rerun': rerun,
+    'pickle_load': pickle_load,
+    'artifact_load': artifact_load,
+}
+
+
+def check_store(n_rows: int = 300_000) -> None:
+    artifact_store = _pipeline_module('artifact_store')
+    table = training_set(n_rows, batch_size=n_rows // 7)
+    df = table.to_pandas()
+    fingerprint = artifact_store.training_fingerprint(table, PARAMETERS)
+    # the same data, chunked differently or sliced from a larger table, has the same fingerprint
+    assert artifact_store.training_fingerprint(table.combine_chunks(), PARAMETERS) == fingerprint
+    padded = pa.concat_tables([table, table.slice(0, 10)]).slice(0, n_rows)
+    assert artifact_store.training_fingerprint(padded, PARAMETERS) == fingerprint
+    # and any change in the data or in the parameters gives another one
+    tips = table['tips'].to_numpy().copy()
+    tips[n_rows // 2] += 0.01
+    changed = table.set_column(table.schema.get_field_index('tips'), 'tips', pa.array(tips))
+    assert artifact_store.training_fingerprint(changed, PARAMETERS) != fingerprint
+    assert artifact_store.training_fingerprint(table, {**PARAMETERS, 'trainer': 'sklearn'}) != fingerprint
+    tips[::11] = np.nan
+    with_missing = table.set_column(table.schema.get_field_index('tips'), 'tips', pa.array(tips, from_pandas=True))
+    assert artifact_store.training_fingerprint(with_missing, PARAMETERS) != fingerprint
+    # strings, dictionaries and nulls hash the same whatever the chunks: the chunks of a column are one stream
+    zones = pa.array(['Bronx', None, 'Queens', 'EWR', ''] * (n_rows // 5))
+    with_strings = table.append_column('zone', zones).append_column('borough', zones.dictionary_encode())
+    with_strings = with_strings.set_column(0, with_strings.field(0), pa.array(tips, from_pandas=True))
+    chunked = pa.Table.from_batches(with_strings.to_batches(max_chunksize=n_rows // 3 + 1))
+    strings_fingerprint = artifact_store.training_fingerprint(with_strings, PARAMETERS)
+    assert artifact_store.training_fingerprint(chunked, PARAMETERS) == strings_fingerprint
+    assert artifact_store.training_fingerprint(with_strings.combine_chunks(), PARAMETERS) == strings_fingerprint
+    swapped = with_strings.set_column(with_strings.schema.get_field_index('zone'), 'zone',
+                                      pa.array(['Bronx', None, 'Queens', 'EW', 'R'] * (n_rows // 5)))
+    assert artifact_store.training_fingerprint(swapped, PARAMETERS) != strings_fingerprint
+
+    # a cache hit takes the test set from the Arrow table, by splitting the row numbers as train_test_split
+    # splits the pandas rows
+    from sklearn.model_selection import train_test_split
+    _, remaining = train_test_split(df, train_size=0.8, random_state=42)
+    _, test_set = train_test_split(remaining, test_size=0.1 / (1 - 0.8), random_state=42)
+    _, remaining_rows = train_test_split(np.arange(n_rows), train_size=0.8, random_state=42)
+    _, test_rows = train_test_split(remaining_rows, test_size=0.1 / (1 - 0.8), random_state=42)
+    assert table.take(test_rows).to_pandas().equals(test_set.reset_index(drop=True))
+
+    # without a local file to memory-map (as on object storage), the weights are read into memory
+    store = artifact_store.ArtifactStore(artifact_store.FileSystemBackend('mock:///artifacts'))
+    reg = train_statistics(table, None)
+    store.save_estimator('regression', fingerprint, reg)
+    loaded = store.load_estimator('regression')
+    assert not isinstance(loaded.coef_, np.memmap)
+    np.testing.assert_array_equal(loaded.predict(df[FEATURES]), reg.predict(df[FEATURES]))
+
+    # a store that does not outlive a run would never skip training: no root, or bauplan's store, is an error
+    for root in ('', 'bauplan://artifacts'):
+        try:
+            artifact_store.open_store(root)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f'expected a ValueError for artifact root {root!r}')
+
+    with tempfile.TemporaryDirectory() as root:
+        store = artifact_store.open_store(root)
+        assert store.load_estimator('regression', fingerprint) is None
+        assert store.load_estimator('regression') is None and store.versions('regression') == []
+        reg = train_statistics(table, root)
+        store.save_estimator('regression', fingerprint, reg)
+        loaded = store.load_estimator('regression', fingerprint)
+        assert isinstance(loaded.coef_, np.memmap)
+        np.testing.assert_array_equal(loaded.coef_, reg.coef_)
+        assert loaded.intercept_ == reg.intercept_ and loaded.rank_ == reg.rank_
+        assert list(loaded.feature_names_in_) == FEATURES
+        np.testing.assert_array_equal(loaded.predict(df[FEATURES]), reg.predict(df[FEATURES]))
+        # a scikit-learn fit round trips too, and becomes the latest version
+        other = artifact_store.training_fingerprint(table, {**PARAMETERS, 'trainer': 'sklearn'})
+        sklearn_reg = train_sklearn(table, root)
+        store.save_estimator('regression', other, sklearn_reg)
+        assert store.latest('regression') == other and store.versions('regression') == [fingerprint, other]
+        np.testing.assert_array_equal(store.load_estimator('regression').predict(df[FEATURES]),
+                                      sklearn_reg.predict(df[FEATURES]))
+        # a cache hit makes its version the latest again, without saving it
+        store.set_latest('regression', fingerprint)
+        assert store.latest('regression') == fingerprint and store.versions('regression') == [fingerprint, other]
+        # saving a version again replaces it
+        store.save_estimator('regression', other, sklearn_reg)
+        assert store.latest('regression') == other and len(store.versions('regression')) == 2
+        assert sorted(path.name for path in (Path(root) / 'regression').iterdir()) == sorted([fingerprint, other, 'LATEST', 'VERSIONS'])
+        # attributes that are neither arrays nor JSON are refused, rather than pickled
+        reg.unsupported_ = object()
+        try:
+            store.save_estimator('regression', 'unsupported', reg)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('expected a ValueError for an attribute that cannot be stored')
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    table = training_set(n_rows)
+    with tempfile.TemporaryDirectory() as root:
+        # a previous run, that trained and saved the model both ways
+        artifact_store = _pipeline_module('artifact_store')
+        reg = train_statistics(table, root)
+        artifact_store.open_store(root).save_estimator(
+            'regression', artifact_store.training_fingerprint(table, PARAMETERS), reg)
+        (Path(root) / 'regression.pkl').write_bytes(pickle.dumps(reg))
+        loaded, stats = measure(VARIANTS[variant], table, root)
+        assert loaded is not None and np.allclose(loaded.coef_, reg.coef_)
+
+    return {'variant': variant, 'rows': n_rows, **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000_000, 30_000_000])
+    args = parser.parse_args()
+
+    check_store()
+    print('artifact store check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
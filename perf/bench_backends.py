@@ -0,0 +1,259 @@
+"""
+
+Benchmark the pandas, Arrow, DuckDB and Polars implementations of the taxi transformations, from the
+taxi_backends.py of the project running each of them (01, 02 and 04), and from this file for 14:
+
+* normalize_trips: normalized_taxi_trips (01), filters and log10 of trip_miles
+* count_trips_by_zone: top_pickup_locations (02), trips per pickup location
+* add_waiting_times: taxi_trip_waiting_times (04), minutes between request and arrival of the cab
+* avg_waiting_time_by_zone: zone_avg_waiting_times (04), average waiting time per zone
+* median_log_trip_miles_by_zone: stats_by_taxi_zones (14), median of log_trip_miles per zone
+
+Every transformation runs with every backend in its own process, over the same synthetic trips joined with the
+zones (as the models receive them), and we report wall time and the peak RSS and Arrow memory on top of the input.
+
+Before timing anything, we check that the four backends return the same tables, up to row order for the
+aggregations (ties can come in any order) and float rounding.
+
+To run:
+
+python bench_backends.py --rows 1000000 10000000
+
+"""
+
+import sys
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from bench_utils import REPO_ROOT, load_example_module, measure, run_isolated, print_table
+from synthetic_taxi import make_taxi_trips, make_taxi_zones
+
+
+BACKENDS = ('pandas', 'arrow', 'duckdb', 'polars')
+# the filters of normalized_taxi_trips (01)
+FILTERS = [
+    ('pickup_datetime', '>=', datetime(2022, 1, 1, tzinfo=timezone.utc)),
+    ('trip_miles', '>', 0.0),
+    ('trip_miles', '<', 200.0),
+]
+# the columns identifying a row of each output, to compare aggregations regardless of their order
+KEYS = {
+    'normalize_trips': None,
+    'count_trips_by_zone': ['PULocationID'],
+    'add_waiting_times': None,
+    'avg_waiting_time_by_zone': ['Borough', 'Zone'],
+    'median_log_trip_miles_by_zone': ['Zone'],
+}
+# the taxi_backends.py shipping each transformation (the backends of 14 are further down)
+PROJECTS = {
+    'normalize_trips': '01-quick-start',
+    'count_trips_by_zone': '02-data-visualization-app/pipeline',
+    'add_waiting_times': '04-data-quality-expectations',
+    'avg_waiting_time_by_zone': '04-data-quality-expectations',
+}
+
+
+def _transformation(
+    function: str,
+):
+    if function == 'median_log_trip_miles_by_zone':
+        return median_log_trip_miles_by_zone
+    # the Arrow normalize_trips imports arrow_utils from its own folder, as it does inside a bauplan model
+    sys.path.insert(0, str(REPO_ROOT / '01-quick-start'))
+    project = PROJECTS[function]
+    # so do the taxi_backends of 02 and 04, when they are loaded: there, arrow_utils is the copy of their folder
+    previous = sys.modules.get('arrow_utils')
+    sys.modules['arrow_utils'] = load_example_module(f'{project}/arrow_utils.py', f'arrow_utils_{project[:2]}')
+    try:
+        taxi_backends = load_example_module(f'{project}/taxi_backends.py', f'taxi_backends_{project[:2]}')
+    finally:
+        if previous is None:
+            del sys.modules['arrow_utils']
+        else:
+            sys.modules['arrow_utils'] = previous
+
+    return getattr(taxi_backends, function)
+
+
+def median_log_trip_miles_by_zone(
+    table: pa.Table,
+    backend: str = 'polars',
+) -> pa.Table:
+    """
+
+    stats_by_taxi_zones (14), over a normalized table: the median of log_trip_miles per Zone. The model
+    computes it with Polars (taxi_notebook.py) and has no backend parameter, so the other implementations
+    live here, for the comparison only.
+
+    """
+    if backend not in MEDIAN_LOG_TRIP_MILES_BY_ZONE:
+        raise ValueError(f"Unknown backend {backend}, use one of {list(MEDIAN_LOG_TRIP_MILES_BY_ZONE)}")
+    return MEDIAN_LOG_TRIP_MILES_BY_ZONE[backend](table)
+
+
+def _median_log_trip_miles_by_zone_pandas(table):
+    df = (
+        table.select(['Zone', 'log_trip_miles']).to_pandas()
+        .astype({'Zone': 'object'})
+        .groupby('Zone', dropna=False)
+        .agg(log_trip_miles=('log_trip_miles', 'median'))
+        .reset_index()
+    )
+
+    return pa.Table.from_pandas(df, preserve_index=False)
+
+
+def _median_log_trip_miles_by_zone_arrow(table):
+    # Arrow has no exact median per group: we sort the values by zone code and value, and take the middle
+    # of each zone (the mean of the two middle values for an even count, as the other backends do)
+    zones = table['Zone'].combine_chunks()
+    if not pa.types.is_dictionary(zones.type):
+        zones = zones.dictionary_encode()
+    codes = pc.fill_null(zones.indices, -1).to_numpy(zero_copy_only=False)
+    values = table['log_trip_miles'].to_numpy()
+    # sort by value, then (stably, i.e. a radix sort on small integers) by zone code: faster than np.lexsort
+    order = np.argsort(values)
+    order = order[np.argsort(codes[order], kind='stable')]
+    keys, starts, counts = np.unique(codes[order], return_index=True, return_counts=True)
+    sorted_values = values[order]
+    medians = (sorted_values[starts + (counts - 1) // 2] + sorted_values[starts + counts // 2]) / 2
+    zone_names = pc.take(zones.dictionary, pa.array(keys, mask=keys < 0)).cast(pa.string())
+
+    return pa.table({'Zone': zone_names, 'log_trip_miles': medians})
+
+
+def _median_log_trip_miles_by_zone_duckdb(data):
+    import duckdb
+
+    return duckdb.sql("""
+    SELECT Zone::VARCHAR AS Zone, MEDIAN(log_trip_miles) AS log_trip_miles
+    FROM data
+    GROUP BY Zone
+    """).arrow()
+
+
+def _median_log_trip_miles_by_zone_polars(table):
+    import polars as pl
+
+    return (
+        pl.from_arrow(table.select(['Zone', 'log_trip_miles']))
+        .group_by('Zone')
+        .agg(pl.col('log_trip_miles').median())
+        .with_columns(pl.col('Zone').cast(pl.String))
+        .to_arrow()
+    )
+
+
+MEDIAN_LOG_TRIP_MILES_BY_ZONE = {
+    'pandas': _median_log_trip_miles_by_zone_pandas,
+    'arrow': _median_log_trip_miles_by_zone_arrow,
+    'duckdb': _median_log_trip_miles_by_zone_duckdb,
+    'polars': _median_log_trip_miles_by_zone_polars,
+}
+
+
+def _inputs(
+    function: str,
+    n_rows: int,
+    **kwargs,
+) -> tuple:
+    """
+
+    The table each transformation receives in its pipeline, and its extra arguments.
+
+    """
+    sys.path.insert(0, str(REPO_ROOT / '01-quick-start'))
+    from arrow_utils import join_trips_with_zones
+
+    trips = make_taxi_trips(n_rows, start='2022-12-15', **kwargs)
+    # some trips have no miles or too many, and some point to a zone that does not exist
+    miles = trips['trip_miles'].to_numpy().copy()
+    miles[::101] = 0.0
+    miles[::103] = 250.0
+    trips = trips.set_column(trips.schema.get_field_index('trip_miles'), 'trip_miles', pa.array(miles))
+    locations = pa.chunked_array([c.to_numpy() + 5 for c in trips['PULocationID'].chunks])
+    trips = trips.set_column(trips.schema.get_field_index('PULocationID'), 'PULocationID', locations)
+    # dictionary encoded zone attributes where the model receives them from a table kept in memory
+    dictionary_encode = function in ('count_trips_by_zone', 'add_waiting_times')
+    table = join_trips_with_zones(trips, make_taxi_zones(), 'PULocationID', 'LocationID', dictionary_encode=dictionary_encode)
+
+    if function == 'normalize_trips':
+        return table, FILTERS
+    if function == 'avg_waiting_time_by_zone':
+        return _transformation('add_waiting_times')(table, backend='arrow'),
+    if function == 'median_log_trip_miles_by_zone':
+        return _transformation('normalize_trips')(table, FILTERS, backend='arrow'),
+    return table,
+
+
+def _as_pandas(
+    table: pa.Table,
+    keys: list,
+) -> pd.DataFrame:
+    df = table.to_pandas()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            # categoricals turn nulls into NaN, plain strings into None
+            df[column] = df[column].astype('object').where(df[column].notna(), None)
+    if keys is None:
+        return df
+    return df.sort_values(keys, na_position='last').reset_index(drop=True)
+
+
+def check_equivalence(n_rows: int = 300_000) -> None:
+    for function, keys in KEYS.items():
+        transformation = _transformation(function)
+        args = _inputs(function, n_rows, batch_size=n_rows // 7)
+        outputs = {backend: _as_pandas(transformation(*args, backend=backend), keys) for backend in BACKENDS}
+        expected = outputs['arrow']
+        assert len(expected) > 0, function
+        for backend, actual in outputs.items():
+            assert list(actual.columns) == list(expected.columns), (function, backend, actual.columns)
+            pd.testing.assert_frame_equal(actual, expected, check_dtype=False, rtol=1e-9, obj=f'{function} {backend}')
+        if keys is not None and function != 'median_log_trip_miles_by_zone':
+            # the aggregations come sorted in descending order
+            for backend in BACKENDS:
+                values = transformation(*args, backend=backend).column(-1).to_numpy(zero_copy_only=False)
+                values = values[~pd.isna(values)].astype(float)
+                assert np.all(np.diff(values) <= 0), (function, backend)
+
+    # an unknown backend is an error
+    for function in KEYS:
+        try:
+            _transformation(function)(*_inputs(function, 1000), backend='spark')
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f'expected a ValueError for an unknown backend of {function}')
+
+
+def run_variant(
+    function: str,
+    backend: str,
+    n_rows: int,
+) -> dict:
+    args = _inputs(function, n_rows)
+    result, stats = measure(_transformation(function), *args, backend=backend)
+
+    return {'function': function, 'backend': backend, 'rows': n_rows, 'output_rows': result.num_rows, **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    parser.add_argument('--functions', nargs='+', default=list(KEYS), choices=list(KEYS))
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    print_table([
+        run_isolated(run_variant, function, backend, n_rows)
+        for function in args.functions
+        for n_rows in args.rows
+        for backend in BACKENDS
+    ])
@@ -0,0 +1,167 @@
+"""
+
+Benchmark the first three models of the regression pipeline (03) with dtypes='default' and dtypes='compact'
+(see compact_dtypes.py): clean_taxi_trips, training_dataset (pandas scaling) and train_regression_model
+(sklearn split and trainer), each stage reading the Arrow table the previous one returned, as in a bauplan run.
+
+Each mode runs in its own process over the same synthetic taxi_fhvhv scan, and we report, for every stage, the
+memory of its output (the sum of memory_report) and its wall time and peak RSS on top of its input.
+
+Before timing anything, we check that the compact pipeline keeps the same rows and trains a model with the same
+accuracy (R^2 on the validation and the test sets) and coefficients as the default one, that the narrower types
+reach train_regression_model, and that out of range IDs raise instead of wrapping around.
+
+To run:
+
+python bench_compact_dtypes.py --rows 5000000 15000000
+
+"""
+
+import contextlib
+import io
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from bench_utils import REPO_ROOT, measure, run_isolated, print_table
+from synthetic_taxi import make_taxi_trips
+
+
+FEATURES = ['log_trip_miles', 'base_passenger_fare', 'trip_time']
+# the columns clean_taxi_trips (03) scans
+SCAN_COLUMNS = [
+    'pickup_datetime', 'dropoff_datetime', 'PULocationID', 'DOLocationID', 'trip_miles',
+    'trip_time', 'base_passenger_fare', 'tolls', 'sales_tax', 'tips',
+]
+
+
+def _compact_dtypes():
+    sys.path.insert(0, str(REPO_ROOT / '03-ml-regression-model' / 'pipeline'))
+    import compact_dtypes
+
+    return compact_dtypes
+
+
+def taxi_scan(n_rows: int, **kwargs) -> pa.Table:
+    return make_taxi_trips(n_rows, realistic=True, **kwargs).select(SCAN_COLUMNS)
+
+
+def clean_taxi_trips(data: pa.Table, dtypes: str) -> pd.DataFrame:
+    # the body of clean_taxi_trips (03)
+    if dtypes == 'compact':
+        df = _compact_dtypes().compact_table(data).to_pandas(types_mapper=pd.ArrowDtype)
+    else:
+        df = data.to_pandas()
+    return df[(df['trip_miles'] > 1.0) & (df['tips'] > 0.0) & (df['base_passenger_fare'] > 1.0)]
+
+
+def training_dataset(data: pa.Table, dtypes: str) -> pd.DataFrame:
+    # the body of training_dataset (03) with scaling='pandas'
+    from sklearn.preprocessing import StandardScaler
+
+    df = data.to_pandas().dropna()
+    df['log_trip_miles'] = np.log10(df['trip_miles'])
+    features = df[FEATURES]
+    if dtypes == 'compact':
+        features = features.astype(np.float32)
+    scaled_df = pd.DataFrame(StandardScaler().fit_transform(features), columns=features.columns)
+    scaled_df['tips'] = df['tips'].values
+    scaled_df['pickup_datetime'] = df['pickup_datetime'].values
+
+    return scaled_df
+
+
+def train_regression_model(data: pa.Table, dtypes: str) -> tuple:
+    # the body of train_regression_model (03) with split='sklearn' and trainer='sklearn', returning the model
+    # with the test set, and the validation and test R^2
+    from sklearn.linear_model import LinearRegression
+    from sklearn.model_selection import train_test_split
+
+    df = data.to_pandas()
+    train_set, remaining_set = train_test_split(df, train_size=0.8, random_state=42)
+    validation_set, test_set = train_test_split(remaining_set, test_size=0.5, random_state=42)
+    reg = LinearRegression().fit(train_set[FEATURES], train_set['tips'])
+    scores = (reg.score(validation_set[FEATURES], validation_set['tips']),
+              reg.score(test_set[FEATURES], test_set['tips']))
+
+    return test_set, reg, scores
+
+
+STAGES = {
+    'clean_taxi_trips': clean_taxi_trips,
+    'training_dataset': training_dataset,
+    'train_regression_model': train_regression_model,
+}
+
+
+def run_pipeline(data: pa.Table, dtypes: str, timed: bool = False) -> tuple:
+    # each stage gets the Arrow table of the previous one; returns the rows of the report, the model and its scores
+    compact_dtypes = _compact_dtypes()
+    rows = []
+    for stage, fn in STAGES.items():
+        if timed:
+            output, stats = measure(fn, data, dtypes)
+        else:
+            output, stats = fn(data, dtypes), {}
+        if stage == 'train_regression_model':
+            output, reg, scores = output
+        with contextlib.redirect_stdout(io.StringIO()):
+            output_bytes = sum(compact_dtypes.memory_report(stage, output).values())
+        rows.append({'dtypes': dtypes, 'stage': stage, 'rows': len(output),
+                     'output_mb': round(output_bytes / 1024 ** 2, 1), **stats})
+        data = pa.Table.from_pandas(output, preserve_index=False)
+        del output
+
+    return rows, reg, scores, data
+
+
+def check_compact(n_rows: int = 500_000) -> None:
+    compact_dtypes = _compact_dtypes()
+    scan = taxi_scan(n_rows)
+    default_rows, default_reg, default_scores, _ = run_pipeline(scan, 'default')
+    compact_rows, compact_reg, compact_scores, test_set = run_pipeline(scan, 'compact')
+    # the same rows at every stage, in less memory
+    for default, compact in zip(default_rows, compact_rows):
+        assert default['rows'] == compact['rows'], (default, compact)
+        assert compact['output_mb'] < default['output_mb'], (default, compact)
+    # and a model with the same accuracy
+    assert np.allclose(compact_scores, default_scores, atol=1e-5), (compact_scores, default_scores)
+    np.testing.assert_allclose(compact_reg.coef_, default_reg.coef_, rtol=1e-4)
+    # the narrower types reach train_regression_model
+    assert test_set.schema.field('tips').type == pa.float32()
+    assert all(test_set.schema.field(name).type == pa.float32() for name in FEATURES)
+    compact_scan = compact_dtypes.compact_table(scan)
+    assert compact_scan.schema.field('PULocationID').type == pa.int16()
+    assert compact_scan['pickup_datetime'].chunks[0].buffers()[1].address == scan['pickup_datetime'].chunks[0].buffers()[1].address
+
+    too_large = scan.set_column(scan.schema.get_field_index('PULocationID'), 'PULocationID',
+                                pa.array(np.full(scan.num_rows, 40_000)))
+    try:
+        compact_dtypes.compact_table(too_large)
+    except pa.ArrowInvalid:
+        pass
+    else:
+        raise AssertionError('expected an error for location IDs out of the int16 range')
+
+
+def run_mode(
+    dtypes: str,
+    n_rows: int,
+) -> list:
+    scan = taxi_scan(n_rows)
+    rows, _, _, _ = run_pipeline(scan, dtypes, timed=True)
+
+    return rows
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[5_000_000, 15_000_000])
+    args = parser.parse_args()
+
+    check_compact()
+    print('compact dtypes check passed\n')
+    print_table([row for n_rows in args.rows for dtypes in ('default', 'compact') for row in run_isolated(run_mode, dtypes, n_rows)])
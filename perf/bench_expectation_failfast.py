@@ -0,0 +1,163 @@
+"""
+
+Benchmark the time to failure of the expectations of 04 when on_scene_datetime has a null, or trip_miles a
+negative value:
+
+* standard: one function per check, each over its whole column, as one @bauplan.expectation per check does
+* suite: expectation_suite.run_suite, all the checks in one pass over the batches, to the end
+* first_failure: expectation_suite.first_failure, which stops at the first batch with a failing row
+
+Each variant runs in its own process over the same synthetic trips, chunked like a scan, with one violation (--fail
+null or range) at row --fail-at (or none, for the time it takes to pass), and we report wall time and the
+peak RSS and Arrow memory on top of the input data.
+
+Before timing anything, we check that first_failure finds the first failing batch of the first failing check
+(and where it starts), that its sample is made of failing rows with their row numbers, that it returns None when
+run_suite passes, and that it refuses unique.
+
+To run:
+
+python bench_expectation_failfast.py --rows 10000000 20000000 --fail null range --fail-at 1000 5000000
+
+"""
+
+import sys
+from argparse import ArgumentParser
+
+import pyarrow as pa
+
+from bench_utils import REPO_ROOT, measure, run_isolated, print_table
+from bench_expectations import separate_failing_rows
+from synthetic_taxi import make_taxi_trips
+
+
+# on_scene_datetime and the range checks of the trips
+SUITE = [
+    {'check': 'no_nulls', 'column': 'on_scene_datetime'},
+    {'check': 'between', 'column': 'PULocationID', 'min': 1, 'max': 265},
+    {'check': 'between', 'column': 'pickup_datetime', 'min': '2022-12-01T00:00:00+00:00', 'max': '2023-01-01T00:00:00+00:00'},
+    {'check': 'between', 'column': 'trip_miles', 'min': 0},
+]
+
+
+def _expectation_suite():
+    sys.path.insert(0, str(REPO_ROOT / '04-data-quality-expectations'))
+    import expectation_suite
+
+    return expectation_suite
+
+
+def trips_with_violation(n_rows: int, fail: str = 'null', fail_at: int = None, **kwargs) -> pa.Table:
+    # the trips of a month, with a null on_scene_datetime (fail='null') or a negative trip_miles (fail='range') at
+    # row fail_at: only the chunk of that row is rebuilt
+    table = make_taxi_trips(n_rows, start='2022-12-01', days=31, **kwargs)
+    if fail_at is None:
+        return table
+    name, value = ('on_scene_datetime', None) if fail == 'null' else ('trip_miles', -1.0)
+    index = table.schema.get_field_index(name)
+    chunks, offset = list(table[name].chunks), 0
+    for i, chunk in enumerate(chunks):
+        if offset <= fail_at < offset + len(chunk):
+            values = chunk.to_pylist()
+            values[fail_at - offset] = value
+            chunks[i] = pa.array(values, type=chunk.type)
+            break
+        offset += len(chunk)
+    return table.set_column(index, table.schema.field(index), pa.chunked_array(chunks, type=table.schema.field(index).type))
+
+
+def standard(data: pa.Table, checks: list) -> bool:
+    return all(separate_failing_rows(data, check) == 0 for check in checks)
+
+
+def suite(data: pa.Table, checks: list) -> bool:
+    expectation_suite = _expectation_suite()
+    return expectation_suite.suite_passed(expectation_suite.run_suite(data, checks))
+
+
+def first_failure(data: pa.Table, checks: list) -> bool:
+    return _expectation_suite().first_failure(data, checks) is None
+
+
+VARIANTS = {
+    'standard': standard,
+    'suite': suite,
+    'first_failure': first_failure,
+}
+
+
+def check_first_failure(n_rows: int = 200_000) -> None:
+    expectation_suite = _expectation_suite()
+    batch_size = n_rows // 8
+    clean = trips_with_violation(n_rows, batch_size=batch_size)
+    assert expectation_suite.first_failure(clean, SUITE) is None
+    assert expectation_suite.suite_passed(expectation_suite.run_suite(clean, SUITE))
+
+    for null_at in (0, batch_size - 1, 3 * batch_size + 17, n_rows - 1):
+        table = trips_with_violation(n_rows, 'null', null_at, batch_size=batch_size)
+        failure = expectation_suite.first_failure(table, SUITE)
+        assert (failure['check'], failure['column']) == ('no_nulls', 'on_scene_datetime'), failure
+        assert failure['chunk'] == null_at // batch_size and failure['offset'] == failure['chunk'] * batch_size
+        assert failure['failing_rows'] == 1
+        assert [row['row'] for row in failure['sample']] == [null_at]
+        assert failure['sample'][0]['on_scene_datetime'] is None
+        assert failure['sample'][0]['trip_miles'] == table['trip_miles'][null_at].as_py()
+        for variant in VARIANTS:
+            assert VARIANTS[variant](table, SUITE) is False, variant
+
+    # a range check failing in an earlier batch than the null wins, with its failing rows (at most sample_size)
+    miles = table['trip_miles'].to_pylist()
+    for row in (5, 9, 11):
+        miles[batch_size + row] = -1.0
+    table = table.set_column(table.schema.get_field_index('trip_miles'), 'trip_miles', pa.chunked_array(
+        [pa.array(miles[i:i + batch_size], type=pa.float64()) for i in range(0, n_rows, batch_size)]))
+    failure = expectation_suite.first_failure(table, SUITE, sample_size=2)
+    assert (failure['column'], failure['chunk'], failure['failing_rows']) == ('trip_miles', 1, 3), failure
+    assert [row['row'] for row in failure['sample']] == [batch_size + 5, batch_size + 9]
+    assert all(row['trip_miles'] == -1.0 for row in failure['sample'])
+    table = trips_with_violation(n_rows, 'range', 2 * batch_size, batch_size=batch_size)
+    failure = expectation_suite.first_failure(table, SUITE)
+    assert (failure['column'], failure['offset'], failure['sample'][0]['row']) == ('trip_miles', 2 * batch_size, 2 * batch_size)
+
+    try:
+        expectation_suite.first_failure(clean, [{'check': 'unique', 'column': 'pickup_datetime'}])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('expected a ValueError for unique')
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+    fail: str,
+    fail_at: int,
+) -> dict:
+    table = trips_with_violation(n_rows, fail, fail_at)
+    passed, stats = measure(VARIANTS[variant], table, SUITE)
+
+    return {
+        'variant': variant,
+        'rows': n_rows,
+        'fail': fail if fail_at is not None else '-',
+        'fail_at': fail_at if fail_at is not None else '-',
+        'passed': passed,
+        **stats,
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000_000, 20_000_000])
+    parser.add_argument('--fail', nargs='+', choices=['null', 'range'], default=['null', 'range'])
+    parser.add_argument('--fail-at', type=int, nargs='+', default=[1_000])
+    args = parser.parse_args()
+
+    check_first_failure()
+    print('first failure check passed\n')
+    rows = []
+    for n_rows in args.rows:
+        runs = [(fail, fail_at) for fail in args.fail for fail_at in args.fail_at] + [(None, None)]
+        for fail, fail_at in runs:
+            rows += [run_isolated(run_variant, variant, n_rows, fail, fail_at) for variant in VARIANTS]
+    print_table(rows)
@@ -0,0 +1,151 @@
+"""
+
+Benchmark the null and range expectations of expectation_suite.py (04), with and without the statistics shortcut:
+
+* parquet_scan: read the columns of the checks from a month of daily Parquet files, and run_suite over them
+* parquet_statistics: run_suite_on_parquet, which answers from the footers of the files and reads nothing else
+* arrow_scan: run_suite over the batches of an Arrow table
+* arrow_statistics: run_suite with the null counts of arrow_statistics, the range checks still scanned
+
+Each variant runs in its own process over the same synthetic trips (Parquet files written once, with statistics,
+by synthetic_taxi.write_taxi_trips), and we report wall time and the peak RSS and Arrow memory.
+
+Before timing anything, we check that the statistics give the same answers as a scan, that a range crossed by
+some values fails without a scan (and without a count of failing rows), that a range no value is in fails with
+all the rows, and that the checks the statistics cannot decide (uniqueness, allowed values) are scanned.
+
+To run:
+
+python bench_expectation_statistics.py --rows 10000000 30000000
+
+"""
+
+import sys
+import tempfile
+from argparse import ArgumentParser
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from bench_utils import REPO_ROOT, measure, run_isolated, print_table
+from synthetic_taxi import write_taxi_trips
+
+
+# the null and range checks of the expectations of 04, over the columns of the trips
+SUITE = [
+    {'check': 'no_nulls', 'column': 'request_datetime'},
+    {'check': 'no_nulls', 'column': 'pickup_datetime'},
+    {'check': 'no_nulls', 'column': 'on_scene_datetime'},
+    {'check': 'between', 'column': 'pickup_datetime', 'min': '2022-12-01T00:00:00+00:00', 'max': '2023-01-01T00:00:00+00:00'},
+    {'check': 'between', 'column': 'PULocationID', 'min': 1, 'max': 265},
+    {'check': 'between', 'column': 'trip_miles', 'min': 0},
+]
+COLUMNS = list(dict.fromkeys(check['column'] for check in SUITE))
+
+
+def _expectation_suite():
+    sys.path.insert(0, str(REPO_ROOT / '04-data-quality-expectations'))
+    import expectation_suite
+
+    return expectation_suite
+
+
+def write_month(root: str, n_rows: int) -> list:
+    return write_taxi_trips(root, n_rows, start='2022-12-01', days=31, partition='day')
+
+
+def read_columns(paths: list) -> pa.Table:
+    return pa.concat_tables([pq.read_table(path, columns=COLUMNS) for path in paths])
+
+
+def parquet_scan(paths: list, checks: list) -> pa.Table:
+    return _expectation_suite().run_suite(read_columns(paths), checks)
+
+
+def parquet_statistics(paths: list, checks: list) -> pa.Table:
+    return _expectation_suite().run_suite_on_parquet(paths, checks)
+
+
+def arrow_scan(table: pa.Table, checks: list) -> pa.Table:
+    return _expectation_suite().run_suite(table, checks)
+
+
+def arrow_statistics(table: pa.Table, checks: list) -> pa.Table:
+    expectation_suite = _expectation_suite()
+    return expectation_suite.run_suite(table, checks, statistics=expectation_suite.arrow_statistics(table))
+
+
+VARIANTS = {
+    'parquet_scan': parquet_scan,
+    'parquet_statistics': parquet_statistics,
+    'arrow_scan': arrow_scan,
+    'arrow_statistics': arrow_statistics,
+}
+
+
+def check_statistics(n_rows: int = 300_000) -> None:
+    with tempfile.TemporaryDirectory() as root:
+        paths = write_month(root, n_rows)
+        table = read_columns(paths)
+        # without statistics, everything is scanned
+        scanned = arrow_scan(table, SUITE)
+        assert set(scanned['source'].to_pylist()) == {'scan'}
+        for variant in ('parquet_statistics', 'arrow_statistics'):
+            results = VARIANTS[variant](paths if variant.startswith('parquet') else table, SUITE)
+            for result, expected in zip(results.to_pylist(), scanned.to_pylist()):
+                assert result['passed'] == expected['passed'], (variant, result, expected)
+                if result['failing_rows'] is not None:
+                    assert result['failing_rows'] == expected['failing_rows'], (variant, result, expected)
+        # the footers decide every check of the suite, Arrow only the null checks
+        assert set(parquet_statistics(paths, SUITE)['source'].to_pylist()) == {'statistics'}
+        sources = arrow_statistics(table, SUITE)['source'].to_pylist()
+        assert sources == ['statistics' if check['check'] == 'no_nulls' else 'scan' for check in SUITE], sources
+
+        # a range crossed by some values fails from the statistics, without a count; one no value is in, with all
+        # the (non null) rows; and uniqueness needs a scan whatever the statistics
+        checks = [
+            {'check': 'between', 'column': 'PULocationID', 'min': 1, 'max': 200},
+            {'check': 'between', 'column': 'PULocationID', 'min': 300, 'max': 400},
+            {'check': 'unique', 'column': 'pickup_datetime'},
+        ]
+        results = parquet_statistics(paths, checks).to_pylist()
+        expected = arrow_scan(table, checks).to_pylist()
+        assert [row['passed'] for row in results] == [False, False, expected[2]['passed']]
+        assert results[0]['failing_rows'] is None and results[0]['source'] == 'statistics'
+        assert results[1]['failing_rows'] == expected[1]['failing_rows'] == n_rows
+        assert results[2]['source'] == 'scan' and results[2]['failing_rows'] == expected[2]['failing_rows']
+
+
+def run_variant(
+    variant: str,
+    root: str,
+    n_rows: int,
+) -> dict:
+    paths = sorted(str(path) for path in Path(root).rglob('*.parquet'))
+    data = paths if variant.startswith('parquet') else read_columns(paths)
+    results, stats = measure(VARIANTS[variant], data, SUITE)
+    sources = results['source'].to_pylist()
+
+    return {
+        'variant': variant,
+        'rows': n_rows,
+        'files': len(paths),
+        'from_statistics': f"{sources.count('statistics')}/{len(sources)}",
+        **stats,
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000_000, 30_000_000])
+    args = parser.parse_args()
+
+    check_statistics()
+    print('statistics check passed\n')
+    rows = []
+    for n_rows in args.rows:
+        with tempfile.TemporaryDirectory() as root:
+            write_month(root, n_rows)
+            rows += [run_isolated(run_variant, variant, root, n_rows) for variant in VARIANTS]
+    print_table(rows)
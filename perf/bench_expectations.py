@@ -0,0 +1,176 @@
+"""
+
+Benchmark the ways the expectations of 04 can check normalized_taxi_trips:
+
+* separate: one function per check, each scanning its whole column, as one @bauplan.expectation per check does
+* suite: expectation_suite.run_suite, all the checks in one pass over the RecordBatches
+
+Each variant runs in its own process over the same synthetic normalized_taxi_trips table (a month of trips joined
+with the zones, with dictionary encoded zone attributes), and we report wall time and the peak RSS and Arrow
+memory on top of the input data.
+
+Before timing anything, we check that both variants find the same number of failing rows for every check, on
+a table with nulls, out of range values, unknown boroughs and duplicates, and that a suite with an unknown check
+or column is refused before reading any data.
+
+To run:
+
+python bench_expectations.py --rows 5000000 10000000
+
+"""
+
+import sys
+from argparse import ArgumentParser
+from datetime import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from bench_utils import REPO_ROOT, measure, run_isolated, print_table
+from synthetic_taxi import BOROUGHS, make_taxi_trips, make_taxi_zones
+
+
+# one check of each kind, on the columns of normalized_taxi_trips (04), with the values of the synthetic zones
+SUITE = [
+    {'check': 'no_nulls', 'column': 'request_datetime'},
+    {'check': 'no_nulls', 'column': 'pickup_datetime'},
+    {'check': 'no_nulls', 'column': 'on_scene_datetime'},
+    {'check': 'between', 'column': 'pickup_datetime', 'min': '2022-12-01T00:00:00-05:00', 'max': '2023-01-01T00:00:00-05:00'},
+    {'check': 'between', 'column': 'PULocationID', 'min': 1, 'max': 265},
+    {'check': 'in_set', 'column': 'Borough', 'values': BOROUGHS},
+    {'check': 'match_regex', 'column': 'service_zone', 'pattern': '^(Yellow Zone|Boro Zone|Airports|EWR|N/A)$'},
+    {'check': 'unique', 'column': 'request_datetime'},
+]
+
+
+def _expectation_suite():
+    # expectation_suite and arrow_utils live next to the models of 04
+    sys.path.insert(0, str(REPO_ROOT / '04-data-quality-expectations'))
+    import expectation_suite
+
+    return expectation_suite
+
+
+def normalized_taxi_trips(n_rows: int, **kwargs) -> pa.Table:
+    _expectation_suite()
+    from arrow_utils import join_trips_with_zones
+
+    trips = make_taxi_trips(n_rows, start='2022-12-01', days=31, realistic=True, **kwargs)
+    columns = ['PULocationID', 'request_datetime', 'on_scene_datetime', 'pickup_datetime', 'dropoff_datetime']
+    return join_trips_with_zones(trips.select(columns), make_taxi_zones(), 'PULocationID', 'LocationID', dictionary_encode=True)
+
+
+def _bound(value, arrow_type):
+    return pa.scalar(datetime.fromisoformat(value) if isinstance(value, str) else value, type=arrow_type)
+
+
+def separate_failing_rows(data: pa.Table, check: dict) -> int:
+    # one check on its own, over its whole column (dictionary columns decoded, as a plain expectation would)
+    column = data[check['column']]
+    if pa.types.is_dictionary(column.type):
+        column = column.cast(column.type.value_type)
+    valid = len(column) - column.null_count
+    if check['check'] == 'no_nulls':
+        return pc.sum(pc.is_null(column)).as_py()
+    if check['check'] == 'unique':
+        return valid - pc.count_distinct(column).as_py()
+    if check['check'] == 'between':
+        masks = [pc.less(column, _bound(check['min'], column.type))] if check.get('min') is not None else []
+        if check.get('max') is not None:
+            masks.append(pc.greater(column, _bound(check['max'], column.type)))
+        return pc.sum(masks[0] if len(masks) == 1 else pc.or_(*masks)).as_py() or 0
+    if check['check'] == 'in_set':
+        return valid - (pc.sum(pc.is_in(column, value_set=pa.array(check['values']))).as_py() or 0)
+    if check['check'] == 'match_regex':
+        return valid - (pc.sum(pc.match_substring_regex(column, check['pattern'])).as_py() or 0)
+    raise ValueError(f"Unknown check {check['check']}")
+
+
+def separate(data: pa.Table, checks: list) -> list:
+    return [separate_failing_rows(data, check) for check in checks]
+
+
+def suite(data: pa.Table, checks: list) -> list:
+    return _expectation_suite().run_suite(data, checks)['failing_rows'].to_pylist()
+
+
+VARIANTS = {
+    'separate': separate,
+    'suite': suite,
+}
+
+
+def _with_violations(table: pa.Table) -> pa.Table:
+    # nulls, out of range IDs and timestamps, unknown boroughs and service zones, and duplicated timestamps
+    n_rows = table.num_rows
+
+    def replace(name, values):
+        return table.set_column(table.schema.get_field_index(name), name, values)
+
+    ids = table['PULocationID'].to_numpy().copy()
+    ids[::997] = 300
+    table = replace('PULocationID', pa.array(ids))
+    requests = table['request_datetime'].combine_chunks()
+    mask = np.zeros(n_rows, dtype=bool)
+    mask[::1009] = True
+    requests = pc.if_else(pa.array(mask), pa.scalar(None, requests.type), requests)
+    table = replace('request_datetime', requests)
+    pickups = table['pickup_datetime'].combine_chunks().cast(pa.int64()).to_numpy(zero_copy_only=False).copy()
+    pickups[::1013] = pickups[1::1013][: len(pickups[::1013])] + 86_400 * 10 ** 6 * 60
+    table = replace('pickup_datetime', pa.array(pickups).cast(table.schema.field('pickup_datetime').type))
+    boroughs = table['Borough'].combine_chunks().dictionary_decode().to_numpy(zero_copy_only=False).copy()
+    boroughs[::1019] = 'Atlantis'
+    table = replace('Borough', pa.array(boroughs).dictionary_encode())
+    service = table['service_zone'].combine_chunks().dictionary_decode().to_numpy(zero_copy_only=False).copy()
+    service[::1021] = 'yellow zone'
+    return replace('service_zone', pa.array(service))
+
+
+def check_equivalence(n_rows: int = 300_000) -> None:
+    expectation_suite = _expectation_suite()
+    clean = normalized_taxi_trips(n_rows, batch_size=n_rows // 7)
+    for table in (clean, _with_violations(clean)):
+        expected = separate(table, SUITE)
+        for max_chunksize in (None, 10_000):
+            results = expectation_suite.run_suite(table, SUITE, max_chunksize=max_chunksize)
+            assert results['failing_rows'].to_pylist() == expected, (results.to_pylist(), expected)
+            assert results['passed'].to_pylist() == [failing == 0 for failing in expected]
+            assert expectation_suite.suite_passed(results) == all(failing == 0 for failing in expected)
+    # on the clean table, the realistic nulls of on_scene_datetime fail the suite, the zones do not
+    failing = dict(zip([(c['check'], c['column']) for c in SUITE], separate(clean, SUITE)))
+    assert failing[('no_nulls', 'on_scene_datetime')] > 0
+    assert failing[('between', 'PULocationID')] == failing[('in_set', 'Borough')] == 0
+
+    # uniqueness of dictionary encoded columns, counted on their codes
+    dictionary_checks = [{'check': 'unique', 'column': 'Borough'}, {'check': 'unique', 'column': 'Zone'}]
+    results = expectation_suite.run_suite(clean, dictionary_checks, max_chunksize=10_000)
+    assert results['failing_rows'].to_pylist() == separate(clean, dictionary_checks)
+
+    for bad in ({'check': 'no_typos', 'column': 'Zone'}, {'check': 'no_nulls', 'column': 'zone'}):
+        try:
+            expectation_suite.run_suite(clean, [bad])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f'expected a ValueError for {bad}')
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    table = normalized_taxi_trips(n_rows)
+    failing, stats = measure(VARIANTS[variant], table, SUITE)
+
+    return {'variant': variant, 'rows': n_rows, 'checks': len(SUITE), 'failing_checks': sum(f > 0 for f in failing), **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[5_000_000, 10_000_000])
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
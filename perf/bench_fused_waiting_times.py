@@ -0,0 +1,160 @@
+"""
+
+Benchmark the two ways 04 computes the average waiting time per zone from normalized_taxi_trips:
+
+* chain: taxi_trip_waiting_times appends waiting_time_minutes to every trip, and zone_avg_waiting_times runs
+  its DuckDB AVG over the whole table
+* chain_parquet: the same, with the row level table written to Parquet and read back in between, as bauplan
+  materializes it between the two models
+* fused: zone_avg_waiting_times with waiting_times='fused', i.e. fused_waiting_times.fused_avg_waiting_times,
+  the minutes and the per zone sums and counts in one streaming pass
+
+Each variant runs in its own process over the same synthetic normalized_taxi_trips table (a month of trips with
+realistic null on_scene_datetime, joined with dictionary encoded zones), and we report wall time and the peak RSS
+and Arrow memory on top of the input data.
+
+Before timing anything, we check that the fused averages are those of the chain (up to the order of ties and
+float rounding), with dictionary encoded or plain zone columns, trips with no zone and zones with no waiting
+time, and that taxi_trip_waiting_times materializes plain string zone columns.
+
+To run:
+
+python bench_fused_waiting_times.py --rows 5000000 10000000
+
+"""
+
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+import duckdb
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from bench_utils import REPO_ROOT, measure, run_isolated, print_table
+from bench_expectations import normalized_taxi_trips
+from synthetic_taxi import make_taxi_trips, make_taxi_zones
+
+
+# the query of zone_avg_waiting_times (04)
+SQL_QUERY = """
+SELECT
+    Borough,
+    Zone,
+    AVG(waiting_time_minutes) AS avg_waiting_time
+FROM taxi_trip_waiting_times
+GROUP BY Borough, Zone
+ORDER BY avg_waiting_time DESC;
+"""
+# the columns of the trips normalized_taxi_trips (04) scans
+COLUMNS = ['PULocationID', 'request_datetime', 'on_scene_datetime', 'pickup_datetime', 'dropoff_datetime']
+
+
+def _fused_waiting_times():
+    # fused_waiting_times and arrow_utils live next to the models of 04
+    sys.path.insert(0, str(REPO_ROOT / '04-data-quality-expectations'))
+    import fused_waiting_times
+
+    return fused_waiting_times
+
+
+def taxi_trip_waiting_times(data: pa.Table) -> pa.Table:
+    # the body of taxi_trip_waiting_times (04) with backend='default'
+    _fused_waiting_times()
+    from arrow_utils import decode_dictionaries
+
+    data = data.append_column('waiting_time_minutes', pc.minutes_between(data['request_datetime'], data['on_scene_datetime']))
+    return decode_dictionaries(data)
+
+
+def zone_avg_waiting_times(taxi_trip_waiting_times: pa.Table) -> pa.Table:
+    # the body of zone_avg_waiting_times (04) with backend='default'
+    return duckdb.sql(SQL_QUERY).arrow()
+
+
+def chain(data: pa.Table) -> pa.Table:
+    return zone_avg_waiting_times(taxi_trip_waiting_times(data))
+
+
+def chain_parquet(data: pa.Table) -> pa.Table:
+    with tempfile.TemporaryDirectory() as root:
+        path = f'{root}/taxi_trip_waiting_times.parquet'
+        pq.write_table(taxi_trip_waiting_times(data), path)
+        return zone_avg_waiting_times(pq.read_table(path))
+
+
+def fused(data: pa.Table) -> pa.Table:
+    # the body of zone_avg_waiting_times (04) with waiting_times='fused'
+    return _fused_waiting_times().fused_avg_waiting_times(data)
+
+
+VARIANTS = {
+    'chain': chain,
+    'chain_parquet': chain_parquet,
+    'fused': fused,
+}
+
+
+def _by_zone(table: pa.Table) -> dict:
+    return {(row['Borough'], row['Zone']): row['avg_waiting_time'] for row in table.to_pylist()}
+
+
+def _assert_same_averages(result: pa.Table, expected: pa.Table) -> None:
+    assert result.schema.names == expected.schema.names, result.schema
+    assert result.num_rows == expected.num_rows, (result.num_rows, expected.num_rows)
+    result_by_zone, expected_by_zone = _by_zone(result), _by_zone(expected)
+    assert result_by_zone.keys() == expected_by_zone.keys()
+    for key, value in expected_by_zone.items():
+        assert (value is None and result_by_zone[key] is None) or np.isclose(result_by_zone[key], value, rtol=1e-12), key
+    # in descending order, null averages last
+    averages = [value for value in result['avg_waiting_time'].to_pylist() if value is not None]
+    assert averages == sorted(averages, reverse=True)
+    assert result['avg_waiting_time'].to_pylist()[len(averages):] == [None] * (result.num_rows - len(averages))
+
+
+def check_fused(n_rows: int = 300_000) -> None:
+    fused_waiting_times = _fused_waiting_times()
+    from arrow_utils import join_trips_with_zones
+
+    # trips with no zone (an unknown location ID), and a zone where no cab ever showed up
+    trips = make_taxi_trips(n_rows, start='2022-12-01', days=31, realistic=True, batch_size=n_rows // 7).select(COLUMNS)
+    ids = trips['PULocationID'].to_numpy().copy()
+    ids[::101] = 999
+    trips = trips.set_column(0, 'PULocationID', pa.array(ids))
+    on_scene = trips['on_scene_datetime'].combine_chunks()
+    no_cab = pc.equal(trips['PULocationID'], 9).combine_chunks()
+    trips = trips.set_column(2, 'on_scene_datetime', pc.if_else(no_cab, pa.scalar(None, on_scene.type), on_scene))
+    zones = make_taxi_zones()
+    for dictionary_encode in (True, False):
+        table = join_trips_with_zones(trips, zones, 'PULocationID', 'LocationID', max_chunksize=n_rows // 5,
+                                      dictionary_encode=dictionary_encode)
+        expected = chain(table)
+        assert expected['Borough'].null_count == 1 and expected['avg_waiting_time'].null_count == 1
+        for max_chunksize in (None, 10_000):
+            _assert_same_averages(fused_waiting_times.fused_avg_waiting_times(table, max_chunksize=max_chunksize), expected)
+        _assert_same_averages(chain_parquet(table), expected)
+        # the materialized table has plain string zone attributes, whatever the join returned
+        rows = taxi_trip_waiting_times(table)
+        assert not any(pa.types.is_dictionary(field.type) for field in rows.schema), rows.schema
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    data = normalized_taxi_trips(n_rows)
+    averages, stats = measure(VARIANTS[variant], data)
+
+    return {'variant': variant, 'rows': n_rows, 'zones': averages.num_rows, **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[5_000_000, 10_000_000])
+    args = parser.parse_args()
+
+    check_fused()
+    print('fused check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
@@ -0,0 +1,139 @@
+"""
+
+Benchmark the ways tip_predictions (03) can score the test set:
+
+* pandas: the test set converted to pandas, predicted in one call, and copied into prediction_df (inference='pandas')
+* batches: batch_inference.predict_batches, one RecordBatch at a time in this process
+* batches_pool: the same, over a pool of --workers processes (inference='batches' uses one per core)
+
+Each variant runs in its own process over the same synthetic test set, at each of the --batch-sizes, and we report
+rows/sec, wall time and the peak RSS and Arrow memory on top of the input data.
+
+Before timing anything, we check that the batched predictions and R^2 match the pandas ones, in and out of the
+process pool, that the predictions are float32 and that the other columns of the batches are not copied.
+
+To run:
+
+python bench_inference.py --rows 10000000 30000000 --batch-sizes 50000 250000 1000000
+
+"""
+
+import multiprocessing
+import os
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+import pyarrow as pa
+
+from bench_utils import REPO_ROOT, measure, run_isolated, print_table
+from bench_linear_regression import FEATURES, training_set
+
+
+def _batch_inference():
+    # imported under its own name, as in tip_predictions, so that the process pool can pickle its functions
+    sys.path.insert(0, str(REPO_ROOT / '03-ml-regression-model' / 'pipeline'))
+    import batch_inference
+
+    return batch_inference
+
+
+def fitted_model(n_rows: int = 200_000):
+    from sklearn.linear_model import LinearRegression
+
+    df = training_set(n_rows, batch_size=n_rows).to_pandas()
+    return LinearRegression().fit(df[FEATURES], df['tips'])
+
+
+def pandas_predict(data: pa.Table, reg, batch_size: int, workers: int):
+    # the body of tip_predictions (03) with inference='pandas'
+    test_set = data.to_pandas()
+    X_test = test_set[FEATURES]
+    y_hat = reg.predict(X_test)
+    r2 = reg.score(X_test, test_set['tips'])
+    prediction_df = test_set[[*FEATURES, 'tips']]
+    prediction_df['predictions'] = y_hat
+
+    return prediction_df, r2
+
+
+def batches_predict(data: pa.Table, reg, batch_size: int, workers: int):
+    return _batch_inference().predict_batches(data, reg, batch_size=batch_size, max_workers=1)
+
+
+def batches_pool_predict(data: pa.Table, reg, batch_size: int, workers: int):
+    return _batch_inference().predict_batches(data, reg, batch_size=batch_size, max_workers=workers)
+
+
+VARIANTS = {
+    'pandas': pandas_predict,
+    'batches': batches_predict,
+    'batches_pool': batches_pool_predict,
+}
+
+
+def check_equivalence(n_rows: int = 300_000) -> None:
+    batch_inference = _batch_inference()
+    reg = fitted_model()
+    table = training_set(n_rows, batch_size=n_rows // 3)
+    expected, expected_r2 = pandas_predict(table, reg, 0, 1)
+    for variant in ('batches', 'batches_pool'):
+        for batch_size in (n_rows // 7, n_rows):
+            predictions, r2 = VARIANTS[variant](table, reg, batch_size, 3)
+            assert predictions.num_rows == n_rows, variant
+            assert predictions.schema.names == [*FEATURES, 'tips', 'predictions']
+            assert predictions.schema.field('predictions').type == pa.float32()
+            np.testing.assert_allclose(predictions['predictions'].to_numpy(), expected['predictions'], rtol=1e-6)
+            assert predictions['tips'].equals(table['tips'])
+            assert np.isclose(r2, expected_r2, rtol=1e-9), (variant, r2, expected_r2)
+
+    # in this process, the output batches share the buffers of the input: only the predictions are new
+    batch = table.to_batches()[0]
+    scored, _ = batch_inference.predict_batch(batch, reg)
+    for name in [*FEATURES, 'tips']:
+        assert scored.column(name).buffers()[1].address == batch.column(name).buffers()[1].address
+    # the score accumulator merges into the R^2 of the whole set, however the rows are batched
+    y, y_hat = expected['tips'].to_numpy(), expected['predictions'].to_numpy()
+    merged = batch_inference.ScoreAccumulator()
+    for part in np.array_split(np.arange(n_rows), 11):
+        merged = merged.merge(batch_inference.ScoreAccumulator.from_arrays(y[part], y_hat[part]))
+    assert np.isclose(merged.r2, expected_r2, rtol=1e-12)
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+    batch_size: int,
+    workers: int,
+) -> dict:
+    # run_isolated starts this process with spawn, which its children would inherit: the pipeline runs on Linux,
+    # where the process pool forks its workers (spawn would re-import pandas and scikit-learn in each of them)
+    multiprocessing.set_start_method('fork', force=True)
+    reg = fitted_model()
+    table = training_set(n_rows)
+    (predictions, r2), stats = measure(VARIANTS[variant], table, reg, batch_size, workers)
+
+    return {
+        'variant': variant,
+        'rows': n_rows,
+        'batch_size': batch_size if variant != 'pandas' else '-',
+        'rows_per_s': int(n_rows / stats['wall_s']),
+        **stats,
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000_000, 30_000_000])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[50_000, 250_000, 1_000_000])
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    rows = []
+    for n_rows in args.rows:
+        rows.append(run_isolated(run_variant, 'pandas', n_rows, 0, 1))
+        for variant in ('batches', 'batches_pool'):
+            rows += [run_isolated(run_variant, variant, n_rows, batch_size, args.workers) for batch_size in args.batch_sizes]
+    print_table(rows)
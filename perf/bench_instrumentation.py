@@ -0,0 +1,147 @@
+"""
+
+Benchmark the overhead of the @instrumented decorator (instrumentation.py, in 01, 02, 03 and 04) on the body of
+normalized_taxi_trips (01): the same function, plain, instrumented with perf_log and BAUPLAN_PERF_LOG unset
+(recording off, the default) or set (recording on), over the same synthetic trips.
+
+Before timing anything, we check the records the decorator emits: one JSON line per call, with the input and
+output rows and bytes of Arrow tables and pandas DataFrames, the parameters, non-negative times and memory,
+and the error of a failing call (which is raised again), that the perf_log parameter turns recording on
+like BAUPLAN_PERF_LOG, and that nothing is recorded or printed without either. We also check that model_report.py reads the lines back, and flags a regression against a
+faster baseline.
+
+To run:
+
+python bench_instrumentation.py --rows 1000000 10000000
+
+"""
+
+import io
+import json
+import os
+import tempfile
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+
+from bench_utils import load_example_module, measure, run_isolated, print_table
+from model_report import read_records, regressions, summarize
+from synthetic_taxi import make_taxi_trips
+
+
+FILTERS = [
+    ('pickup_datetime', '>=', datetime(2022, 1, 1, tzinfo=timezone.utc)),
+    ('trip_miles', '>', 0.0),
+    ('trip_miles', '<', 200.0),
+]
+
+
+def _instrumentation():
+    return load_example_module('01-quick-start/instrumentation.py', 'quick_start_instrumentation')
+
+
+def normalized_taxi_trips(data, backend='default'):
+    # the body of normalized_taxi_trips (01)
+    arrow_utils = load_example_module('01-quick-start/arrow_utils.py', 'quick_start_arrow_utils')
+    return arrow_utils.filter_and_log_trip_miles(data, FILTERS)
+
+
+VARIANTS = {
+    'plain': normalized_taxi_trips,
+    'instrumented_off': _instrumentation().instrumented(normalized_taxi_trips),
+    'instrumented': _instrumentation().instrumented(normalized_taxi_trips),
+}
+
+
+def check_records(n_rows: int = 100_000) -> None:
+    instrumented = _instrumentation().instrumented
+    trips = make_taxi_trips(n_rows)
+
+    @instrumented
+    def to_pandas(data, backend='default', perf_log=''):
+        return data.to_pandas()
+
+    @instrumented(sample_every=0.001)
+    def failing(data):
+        raise ValueError('no trips')
+
+    with tempfile.TemporaryDirectory() as path:
+        log = os.path.join(path, 'runs.jsonl')
+        os.environ['BAUPLAN_PERF_LOG'] = log
+        try:
+            table = VARIANTS['instrumented'](trips, backend='polars')
+            df = to_pandas(data=trips)
+            try:
+                failing(trips)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError('the error of the model must be raised again')
+        finally:
+            del os.environ['BAUPLAN_PERF_LOG']
+        with open(log) as f:
+            normalize, convert, error = [json.loads(line) for line in f]
+
+        assert normalize['model'] == 'normalized_taxi_trips' and normalize['parameters'] == {'backend': 'polars'}
+        assert normalize['input_rows'] == n_rows and normalize['input_bytes'] == trips.nbytes
+        assert normalize['output_rows'] == table.num_rows and normalize['output_bytes'] == table.nbytes
+        assert convert['output_rows'] == len(df) and convert['output_bytes'] > 0
+        for record in (normalize, convert):
+            assert record['wall_s'] >= 0 and record['cpu_s'] >= 0 and record['peak_arrow_bytes'] >= 0
+            assert record['peak_rss_bytes'] > 0
+        assert error['model'] == 'failing' and error['error'] == 'ValueError: no trips'
+        assert 'output_rows' not in error
+
+        # model_report skips the failed runs and any line that is not a record
+        with open(log, 'a') as f:
+            f.write('This table is 0.1 GB and has 100000 rows\n')
+        summary = summarize(read_records([log]))
+        assert set(summary) == {'normalized_taxi_trips', 'to_pandas'}
+        faster = {model: {**stats, 'median_wall_s': stats['median_wall_s'] / 2 - 0.01} for model, stats in summary.items()}
+        assert {(model, stat) for model, stat, _, _ in regressions(summary, faster, 0.2)} >= {
+            ('normalized_taxi_trips', 'median_wall_s'),
+        }
+        assert regressions(summary, summary, 0.2) == []
+
+    # with BAUPLAN_PERF_LOG=-, the record is printed
+    out = io.StringIO()
+    os.environ['BAUPLAN_PERF_LOG'] = '-'
+    try:
+        with redirect_stdout(out):
+            to_pandas(trips.slice(0, 10))
+    finally:
+        del os.environ['BAUPLAN_PERF_LOG']
+    assert json.loads(out.getvalue())['output_rows'] == 10
+    # and so it is with the perf_log parameter of the model, which bauplan run can set on remote workers
+    out = io.StringIO()
+    with redirect_stdout(out):
+        to_pandas(trips.slice(0, 10), perf_log='-')
+    record = json.loads(out.getvalue())
+    assert record['output_rows'] == 10 and record['parameters'] == {'perf_log': '-'}
+    # without either, the model runs as is: nothing is recorded or printed
+    out = io.StringIO()
+    with redirect_stdout(out):
+        assert len(to_pandas(trips.slice(0, 10))) == 10
+    assert out.getvalue() == ''
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    trips = make_taxi_trips(n_rows, days=7)
+    if variant == 'instrumented':
+        os.environ['BAUPLAN_PERF_LOG'] = os.devnull
+    result, stats = measure(VARIANTS[variant], trips)
+
+    return {'variant': variant, 'rows': n_rows, 'output_rows': result.num_rows, **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000_000, 10_000_000])
+    args = parser.parse_args()
+
+    check_records()
+    print('record check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
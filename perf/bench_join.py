@@ -0,0 +1,97 @@
+"""
+
+Benchmark the trips / zones join of trips_and_zones (01, 02) and normalized_taxi_trips (04):
+
+* current: trips.join(zones, 'PULocationID', 'LocationID').combine_chunks()
+* streaming_plain: arrow_utils.join_trips_with_zones, a lookup join over the trip RecordBatches
+* streaming: the same join, with the zone attributes as dictionary arrays (dictionary_encode=True, as in 02 and 04)
+
+Each variant runs in its own process over the same synthetic trips; we report wall time and the peak RSS
+on top of the input data. Before timing anything, we check that all variants return the same rows.
+
+To run:
+
+python bench_join.py --rows 5000000 20000000
+
+"""
+
+from argparse import ArgumentParser
+
+import pyarrow as pa
+
+from bench_utils import load_example_module, measure, run_isolated, print_table
+from synthetic_taxi import make_taxi_trips, make_taxi_zones
+
+
+def _current_join(trips, zones):
+    return trips.join(zones, 'PULocationID', 'LocationID').combine_chunks()
+
+
+def _streaming_plain_join(trips, zones):
+    arrow_utils = load_example_module('01-quick-start/arrow_utils.py', 'quick_start_arrow_utils')
+    return arrow_utils.join_trips_with_zones(trips, zones, 'PULocationID', 'LocationID', dictionary_encode=False)
+
+
+def _streaming_join(trips, zones):
+    arrow_utils = load_example_module('01-quick-start/arrow_utils.py', 'quick_start_arrow_utils')
+    return arrow_utils.join_trips_with_zones(trips, zones, 'PULocationID', 'LocationID', dictionary_encode=True)
+
+
+VARIANTS = {
+    'current': _current_join,
+    'streaming_plain': _streaming_plain_join,
+    'streaming': _streaming_join,
+}
+
+
+def decode_dictionaries(table: pa.Table) -> pa.Table:
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table[field.name].cast(field.type.value_type))
+
+    return table
+
+
+def check_equivalence(n_rows: int = 100_000) -> None:
+    trips = make_taxi_trips(n_rows, batch_size=n_rows // 7)
+    # some trips point to a zone that does not exist, to exercise the left join semantics
+    trips = trips.set_column(
+        trips.schema.get_field_index('PULocationID'),
+        'PULocationID',
+        pa.chunked_array([c.to_numpy() * 2 for c in trips['PULocationID'].chunks])
+    )
+    zones = make_taxi_zones()
+    # the row order of a hash join is not guaranteed, so we compare sorted tables
+    sort_keys = [(name, 'ascending') for name in ('pickup_datetime', 'request_datetime', 'PULocationID')]
+    expected = _current_join(trips, zones).sort_by(sort_keys)
+    for join in (_streaming_plain_join, _streaming_join):
+        actual = decode_dictionaries(join(trips, zones)).sort_by(sort_keys)
+        assert actual.schema == expected.schema, (actual.schema, expected.schema)
+        assert actual.equals(expected), f'{join.__name__} does not match trips.join(zones)'
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    trips = make_taxi_trips(n_rows)
+    zones = make_taxi_zones()
+    table, stats = measure(VARIANTS[variant], trips, zones)
+
+    return {
+        'variant': variant,
+        'rows': n_rows,
+        'chunks': table.column(0).num_chunks,
+        'output_mb': round(table.nbytes / 1024 ** 2, 1),
+        **stats
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[5_000_000, 20_000_000])
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
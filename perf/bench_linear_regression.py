@@ -0,0 +1,152 @@
+"""
+
+Benchmark the ways train_regression_model (03) can fit its linear regression:
+
+* sklearn: the training set converted to pandas, and LinearRegression().fit
+* statistics: linear_regression.fit_linear_regression, the sufficient statistics of each RecordBatch merged and
+  solved, in this process
+* statistics_processes / statistics_threads: the same, with the batches spread over a pool of --workers
+  processes (or threads), the batches sent to the processes as Arrow IPC messages
+
+Each variant runs in its own process over the same synthetic training set, and we report wall time and the peak
+RSS and Arrow memory on top of the input data. With --stream-rows, we also fit the statistics trainer on a stream
+of synthetic batches that is never held in memory (e.g. 100M rows), which sklearn cannot do.
+
+Before timing anything, we check that the coefficients, the intercept, the predictions and the R^2 of the
+statistics trainer match scikit-learn, in all its modes (with one worker per core by default), and with missing
+values in the training set, and that the batches sent to worker processes only hold their own rows.
+
+To run:
+
+python bench_linear_regression.py --rows 10000000 30000000 --stream-rows 100000000
+
+"""
+
+import pickle
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+import pyarrow as pa
+
+from bench_utils import REPO_ROOT, measure, run_isolated, print_table
+from synthetic_taxi import iter_taxi_trips
+
+
+FEATURES = ['log_trip_miles', 'base_passenger_fare', 'trip_time']
+WORKERS = 4
+
+
+def _linear_regression():
+    # imported under its own name, as in train_regression_model, so that the process pool can pickle its functions
+    sys.path.insert(0, str(REPO_ROOT / '03-ml-regression-model' / 'pipeline'))
+    import linear_regression
+
+    return linear_regression
+
+
+def _training_batch(trips: pa.RecordBatch) -> pa.RecordBatch:
+    # the columns of training_dataset (before scaling, which does not change the fit)
+    return pa.RecordBatch.from_pydict({
+        'log_trip_miles': np.log10(trips['trip_miles'].to_numpy() + 0.01),
+        'base_passenger_fare': trips['base_passenger_fare'],
+        'trip_time': trips['trip_time'].cast(pa.float64()),
+        'tips': trips['tips'],
+    })
+
+
+def training_batches(n_rows: int, batch_size: int = 1_000_000):
+    for trips in iter_taxi_trips(n_rows, batch_size=batch_size, realistic=True):
+        yield _training_batch(trips)
+
+
+def training_set(n_rows: int, **kwargs) -> pa.Table:
+    return pa.Table.from_batches(training_batches(n_rows, **kwargs))
+
+
+def sklearn_fit(data: pa.Table):
+    from sklearn.linear_model import LinearRegression
+
+    df = data.to_pandas()
+    return LinearRegression().fit(df[FEATURES], df['tips'])
+
+
+def statistics_fit(data, max_workers=1, **kwargs):
+    return _linear_regression().fit_linear_regression(data, FEATURES, 'tips', max_workers=max_workers, **kwargs)
+
+
+def statistics_processes_fit(data):
+    return statistics_fit(data, max_workers=WORKERS, processes=True)
+
+
+def statistics_threads_fit(data):
+    return statistics_fit(data, max_workers=WORKERS, processes=False)
+
+
+VARIANTS = {
+    'sklearn': sklearn_fit,
+    'statistics': statistics_fit,
+    'statistics_processes': statistics_processes_fit,
+    'statistics_threads': statistics_threads_fit,
+}
+
+
+def check_equivalence(n_rows: int = 500_000) -> None:
+    table = training_set(n_rows, batch_size=n_rows // 7)
+    # missing values, that sklearn never sees and the statistics trainer skips
+    tips = table['tips'].to_numpy().copy()
+    tips[::97] = np.nan
+    with_missing = table.set_column(table.schema.get_field_index('tips'), 'tips', pa.array(tips))
+    df = with_missing.to_pandas().dropna()
+    expected = sklearn_fit(pa.Table.from_pandas(df, preserve_index=False))
+    for variant in ('statistics', 'statistics_processes', 'statistics_threads'):
+        reg = VARIANTS[variant](with_missing.combine_chunks())
+        np.testing.assert_allclose(reg.coef_, expected.coef_, rtol=1e-7, err_msg=variant)
+        np.testing.assert_allclose(reg.intercept_, expected.intercept_, rtol=1e-7, err_msg=variant)
+        np.testing.assert_allclose(reg.predict(df[FEATURES]), expected.predict(df[FEATURES]), rtol=1e-7)
+        assert np.isclose(reg.score(df[FEATURES], df['tips']), expected.score(df[FEATURES], df['tips']), rtol=1e-9)
+        np.testing.assert_allclose(reg.singular_, expected.singular_, rtol=1e-6)
+        assert reg.rank_ == expected.rank_ == len(FEATURES)
+    # pandas input, and a stream of batches (the same trips as table) give the same fit
+    np.testing.assert_allclose(statistics_fit(df).coef_, expected.coef_, rtol=1e-7)
+    reg = statistics_fit(training_batches(n_rows, batch_size=n_rows // 7))
+    np.testing.assert_allclose(reg.coef_, sklearn_fit(table).coef_, rtol=1e-7)
+    # one worker per core by default, and the batches sent to worker processes only hold their own rows
+    np.testing.assert_allclose(statistics_fit(with_missing, max_workers=None).coef_, expected.coef_, rtol=1e-7)
+    batch = with_missing.combine_chunks().to_batches()[0]
+    assert len(_linear_regression()._to_message(batch.slice(0, 100))) < batch.nbytes / 100
+    # and the estimator survives pickling, as save_obj stores it
+    restored = pickle.loads(pickle.dumps(reg))
+    np.testing.assert_array_equal(restored.predict(df[FEATURES]), reg.predict(df[FEATURES]))
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    table = training_set(n_rows)
+    _, stats = measure(VARIANTS[variant], table)
+
+    return {'variant': variant, 'rows': n_rows, 'rows_per_s': int(n_rows / stats['wall_s']), **stats}
+
+
+def run_stream(
+    n_rows: int,
+) -> dict:
+    # the batches are generated as the trainer reads them: the timing includes the generator
+    _, stats = measure(statistics_fit, training_batches(n_rows))
+
+    return {'variant': 'statistics_stream', 'rows': n_rows, 'rows_per_s': int(n_rows / stats['wall_s']), **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000_000, 30_000_000])
+    parser.add_argument('--stream-rows', type=int, nargs='*', default=[100_000_000])
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    rows = [run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS]
+    rows += [run_isolated(run_stream, n_rows) for n_rows in args.stream_rows]
+    print_table(rows)
@@ -0,0 +1,142 @@
+"""
+
+Accuracy vs memory of the approximate medians of stats_by_taxi_zones (14-marimo, quantile_sketch.py) against
+the exact Polars median, over a year of synthetic trips:
+
+* exact: compute_stats_by_zone, holding and sorting all the log_trip_miles values of each zone
+* approx: compute_stats_by_zone_approx, one KLL sketch per zone, for several rank errors
+* daily: one sketch per zone and day, merged into the yearly answer (compute_stats_by_zone_sliced)
+
+For each variant we report the observed rank error of the medians (how far the rank of the returned value
+is from the middle of its zone, as a fraction of the trips of the zone, the max and the 99th percentile over
+zones), the bytes retained by the sketches against the bytes of the values the exact median sorts, and the
+wall time and peak RSS of the call. Before that, we check that the sketches stored as a table and read back
+give the same medians, and that sketches built a batch at a time summarize all the values of their zone; after,
+that the observed errors are within the configured bound for at least 95% of the zones.
+
+To run:
+
+python bench_median_sketch.py --rows 20000000
+
+"""
+
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+import polars as pl
+
+from bench_utils import REPO_ROOT, measure, print_table
+from synthetic_taxi import make_taxi_trips, make_taxi_zones
+
+
+RANK_ERRORS = [0.05, 0.02, 0.01, 0.005, 0.0025]
+
+
+def _taxi_notebook():
+    # taxi_notebook imports quantile_sketch and time_slices from its own folder
+    sys.path.insert(0, str(REPO_ROOT / '14-marimo'))
+    import taxi_notebook
+
+    return taxi_notebook
+
+
+def _trips_and_zones(n_rows: int):
+    notebook = _taxi_notebook()
+    trips = make_taxi_trips(n_rows, start='2022-01-01', days=365).select(['pickup_datetime', 'PULocationID', 'trip_miles'])
+    zones = make_taxi_zones().select(['LocationID', 'Zone'])
+
+    return notebook.join_taxi_tables(pl.from_arrow(trips), pl.from_arrow(zones))
+
+
+def rank_errors(
+    medians: pl.DataFrame,
+    sorted_values: dict,
+) -> np.ndarray:
+    """
+
+    The distance between 0.5 and the range of ranks of each median among the values of its zone.
+
+    """
+    errors = []
+    for zone, median in medians.iter_rows():
+        values = sorted_values[zone]
+        lo = np.searchsorted(values, median, side='left') / len(values)
+        hi = np.searchsorted(values, median, side='right') / len(values)
+        errors.append(max(lo - 0.5, 0.5 - hi, 0.0))
+
+    return np.array(errors)
+
+
+def check_round_trip(parent_df: pl.DataFrame) -> None:
+    notebook = _taxi_notebook()
+    from quantile_sketch import sketches_from_frame, sketches_to_frame
+
+    sketches = notebook.sketch_by_zone(notebook.clean_trips_by_zone(parent_df), rank_error=0.01)
+    expected = notebook.median_from_sketches(sketches).sort('Zone')
+    actual = notebook.median_from_sketches(sketches_from_frame(sketches_to_frame(sketches))).sort('Zone')
+    assert actual.equals(expected), 'sketches read back from a table give different medians'
+    # fed a batch at a time, each sketch still summarizes every value of its zone
+    from quantile_sketch import sketches_by_group
+    cleaned = notebook.clean_trips_by_zone(parent_df)
+    batched = sketches_by_group(cleaned, 'Zone', 'log_trip_miles', batch_size=cleaned.height // 7 + 1)
+    sizes = dict(cleaned.group_by('Zone').len().iter_rows())
+    assert {zone: sketch.n for zone, sketch in batched.items()} == sizes
+
+
+def report(n_rows: int) -> list:
+    notebook = _taxi_notebook()
+    from quantile_sketch import k_for_rank_error
+
+    parent_df = _trips_and_zones(n_rows)
+    check_round_trip(parent_df.head(200_000))
+
+    cleaned = notebook.clean_trips_by_zone(parent_df)
+    sorted_values = {
+        zone: np.sort(group['log_trip_miles'].to_numpy())
+        for (zone,), group in cleaned.partition_by('Zone', as_dict=True).items()
+    }
+    exact, stats = measure(notebook.compute_stats_by_zone, parent_df)
+    assert rank_errors(exact, sorted_values).max() <= 1 / min(len(v) for v in sorted_values.values())
+    rows = [{
+        'variant': 'exact',
+        'rank_error': 0.0,
+        'k': None,
+        'max_error': 0.0,
+        'p99_error': 0.0,
+        'retained_kb': round(sum(v.nbytes for v in sorted_values.values()) / 1024, 1),
+        **stats,
+    }]
+
+    parent_table = parent_df.to_arrow()
+    for rank_error in RANK_ERRORS:
+        variants = {
+            'approx': lambda: notebook.compute_stats_by_zone_approx(parent_df, rank_error=rank_error),
+            'daily': lambda: notebook.compute_stats_by_zone_sliced(parent_table, freq='day', rank_error=rank_error),
+        }
+        k = k_for_rank_error(rank_error)
+        retained = sum(sketch.nbytes for sketch in notebook.sketch_by_zone(cleaned, rank_error).values())
+        for variant, fn in variants.items():
+            medians, stats = measure(fn)
+            errors = rank_errors(medians, sorted_values)
+            # the bound holds with high probability for each zone, we allow a few zones to go over it
+            assert np.quantile(errors, 0.95) <= rank_error, f'{variant} with rank_error={rank_error}: {errors.max()}'
+            rows.append({
+                'variant': variant,
+                'rank_error': rank_error,
+                'k': k,
+                'max_error': round(float(errors.max()), 5),
+                'p99_error': round(float(np.quantile(errors, 0.99)), 5),
+                'retained_kb': round(retained / 1024, 1),
+                **stats,
+            })
+
+    return rows
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, default=20_000_000)
+    args = parser.parse_args()
+
+    print_table(report(args.rows))
@@ -0,0 +1,108 @@
+"""
+
+Benchmark normalized_taxi_trips (01) over the output of trips_and_zones:
+
+* pandas: the original implementation, i.e. to_pandas, three boolean-index filters and np.log10
+* arrow: arrow_utils.filter_and_log_trip_miles, a single pyarrow.compute mask applied once
+* arrow_to_pandas: the same, converting the (filtered) result to pandas at the end
+
+Before timing anything, we check that the pandas and Arrow implementations return the same rows.
+
+To run:
+
+python bench_normalize.py --rows 10000000 50000000
+
+"""
+
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+
+import numpy as np
+
+from bench_utils import load_example_module, measure, run_isolated, print_table
+from synthetic_taxi import make_taxi_trips, make_taxi_zones
+
+
+FILTERS = [
+    ('pickup_datetime', '>=', datetime(2023, 1, 3, tzinfo=timezone.utc)),
+    ('trip_miles', '>', 0.0),
+    ('trip_miles', '<', 200.0),
+]
+
+
+def _arrow_utils():
+    return load_example_module('01-quick-start/arrow_utils.py', 'quick_start_arrow_utils')
+
+
+def _pandas_normalize(data):
+    import pandas as pd
+
+    df = data.to_pandas()
+    df = df[df['pickup_datetime'] >= pd.Timestamp(FILTERS[0][2])]
+    df = df[df['trip_miles'] > 0.0]
+    df = df[df['trip_miles'] < 200.0]
+    df['log_trip_miles'] = np.log10(df['trip_miles'])
+    return df
+
+
+def _arrow_normalize(data):
+    return _arrow_utils().filter_and_log_trip_miles(data, FILTERS)
+
+
+def _arrow_to_pandas_normalize(data):
+    return _arrow_utils().filter_and_log_trip_miles(data, FILTERS, to_pandas=True)
+
+
+VARIANTS = {
+    'pandas': _pandas_normalize,
+    'arrow': _arrow_normalize,
+    'arrow_to_pandas': _arrow_to_pandas_normalize,
+}
+
+
+def _make_input(n_rows: int):
+    trips = make_taxi_trips(n_rows, days=7)
+    # some trips with a missing or zero distance, which the filters must drop
+    trip_miles = trips['trip_miles'].to_numpy().copy()
+    trip_miles[::97] = 0.0
+    trip_miles[::101] = np.nan
+    trips = trips.set_column(trips.schema.get_field_index('trip_miles'), 'trip_miles', [trip_miles])
+
+    return _arrow_utils().join_trips_with_zones(trips, make_taxi_zones())
+
+
+def check_equivalence(n_rows: int = 200_000) -> None:
+    import pandas as pd
+
+    data = _make_input(n_rows)
+    expected = _pandas_normalize(data).reset_index(drop=True)
+    actual = _arrow_to_pandas_normalize(data)
+    pd.testing.assert_frame_equal(actual, expected, check_exact=False, rtol=1e-12)
+    # no filters keeps every trip
+    assert _arrow_utils().filter_and_log_trip_miles(data, []).num_rows == data.num_rows
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    data = _make_input(n_rows)
+    result, stats = measure(VARIANTS[variant], data)
+
+    return {
+        'variant': variant,
+        'rows': n_rows,
+        'rows_out': len(result),
+        'rows_per_s': int(n_rows / stats['wall_s']),
+        **stats
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000_000, 50_000_000])
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
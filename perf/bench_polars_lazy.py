@@ -0,0 +1,107 @@
+"""
+
+Benchmark the Polars functions of the 14-marimo notebook (taxi_notebook.py) over a year of synthetic trips:
+
+* eager: join_taxi_tables (a full join of all the trips) and then compute_stats_by_zone, on DataFrames
+* lazy: compute_stats_by_zone_lazy, a single query plan filtering the trips before a left join,
+  collected with the in-memory engine
+* streaming: the same query plan, collected with the streaming engine
+
+Each variant runs in its own process over the same synthetic trips; we report wall time and the peak RSS
+on top of the input data. Before timing anything, we check that all variants return the same medians.
+
+To run:
+
+python bench_polars_lazy.py --rows 20000000 50000000
+
+"""
+
+import sys
+from argparse import ArgumentParser
+
+import polars as pl
+import pyarrow as pa
+
+from bench_utils import REPO_ROOT, measure, run_isolated, print_table
+from synthetic_taxi import make_taxi_trips, make_taxi_zones
+
+
+# a year of trips, starting a few days early so that the pickup_datetime filter has something to drop
+TRIPS_START = '2021-12-25'
+TRIPS_DAYS = 372
+
+
+def _taxi_notebook():
+    sys.path.insert(0, str(REPO_ROOT / '14-marimo'))
+    import taxi_notebook
+
+    return taxi_notebook
+
+
+def _eager(trips, zones):
+    notebook = _taxi_notebook()
+    parent_df = notebook.join_taxi_tables(pl.from_arrow(trips), pl.from_arrow(zones))
+    return notebook.compute_stats_by_zone(parent_df)
+
+
+def _lazy(trips, zones):
+    return _taxi_notebook().compute_stats_by_zone_lazy(trips, zones).collect(engine='in-memory')
+
+
+def _streaming(trips, zones):
+    return _taxi_notebook().compute_stats_by_zone_lazy(trips, zones).collect(engine='streaming')
+
+
+VARIANTS = {
+    'eager': _eager,
+    'lazy': _lazy,
+    'streaming': _streaming,
+}
+
+
+def _inputs(n_rows: int, **kwargs):
+    # the same columns as the scans of the notebook and of trips_and_zones
+    trips = make_taxi_trips(n_rows, start=TRIPS_START, days=TRIPS_DAYS, **kwargs)
+    trips = trips.select(['pickup_datetime', 'PULocationID', 'trip_miles'])
+    zones = make_taxi_zones().select(['LocationID', 'Zone'])
+
+    return trips, zones
+
+
+def check_equivalence(n_rows: int = 200_000) -> None:
+    trips, zones = _inputs(n_rows, batch_size=n_rows // 7)
+    # some trips point to a zone that does not exist, and some have no or too many miles,
+    # to exercise the join and the filters
+    trips = trips.set_column(
+        trips.schema.get_field_index('PULocationID'),
+        'PULocationID',
+        pa.chunked_array([c.to_numpy() * 2 for c in trips['PULocationID'].chunks])
+    )
+    miles = trips['trip_miles'].to_numpy().copy()
+    miles[::101] = 0.0
+    miles[::103] = 250.0
+    trips = trips.set_column(trips.schema.get_field_index('trip_miles'), 'trip_miles', pa.array(miles))
+    expected = _eager(trips, zones).sort('Zone', nulls_last=True)
+    for variant in ('lazy', 'streaming'):
+        actual = VARIANTS[variant](trips, zones).sort('Zone', nulls_last=True)
+        assert actual.equals(expected), f'{variant} does not match the eager functions'
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    trips, zones = _inputs(n_rows)
+    _, stats = measure(VARIANTS[variant], trips, zones)
+
+    return {'variant': variant, 'rows': n_rows, **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[20_000_000, 50_000_000])
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
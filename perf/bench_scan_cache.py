@@ -0,0 +1,195 @@
+"""
+
+Benchmark the local scan cache of the 14-marimo notebook (scan_cache.py) against scanning every time.
+
+The bauplan client is replaced by a local lake: a Parquet file of synthetic trips per table, scanned with
+DuckDB using the same columns and filter string as bauplan.Client().scan, so the timings only show what
+reading from the cache costs compared to a local scan (a remote scan also pays the network).
+
+We time, over the same trips:
+
+* scan: a scan of the lake
+* miss: a scan through the cache, which also writes the result to the cache
+* hit: the same scan, answered from the cache
+* subset_hit: fewer columns and a narrower time range, answered from the cached entry with Arrow filtering
+
+Before timing anything, we check that answers from the cache equal scans of the lake, that a new commit on
+the branch, another namespace or another limit is a miss, and that entries are evicted least recently used first.
+
+To run:
+
+python bench_scan_cache.py --rows 5000000 20000000
+
+"""
+
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import duckdb
+import pyarrow.parquet as pq
+
+from bench_utils import REPO_ROOT, print_table
+from synthetic_taxi import make_taxi_trips, make_taxi_zones
+
+
+# the scan of the notebook, and a narrower one for the subset hits
+COLUMNS = ['pickup_datetime', 'PULocationID', 'trip_miles']
+FILTER = "pickup_datetime >= '2022-12-21T00:00:00-05:00' AND pickup_datetime < '2023-01-01T00:00:00-05:00'"
+SUBSET_COLUMNS = ['pickup_datetime', 'trip_miles']
+SUBSET_FILTER = "pickup_datetime >= '2022-12-24T00:00:00-05:00' AND pickup_datetime < '2022-12-26T00:00:00-05:00'"
+
+
+def _scan_cache():
+    sys.path.insert(0, str(REPO_ROOT / '14-marimo'))
+    import scan_cache
+
+    return scan_cache
+
+
+class _Branch:
+
+    def __init__(self, name, hash):
+        self.name = name
+        self.hash = hash
+
+
+class LocalLake:
+    """
+
+    The subset of bauplan.Client used by ScanCache, over local Parquet files: one per table.
+
+    """
+
+    def __init__(
+        self,
+        tables: dict,
+    ):
+        self.tables = tables
+        self.commits = {'main': 'commit-1'}
+        self.scans = 0
+
+    def get_branch(self, name):
+        return _Branch(name, self.commits[name])
+
+    def scan(self, table, ref='main', columns=None, filters=None, namespace=None, limit=None):
+        # one namespace here: namespace only changes the key of the scan
+        self.scans += 1
+        select = ', '.join(columns) if columns else '*'
+        where = f'WHERE {filters}' if filters else ''
+        limit = f'LIMIT {limit}' if limit is not None else ''
+        return duckdb.sql(f"SELECT {select} FROM read_parquet('{self.tables[table]}') {where} {limit}").arrow()
+
+
+def _make_lake(directory: Path, n_rows: int) -> LocalLake:
+    trips_path = directory / 'taxi_fhvhv.parquet'
+    zones_path = directory / 'taxi_zones.parquet'
+    pq.write_table(make_taxi_trips(n_rows, start='2022-12-15', days=21), trips_path)
+    pq.write_table(make_taxi_zones(), zones_path)
+
+    return LocalLake({'taxi_fhvhv': trips_path, 'taxi_zones': zones_path})
+
+
+def _sorted(table):
+    # DuckDB does not guarantee the row order of a parallel scan
+    return table.sort_by([(name, 'ascending') for name in table.column_names])
+
+
+def check_cache(n_rows: int = 200_000) -> None:
+    scan_cache = _scan_cache()
+    with tempfile.TemporaryDirectory() as tmp:
+        lake = _make_lake(Path(tmp), n_rows)
+        cache = scan_cache.ScanCache(lake, cache_dir=Path(tmp) / 'cache')
+
+        expected = lake.scan('taxi_fhvhv', columns=COLUMNS, filters=FILTER)
+        assert _sorted(cache.scan('taxi_fhvhv', columns=COLUMNS, filters=FILTER)).equals(_sorted(expected))
+        assert _sorted(cache.scan('taxi_fhvhv', columns=COLUMNS, filters=FILTER)).equals(_sorted(expected))
+        assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1
+
+        # a subset of the columns, a narrower time range, and the same filter written differently
+        for columns, filters in [
+            (SUBSET_COLUMNS, FILTER),
+            (SUBSET_COLUMNS, SUBSET_FILTER),
+            (COLUMNS[::-1], "pickup_datetime < '2023-01-01T00:00:00-05:00' and pickup_datetime >= '2022-12-21T00:00:00-05:00'"),
+        ]:
+            expected = lake.scan('taxi_fhvhv', columns=columns, filters=filters)
+            actual = cache.scan('taxi_fhvhv', columns=columns, filters=filters)
+            assert actual.column_names == expected.column_names
+            assert _sorted(actual).equals(_sorted(expected)), (columns, filters)
+        assert cache.stats()['misses'] == 1
+
+        # more columns, a wider time range, another filter or another commit are all misses
+        scans = lake.scans
+        cache.scan('taxi_fhvhv', columns=COLUMNS + ['DOLocationID'], filters=FILTER)
+        cache.scan('taxi_fhvhv', columns=COLUMNS, filters=FILTER.replace('2022-12-21', '2022-12-20'))
+        cache.scan('taxi_fhvhv', columns=COLUMNS, filters=FILTER + ' AND trip_miles > 0.0')
+        lake.commits['main'] = 'commit-2'
+        cache.scan('taxi_fhvhv', columns=COLUMNS, filters=FILTER)
+        assert lake.scans == scans + 4 and cache.stats()['misses'] == 5
+
+        # other arguments of scan are part of the key: another namespace or a limit is a miss, and a limited
+        # scan only answers the same limit over the same time range
+        cache.scan('taxi_fhvhv', columns=COLUMNS, filters=FILTER, namespace='other')
+        cache.scan('taxi_fhvhv', columns=COLUMNS, filters=FILTER, namespace='other')
+        assert cache.scan('taxi_fhvhv', columns=COLUMNS, filters=FILTER, limit=100).num_rows == 100
+        assert cache.scan('taxi_fhvhv', columns=SUBSET_COLUMNS, filters=FILTER, limit=100).num_rows == 100
+        cache.scan('taxi_fhvhv', columns=COLUMNS, filters=SUBSET_FILTER, limit=100)
+        cache.scan('taxi_fhvhv', columns=COLUMNS, filters=FILTER, limit=10)
+        assert cache.stats()['misses'] == 9 and cache.stats()['hits'] == 6
+
+        # the index survives a restart
+        assert scan_cache.ScanCache(lake, cache_dir=Path(tmp) / 'cache').stats()['entries'] == 9
+
+        # with room for about two entries, the least recently used ones go first
+        small = scan_cache.ScanCache(lake, cache_dir=Path(tmp) / 'small')
+        days = [
+            f"pickup_datetime >= '2022-12-{day}T00:00:00+00:00' AND pickup_datetime < '2022-12-{day + 1}T00:00:00+00:00'"
+            for day in (20, 21, 22)
+        ]
+        small.scan('taxi_fhvhv', columns=COLUMNS, filters=days[0])
+        small.max_bytes = int(2.5 * small.stats()['nbytes'])
+        small.scan('taxi_fhvhv', columns=COLUMNS, filters=days[1])
+        small.scan('taxi_fhvhv', columns=COLUMNS, filters=days[0])
+        small.scan('taxi_fhvhv', columns=COLUMNS, filters=days[2])
+        assert small.stats()['entries'] == 2
+        small.scan('taxi_fhvhv', columns=COLUMNS, filters=days[0])
+        assert small.stats()['hits'] == 2, 'the most recently used entry was evicted'
+        small.scan('taxi_fhvhv', columns=COLUMNS, filters=days[1])
+        assert small.stats()['misses'] == 4, 'the least recently used entry was not evicted'
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+
+    return result, round(time.perf_counter() - start, 3)
+
+
+def run(n_rows: int) -> list:
+    scan_cache = _scan_cache()
+    with tempfile.TemporaryDirectory() as tmp:
+        lake = _make_lake(Path(tmp), n_rows)
+        cache = scan_cache.ScanCache(lake, cache_dir=Path(tmp) / 'cache')
+        rows = []
+        for variant, fn, columns, filters in [
+            ('scan', lake.scan, COLUMNS, FILTER),
+            ('miss', cache.scan, COLUMNS, FILTER),
+            ('hit', cache.scan, COLUMNS, FILTER),
+            ('subset_hit', cache.scan, SUBSET_COLUMNS, SUBSET_FILTER),
+        ]:
+            table, wall_s = _timed(fn, 'taxi_fhvhv', columns=columns, filters=filters)
+            rows.append({'variant': variant, 'rows': n_rows, 'result_rows': table.num_rows, 'wall_s': wall_s})
+
+    return rows
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[5_000_000, 20_000_000])
+    args = parser.parse_args()
+
+    check_cache()
+    print('cache checks passed\n')
+    print_table([row for n_rows in args.rows for row in run(n_rows)])
@@ -0,0 +1,132 @@
+"""
+
+Benchmark the ways train_regression_model (03) can split training_dataset into train, validation and test sets:
+
+* sklearn: the table converted to pandas, and train_test_split called twice (two shuffled copies)
+* hash: splits.split_tables with method='hash', a label per row from a hash of its key columns
+* random: splits.split_tables with method='random', a label per row from a seeded random mask
+
+Each variant runs in its own process over the same synthetic training_dataset, and returns the pandas training
+and validation sets and the test set, as train_regression_model does. We report wall time and the peak RSS and
+Arrow memory on top of the input data.
+
+Before timing anything, we check that the hash and random splits are disjoint, cover every row, have the
+requested sizes, are the same from one run to the next, and that hash labels do not depend on the order
+or on the other rows of the table (so that tip_predictions can recompute them).
+
+To run:
+
+python bench_splits.py --rows 10000000 30000000
+
+"""
+
+from argparse import ArgumentParser
+
+import numpy as np
+import pyarrow as pa
+
+from bench_utils import load_example_module, measure, run_isolated, print_table
+from synthetic_taxi import make_taxi_trips
+
+
+def _splits():
+    return load_example_module('03-ml-regression-model/pipeline/splits.py', 'ml_splits')
+
+
+def training_dataset(n_rows: int, **kwargs) -> pa.Table:
+    # the columns of training_dataset, as train_regression_model receives them
+    trips = make_taxi_trips(n_rows, realistic=True, **kwargs)
+    return pa.table({
+        'log_trip_miles': np.log10(trips['trip_miles'].to_numpy() + 1.0),
+        'base_passenger_fare': trips['base_passenger_fare'],
+        'trip_time': trips['trip_time'].cast(pa.float64()),
+        'tips': trips['tips'],
+        'pickup_datetime': trips['pickup_datetime'],
+    })
+
+
+def sklearn_split(data: pa.Table) -> tuple:
+    # the split of train_regression_model (03) with split='sklearn'
+    from sklearn.model_selection import train_test_split
+
+    df = data.to_pandas()
+    train_set, remaining_set = train_test_split(df, train_size=0.8, random_state=42)
+    validation_set, test_set = train_test_split(remaining_set, test_size=0.1 / (1 - 0.8), random_state=42)
+
+    return train_set, validation_set, test_set
+
+
+def _table_split(method: str):
+    def split(data: pa.Table) -> tuple:
+        # the split of train_regression_model (03) with split='hash' or 'random'
+        train_set, validation_set, test_set = _splits().split_tables(data, method=method)
+        train_set = train_set.to_pandas(split_blocks=True, self_destruct=True)
+        validation_set = validation_set.to_pandas(split_blocks=True, self_destruct=True)
+        return train_set, validation_set, test_set
+
+    return split
+
+
+VARIANTS = {
+    'sklearn': sklearn_split,
+    'hash': _table_split('hash'),
+    'random': _table_split('random'),
+}
+
+
+def check_splits(n_rows: int = 500_000) -> None:
+    splits = _splits()
+    table = training_dataset(n_rows, batch_size=n_rows // 7)
+    for method in splits.METHODS:
+        labels = splits.split_labels(table, method=method)
+        assert np.array_equal(labels, splits.split_labels(table, method=method))
+        assert not np.array_equal(labels, splits.split_labels(table, method=method, seed=7))
+        sizes = [len(splits.split_indices(labels, split)) for split in splits.SPLITS]
+        assert sum(sizes) == n_rows
+        assert np.allclose(np.array(sizes) / n_rows, splits.FRACTIONS, atol=0.005), sizes
+        tables = splits.split_tables(table, method=method)
+        assert [t.num_rows for t in tables] == sizes
+        # the rows keep the order of the table
+        test_rows = splits.split_indices(labels, 'test')
+        assert tables[2]['pickup_datetime'].equals(table['pickup_datetime'].take(test_rows))
+
+    # hash labels follow the rows: shuffled, or on a subset of the table, each row keeps its label
+    labels = splits.split_labels(table, method='hash')
+    order = np.random.default_rng(0).permutation(n_rows)[: n_rows // 3]
+    assert np.array_equal(splits.split_labels(table.take(order), method='hash'), labels[order])
+    # and recomputing them on the test set keeps all of it, as tip_predictions does
+    test_set = splits.split_tables(table, method='hash')[2]
+    assert (splits.split_labels(test_set, method='hash') == splits.SPLITS.index('test')).all()
+
+    try:
+        splits.split_labels(table, method='stratified')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('expected a ValueError for an unknown method')
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    table = training_dataset(n_rows)
+    (train_set, validation_set, test_set), stats = measure(VARIANTS[variant], table)
+
+    return {
+        'variant': variant,
+        'rows': n_rows,
+        'train_rows': len(train_set),
+        'test_rows': len(test_set),
+        **stats,
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000_000, 30_000_000])
+    args = parser.parse_args()
+
+    check_splits()
+    print('split check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
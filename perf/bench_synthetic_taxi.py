@@ -0,0 +1,115 @@
+"""
+
+Benchmark the two ways of writing synthetic taxi_fhvhv trips to Parquet (see synthetic_taxi.py):
+
+* in_memory: make_taxi_trips builds the whole table, then pyarrow.parquet.write_table writes it
+* streaming: write_taxi_trips generates and writes one row group at a time, one file per month of pickups
+
+Each variant runs in its own process; we report wall time, rows/sec and the peak RSS and Arrow memory, which
+only grow with the rows for in_memory.
+
+Before timing anything, we check that the generator is deterministic (the same arguments give the same trips,
+in memory or streamed to Parquet), and that the realistic trips have the shape we want: skewed zones, nulls in
+on_scene_datetime, zero-mile and > 200 miles trips, and pickups following the hours of the day.
+
+To run:
+
+python bench_synthetic_taxi.py --rows 10000000 50000000
+
+"""
+
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from bench_utils import measure, run_isolated, print_table
+from synthetic_taxi import (
+    LONG_TRIP_FRACTION,
+    ON_SCENE_NULL_FRACTION,
+    TRIPS_SCHEMA,
+    ZERO_MILES_FRACTION,
+    make_taxi_trips,
+    write_taxi_trips,
+)
+
+
+START = '2023-01-01'
+DAYS = 90
+
+
+def _in_memory(path: str, n_rows: int) -> int:
+    pq.write_table(make_taxi_trips(n_rows, start=START, days=DAYS, realistic=True), f'{path}/trips.parquet')
+    return n_rows
+
+
+def _streaming(path: str, n_rows: int) -> int:
+    write_taxi_trips(path, n_rows, start=START, days=DAYS, partition='month')
+    return n_rows
+
+
+VARIANTS = {
+    'in_memory': _in_memory,
+    'streaming': _streaming,
+}
+
+
+def check_generator(n_rows: int = 1_000_000) -> None:
+    trips = make_taxi_trips(n_rows, start=START, days=DAYS, batch_size=n_rows // 8, realistic=True)
+    again = make_taxi_trips(n_rows, start=START, days=DAYS, batch_size=n_rows // 8, realistic=True)
+    assert trips.equals(again)
+    assert not trips.equals(make_taxi_trips(n_rows, start=START, days=DAYS, batch_size=n_rows // 8, realistic=True, seed=7))
+
+    # streamed to Parquet without partitions, the trips are the same as in memory
+    with tempfile.TemporaryDirectory() as path:
+        paths = write_taxi_trips(path, n_rows, START, DAYS, partition='none', batch_size=n_rows // 8)
+        written = pq.read_table(paths[0])
+        assert written.schema.equals(TRIPS_SCHEMA) and written.equals(trips)
+        assert pq.ParquetFile(paths[0]).metadata.num_row_groups == 8
+        # partitioned by month, each file only holds its own month, and the rows add up
+        paths = write_taxi_trips(f'{path}/monthly', n_rows, START, DAYS, partition='month', batch_size=n_rows // 8)
+        assert len(paths) == 3
+        months = ds.dataset(f'{path}/monthly', partitioning='hive').to_table()
+        assert months.num_rows == n_rows
+        pickup_months = pc.strftime(months['pickup_datetime'], format='%Y-%m')
+        assert pc.all(pc.equal(pickup_months, months['pickup_month'].cast(pa.string()))).as_py()
+
+    # the shape of the realistic trips
+    n = trips.num_rows
+    assert abs(trips['on_scene_datetime'].null_count / n - ON_SCENE_NULL_FRACTION) < 0.01
+    miles = trips['trip_miles'].to_numpy()
+    assert abs((miles == 0).mean() - ZERO_MILES_FRACTION) < 0.001
+    assert 0 < (miles > 200).mean() < 5 * LONG_TRIP_FRACTION
+    counts = np.sort(pc.value_counts(trips['PULocationID']).field('counts').to_numpy())[::-1]
+    # the 10 busiest zones (out of 265) get more than a fifth of the pickups
+    assert counts[:10].sum() / n > 0.2
+    hours = np.bincount(pc.hour(trips['pickup_datetime']).to_numpy(), minlength=24)
+    assert hours[18] > 4 * hours[4]
+    pickup, dropoff = trips['pickup_datetime'], trips['dropoff_datetime']
+    assert pc.all(pc.less_equal(trips['request_datetime'], pickup)).as_py()
+    assert pc.all(pc.less_equal(trips['on_scene_datetime'], pickup)).as_py()
+    assert pc.all(pc.less(pickup, dropoff)).as_py()
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    with tempfile.TemporaryDirectory() as path:
+        _, stats = measure(VARIANTS[variant], path, n_rows)
+
+    return {'variant': variant, 'rows': n_rows, 'rows_per_s': int(n_rows / stats['wall_s']), **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000_000, 50_000_000])
+    args = parser.parse_args()
+
+    check_generator()
+    print('generator check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
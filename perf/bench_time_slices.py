@@ -0,0 +1,234 @@
+"""
+
+Benchmark time-sliced processing (time_slices.py, in 02 and 14) against processing a whole window at once:
+
+* top_pickup_locations (02): pandas trip counts per pickup location, whole table vs one slice at a time
+  (slice_by='day' / 'week'), summing up the partial counts
+* stats_by_taxi_zones (14): the Polars median of log_trip_miles per zone, compute_stats_by_zone vs
+  compute_stats_by_zone_sliced
+* sliced_scan: reading a Parquet copy of the trips one day at a time with pyarrow.dataset (standing in for
+  bauplan.Client().scan(filters=...), as in compute_stats_by_zone_scanned in the notebook of 14), counting trips
+  per pickup location on a thread pool
+
+Each variant runs in its own process over the same synthetic trips; we report wall time and the peak RSS
+on top of the input data. Before timing anything, we check that the sliced variants return the same results
+as the unsliced ones.
+
+To run:
+
+python bench_time_slices.py --rows 5000000 20000000
+
+"""
+
+import sys
+import tempfile
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from bench_utils import REPO_ROOT, load_example_module, measure, run_isolated, print_table
+from synthetic_taxi import make_taxi_trips, make_taxi_zones
+
+
+START = datetime(2023, 1, 1, tzinfo=timezone.utc)
+END = datetime(2023, 2, 1, tzinfo=timezone.utc)
+GROUP_KEYS = ['PULocationID', 'Borough', 'Zone']
+
+
+def _time_slices():
+    # sliced_apply, as in top_pickup_locations (02)
+    return load_example_module('02-data-visualization-app/pipeline/time_slices.py', 'viz_time_slices')
+
+
+def _scanned_time_slices():
+    # sliced_scan only ships with the notebook of 14
+    return load_example_module('14-marimo/time_slices.py', 'marimo_time_slices')
+
+
+def _taxi_notebook():
+    # taxi_notebook imports time_slices from its own folder
+    sys.path.insert(0, str(REPO_ROOT / '14-marimo'))
+    import taxi_notebook
+
+    return taxi_notebook
+
+
+def _trips_and_zones(n_rows: int) -> pa.Table:
+    arrow_utils = load_example_module('01-quick-start/arrow_utils.py', 'quick_start_arrow_utils')
+    return arrow_utils.join_trips_with_zones(make_taxi_trips(n_rows), make_taxi_zones(), dictionary_encode=True)
+
+
+def _count_trips(table: pa.Table) -> pd.DataFrame:
+    # same as count_trips in the 02 top_pickup_locations model
+    return (
+        table.to_pandas()
+        .groupby(GROUP_KEYS, observed=True)
+        .agg(number_of_trips=('pickup_datetime', 'count'))
+        .reset_index()
+    )
+
+
+def _merge_counts(partials: list) -> pd.DataFrame:
+    return (
+        pd.concat(partials)
+        .groupby(GROUP_KEYS, observed=True)
+        .agg(number_of_trips=('number_of_trips', 'sum'))
+        .reset_index()
+    )
+
+
+def _top_pickups(table, freq):
+    if freq == 'none':
+        return _count_trips(table)
+    return _time_slices().sliced_apply(table, _count_trips, merge=_merge_counts, freq=freq)
+
+
+def _stats_by_zone(table, freq):
+    import polars as pl
+
+    notebook = _taxi_notebook()
+    if freq == 'none':
+        return notebook.compute_stats_by_zone(pl.from_arrow(table))
+    return notebook.compute_stats_by_zone_sliced(table, freq=freq)
+
+
+def _sliced_scan_counts(path, freq):
+    dataset = ds.dataset(path)
+
+    def scan(slice_start, slice_end):
+        return dataset.to_table(
+            columns=['pickup_datetime', 'PULocationID'],
+            filter=(ds.field('pickup_datetime') >= slice_start) & (ds.field('pickup_datetime') < slice_end),
+        )
+
+    def count(table):
+        return table.group_by('PULocationID').aggregate([('pickup_datetime', 'count')])
+
+    def merge(partials):
+        return pa.concat_tables(partials).group_by('PULocationID').aggregate([('pickup_datetime_count', 'sum')])
+
+    if freq == 'none':
+        return count(scan(START, END)).rename_columns(['PULocationID', 'pickup_datetime_count_sum'])
+    return _scanned_time_slices().sliced_scan(scan, count, merge, START, END, freq=freq)
+
+
+def _decode_dictionaries(table: pa.Table) -> pa.Table:
+    # in 14-marimo, Zone comes from a Polars join and is a plain string column
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type):
+            table = table.set_column(i, field.name, table[field.name].cast(field.type.value_type))
+
+    return table
+
+
+def _sorted_counts(counts: pd.DataFrame) -> pd.DataFrame:
+    return (
+        counts
+        .astype({'Borough': 'object', 'Zone': 'object'})
+        .sort_values('PULocationID')
+        .reset_index(drop=True)
+    )
+
+
+def check_equivalence(n_rows: int = 200_000) -> None:
+    table = _trips_and_zones(n_rows)
+    # a few null timestamps, to exercise the last slice of sliced_apply
+    pickups = table['pickup_datetime'].combine_chunks()
+    mask = pa.array([i % 997 == 0 for i in range(len(pickups))])
+    with_nulls = table.set_column(
+        table.schema.get_field_index('pickup_datetime'),
+        'pickup_datetime',
+        pa.compute.if_else(mask, pa.scalar(None, pickups.type), pickups),
+    )
+    expected_counts = _sorted_counts(_top_pickups(table, 'none'))
+    for freq in ('day', 'week'):
+        actual = _sorted_counts(_top_pickups(table, freq))
+        pd.testing.assert_frame_equal(actual, expected_counts, check_dtype=False)
+        # null timestamps are not counted, but the slicing must not drop or duplicate the other rows
+        actual = _sorted_counts(_top_pickups(with_nulls, freq))
+        expected = _sorted_counts(_top_pickups(with_nulls, 'none'))
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False)
+    # an empty table gives an empty result
+    assert len(_top_pickups(table.slice(0, 0), 'day')) == 0
+
+    plain_table = _decode_dictionaries(table)
+    expected_stats = _stats_by_zone(plain_table, 'none').sort('Zone')
+    for freq in ('day', 'week'):
+        actual = _stats_by_zone(plain_table, freq).sort('Zone')
+        assert actual.equals(expected_stats), f'compute_stats_by_zone_sliced({freq}) does not match'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'trips.parquet'
+        pq.write_table(make_taxi_trips(n_rows), path)
+        expected_scan = _sliced_scan_counts(path, 'none').sort_by('PULocationID')
+        for freq in ('day', 'week'):
+            actual = _sliced_scan_counts(path, freq).sort_by('PULocationID')
+            assert actual.equals(expected_scan), f'sliced_scan({freq}) does not match a full scan'
+
+        # the notebook stats, scanned one slice at a time, exact or from the merged sketches
+        import polars as pl
+
+        notebook = _taxi_notebook()
+        dataset = ds.dataset(path)
+        zones = pl.from_arrow(make_taxi_zones().select(['LocationID', 'Zone']))
+
+        def scan_trips(slice_start, slice_end):
+            return dataset.to_table(
+                columns=['pickup_datetime', 'PULocationID', 'trip_miles'],
+                filter=(ds.field('pickup_datetime') >= slice_start) & (ds.field('pickup_datetime') < slice_end),
+            )
+
+        expected = notebook.compute_stats_by_zone(notebook.join_taxi_tables(pl.from_arrow(scan_trips(START, END)), zones))
+        actual = notebook.compute_stats_by_zone_scanned(scan_trips, zones, START, END, freq='week')
+        assert actual.sort('Zone').equals(expected.sort('Zone')), 'compute_stats_by_zone_scanned does not match'
+        approx = notebook.compute_stats_by_zone_scanned(scan_trips, zones, START, END, rank_error=0.01)
+        assert approx['Zone'].sort().equals(expected['Zone'].sort())
+
+
+VARIANTS = {
+    'top_pickup_locations': lambda n_rows: (_top_pickups, _trips_and_zones(n_rows)),
+    'stats_by_taxi_zones': lambda n_rows: (_stats_by_zone, _decode_dictionaries(_trips_and_zones(n_rows))),
+}
+
+
+def run_variant(
+    variant: str,
+    freq: str,
+    n_rows: int,
+) -> dict:
+    fn, table = VARIANTS[variant](n_rows)
+    _, stats = measure(fn, table, freq)
+
+    return {'variant': variant, 'slice_by': freq, 'rows': n_rows, **stats}
+
+
+def run_scan(
+    freq: str,
+    n_rows: int,
+) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'trips.parquet'
+        pq.write_table(make_taxi_trips(n_rows), path)
+        _, stats = measure(_sliced_scan_counts, path, freq)
+
+    return {'variant': 'sliced_scan', 'slice_by': freq, 'rows': n_rows, **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[5_000_000, 20_000_000])
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    rows = []
+    for n_rows in args.rows:
+        for freq in ('none', 'day', 'week'):
+            rows.extend(run_isolated(run_variant, variant, freq, n_rows) for variant in VARIANTS)
+            rows.append(run_isolated(run_scan, freq, n_rows))
+    print_table(rows)
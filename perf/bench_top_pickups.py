@@ -0,0 +1,114 @@
+"""
+
+Benchmark the two ways top_pickup_locations (02) can count trips per pickup location:
+
+* pandas: the whole joined table converted to pandas, grouped by PULocationID, Borough and Zone, and sorted
+* top_k: heavy_hitters.top_k_counts, a Space-Saving summary over the RecordBatches of the table and an exact
+  count of its candidates, returning the top 50 locations (what the app shows)
+
+Each variant runs in its own process over the same synthetic trips, joined with the zones as in trips_and_zones;
+we report wall time and the peak RSS and Arrow memory on top of the input data. Pickup locations follow a Zipf
+distribution, as real pickups do (a few airports and Manhattan zones get most of the trips).
+
+Before timing anything, we check that top_k returns the first rows of the pandas output, with the same counts,
+for skewed pickups (where the summary finds the top locations) and uniform ones (where it falls back to an exact
+count of all the locations).
+
+To run:
+
+python bench_top_pickups.py --rows 20000000 50000000
+
+"""
+
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from bench_utils import load_example_module, measure, run_isolated, print_table
+from synthetic_taxi import N_ZONES, make_taxi_trips, make_taxi_zones
+
+
+TOP_K = 50
+
+
+def _pipeline_module(name: str):
+    return load_example_module(f'02-data-visualization-app/pipeline/{name}.py', f'viz_{name}')
+
+
+def _trips_and_zones(n_rows: int, skewed: bool = True, **kwargs) -> pa.Table:
+    # a multi-month window, as the app would ask for
+    trips = make_taxi_trips(n_rows, days=120, **kwargs)
+    if skewed:
+        rng = np.random.default_rng(7)
+        locations = pa.chunked_array([
+            # Zipf ranks, past the known zones for a few trips, to exercise the null zones
+            np.minimum(rng.zipf(1.3, size=len(chunk)), N_ZONES + 5).astype(np.int64)
+            for chunk in trips['PULocationID'].chunks
+        ])
+        trips = trips.set_column(trips.schema.get_field_index('PULocationID'), 'PULocationID', locations)
+    trips = trips.select(['pickup_datetime', 'PULocationID'])
+
+    return _pipeline_module('arrow_utils').join_trips_with_zones(
+        trips, make_taxi_zones(), 'PULocationID', 'LocationID', dictionary_encode=True
+    )
+
+
+def _pandas_counts(table: pa.Table) -> pd.DataFrame:
+    # the same as top_pickup_locations with top_k=0
+    return (
+        table.to_pandas()
+        .groupby(['PULocationID', 'Borough', 'Zone'], observed=True)
+        .agg(number_of_trips=('pickup_datetime', 'count'))
+        .reset_index()
+        .sort_values(by='number_of_trips', ascending=False)
+        .astype({'Borough': 'object', 'Zone': 'object'})
+    )
+
+
+def _top_k_counts(table: pa.Table) -> pd.DataFrame:
+    # the same as top_pickup_locations with top_k=50
+    return (
+        _pipeline_module('heavy_hitters').top_k_counts(table, TOP_K)
+        .to_pandas()
+        .astype({'Borough': 'object', 'Zone': 'object'})
+    )
+
+
+VARIANTS = {
+    'pandas': _pandas_counts,
+    'top_k': _top_k_counts,
+}
+
+
+def check_equivalence(n_rows: int = 500_000) -> None:
+    for skewed in (True, False):
+        table = _trips_and_zones(n_rows, skewed=skewed, batch_size=n_rows // 7)
+        expected = _pandas_counts(table).reset_index(drop=True)
+        actual = _top_k_counts(table).reset_index(drop=True)
+        assert len(actual) == TOP_K
+        # ties can come in any order: the counts must match rank by rank, and each location its own count
+        assert actual['number_of_trips'].tolist() == expected['number_of_trips'].head(TOP_K).tolist()
+        merged = actual.merge(expected, on=['PULocationID', 'Borough', 'Zone'], suffixes=('', '_expected'))
+        assert len(merged) == TOP_K and (merged['number_of_trips'] == merged['number_of_trips_expected']).all()
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    table = _trips_and_zones(n_rows)
+    result, stats = measure(VARIANTS[variant], table)
+
+    return {'variant': variant, 'rows': n_rows, 'output_rows': len(result), **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[20_000_000, 50_000_000])
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
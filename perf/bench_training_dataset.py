@@ -0,0 +1,135 @@
+"""
+
+Benchmark the two ways training_dataset (03) can scale the training features:
+
+* pandas: the table converted to pandas, dropna, and StandardScaler.fit_transform on a float64 feature matrix
+* streaming: feature_scaling.streaming_standard_scale, a Welford pass over the RecordBatches for the means and
+  the variances, and a second pass scaling each batch into preallocated float32 buffers
+
+Each variant runs in its own process over the same synthetic clean_taxi_trips table, and we report wall time and
+the peak RSS and Arrow memory on top of the input data.
+
+Before timing anything, we check that both variants return the same rows, with the same scaled features (up to
+float32 rounding), on a table with missing values, and that merging the accumulators of two halves of the data
+gives the same means and variances as one accumulator over all of it.
+
+To run:
+
+python bench_training_dataset.py --rows 10000000 30000000
+
+"""
+
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from bench_utils import load_example_module, measure, run_isolated, print_table
+from synthetic_taxi import make_taxi_trips
+
+
+FEATURE_COLUMNS = ['log_trip_miles', 'base_passenger_fare', 'trip_time']
+# the columns of clean_taxi_trips (03)
+CLEAN_COLUMNS = [
+    'pickup_datetime', 'dropoff_datetime', 'PULocationID', 'DOLocationID', 'trip_miles',
+    'trip_time', 'base_passenger_fare', 'tolls', 'sales_tax', 'tips',
+]
+
+
+def _feature_scaling():
+    return load_example_module('03-ml-regression-model/pipeline/feature_scaling.py', 'ml_feature_scaling')
+
+
+def clean_taxi_trips(n_rows: int, **kwargs) -> pa.Table:
+    # the output of clean_taxi_trips, as training_dataset receives it
+    trips = make_taxi_trips(n_rows, realistic=True, **kwargs).select(CLEAN_COLUMNS)
+    mask = pc.and_(
+        pc.and_(pc.greater(trips['trip_miles'], 1.0), pc.greater(trips['tips'], 0.0)),
+        pc.greater(trips['base_passenger_fare'], 1.0),
+    )
+
+    return trips.filter(mask)
+
+
+def pandas_training_dataset(data: pa.Table) -> pd.DataFrame:
+    # the body of training_dataset (03) with scaling='pandas'
+    from sklearn.preprocessing import StandardScaler
+
+    df = data.to_pandas()
+    df = df.dropna()
+    df['log_trip_miles'] = np.log10(df['trip_miles'])
+    features = df[FEATURE_COLUMNS]
+    target = df['tips']
+    pickup_dates = df['pickup_datetime']
+    scaled_features = StandardScaler().fit_transform(features)
+    scaled_df = pd.DataFrame(scaled_features, columns=features.columns)
+    scaled_df['tips'] = target.values
+    scaled_df['pickup_datetime'] = pickup_dates.values
+
+    return scaled_df
+
+
+def streaming_training_dataset(data: pa.Table) -> pa.Table:
+    # the body of training_dataset (03) with scaling='streaming'
+    table, _ = _feature_scaling().streaming_standard_scale(data)
+    return table
+
+
+VARIANTS = {
+    'pandas': pandas_training_dataset,
+    'streaming': streaming_training_dataset,
+}
+
+
+def check_equivalence(n_rows: int = 400_000) -> None:
+    feature_scaling = _feature_scaling()
+    table = clean_taxi_trips(n_rows, batch_size=n_rows // 7)
+    # missing values, which both variants must drop
+    tips = table['tips'].to_numpy().copy()
+    tips[::97] = np.nan
+    table = table.set_column(table.schema.get_field_index('tips'), 'tips', pa.array(tips))
+    fares = pa.array(table['base_passenger_fare'].to_numpy(), mask=np.arange(table.num_rows) % 89 == 0)
+    table = table.set_column(table.schema.get_field_index('base_passenger_fare'), 'base_passenger_fare', fares)
+
+    expected = pandas_training_dataset(table)
+    actual = streaming_training_dataset(table).to_pandas()
+    assert list(actual.columns) == list(expected.columns)
+    assert len(actual) == len(expected) < table.num_rows
+    for column in FEATURE_COLUMNS:
+        assert actual[column].dtype == np.float32
+        np.testing.assert_allclose(actual[column], expected[column], rtol=1e-5, atol=1e-5)
+    np.testing.assert_array_equal(actual['tips'], expected['tips'])
+    assert (actual['pickup_datetime'].values == expected['pickup_datetime'].values).all()
+
+    # the accumulators of two halves merge into the accumulator of the whole
+    matrix = np.random.default_rng(0).normal(10.0, 3.0, size=(100_001, 3))
+    whole, first, second = (feature_scaling.WelfordAccumulator(3) for _ in range(3))
+    whole.update(matrix)
+    first.update(matrix[:30_000])
+    second.update(matrix[30_000:])
+    first.merge(second)
+    np.testing.assert_allclose(first.mean, matrix.mean(axis=0))
+    np.testing.assert_allclose(first.variance, matrix.var(axis=0))
+    np.testing.assert_allclose(whole.variance, first.variance)
+
+
+def run_variant(
+    variant: str,
+    n_rows: int,
+) -> dict:
+    table = clean_taxi_trips(n_rows)
+    result, stats = measure(VARIANTS[variant], table)
+
+    return {'variant': variant, 'rows': table.num_rows, 'output_rows': len(result), **stats}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000_000, 30_000_000])
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    print_table([run_isolated(run_variant, variant, n_rows) for n_rows in args.rows for variant in VARIANTS])
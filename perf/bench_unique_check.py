@@ -0,0 +1,174 @@
+"""
+
+Benchmark the uniqueness checks of the data product of 13 (duplicateCount == 0 rules), on a string ID column
+streamed from a Parquet file:
+
+* count_distinct: the whole column read in memory and its distinct values counted in one hash table, as an
+  exact expect_column_all_unique does
+* bounded: unique_check.check_unique at each of the --max-memory-mb budgets, i.e. a HyperLogLog sketch first,
+  then an exact check in memory or over hash partitions spilled to disk
+
+Each variant runs in its own process, on a column of unique IDs (the sketch cannot decide, the exact check runs),
+with a single duplicate (same), and with 10% of duplicates (the sketch decides), and we report how the check
+decided, its wall time and its peak RSS and Arrow memory.
+
+Before timing anything, we check that the bounded check gives the exact answer in memory and over partitions, for
+strings (with nulls, sliced and dictionary encoded arrays), integers, floats and timestamps, that its string and
+number hashes do not depend on where a value sits in its batch, and that the sketch is within a few standard errors
+of the true number of distinct values.
+
+To run:
+
+python bench_unique_check.py --rows 10000000 30000000 --max-memory-mb 64 1024
+
+"""
+
+import sys
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from bench_utils import REPO_ROOT, measure, run_isolated, print_table
+
+
+COLUMN = 'tripId'
+DATASETS = ('unique', 'one_duplicate', 'duplicates')
+
+
+def _unique_check():
+    # unique_check ships with the Lambda of 13, next to handler.py
+    sys.path.insert(0, str(REPO_ROOT / '13-data-products' / 'src' / 'serverless'))
+    import unique_check
+
+    return unique_check
+
+
+def make_ids(n_rows: int, dataset: str, seed: int = 42) -> pa.Array:
+    # random, distinct, 20 characters IDs, with a duplicate or 10% of them
+    ids = np.random.default_rng(seed).permutation(n_rows).astype(np.int64) * 7919 + 10 ** 15
+    if dataset == 'one_duplicate':
+        ids[-1] = ids[n_rows // 3]
+    elif dataset == 'duplicates':
+        ids[: n_rows // 10] = ids[n_rows // 10: n_rows // 5]
+    return pc.binary_join_element_wise('trip-', ids.astype(str), '').cast(pa.string())
+
+
+def write_ids(path: str, n_rows: int, dataset: str) -> None:
+    batch_size = 1_000_000
+    with pq.ParquetWriter(path, pa.schema([(COLUMN, pa.string())])) as writer:
+        ids = make_ids(n_rows, dataset)
+        for start in range(0, n_rows, batch_size):
+            writer.write_table(pa.table({COLUMN: ids.slice(start, batch_size)}))
+
+
+def count_distinct(path: str, max_memory_mb: float) -> dict:
+    values = pq.read_table(path, columns=[COLUMN])[COLUMN]
+    unique = pc.count_distinct(values, mode='only_valid').as_py() == len(values) - values.null_count
+    return {'unique': unique, 'method': 'hash table', 'partitions': 0}
+
+
+def read_row_groups(path: str):
+    # one row group at a time (iter_batches buffers more of the file: ~170MB here, whatever the batch size)
+    parquet_file = pq.ParquetFile(path)
+    for i in range(parquet_file.num_row_groups):
+        yield from parquet_file.read_row_group(i, columns=[COLUMN]).to_batches()
+
+
+def bounded(path: str, max_memory_mb: float) -> dict:
+    return _unique_check().check_unique(lambda: read_row_groups(path), COLUMN, max_memory_mb=max_memory_mb)
+
+
+VARIANTS = {
+    'count_distinct': count_distinct,
+    'bounded': bounded,
+}
+
+
+def check_unique(n_rows: int = 200_000) -> None:
+    unique_check = _unique_check()
+    strings = make_ids(n_rows, 'unique')
+    with_nulls = pa.array(strings.to_pylist()[:-10] + [None] * 10)
+    cases = {
+        'strings': strings,
+        'strings_with_nulls': with_nulls,
+        'large_strings': strings.cast(pa.large_string()),
+        'dictionary': pa.chunked_array([strings.slice(0, n_rows // 2).dictionary_encode(), strings.slice(n_rows // 2).dictionary_encode()]),
+        'integers': pa.array(np.arange(n_rows) * 3),
+        'floats': pa.array(np.arange(n_rows) / 7),
+        'timestamps': pa.array(np.arange(n_rows) * 10 ** 6).cast(pa.timestamp('us', tz='UTC')),
+    }
+    for name, values in cases.items():
+        values = values if isinstance(values, pa.ChunkedArray) else pa.chunked_array([values])
+        with_duplicate = pa.chunked_array([*values.chunks, values.chunk(0).slice(n_rows // 4, 1)])
+        many_duplicates = pa.chunked_array([*values.chunks, values.chunk(0).slice(0, n_rows // 10)])
+        for table, expected in ((values, True), (with_duplicate, False), (many_duplicates, False)):
+            table = pa.table({COLUMN: table})
+            for max_memory_mb, method in ((256, 'memory'), (0.5, 'partitions')):
+                result = unique_check.check_unique(table, COLUMN, max_memory_mb=max_memory_mb, batch_size=n_rows // 7)
+                assert result['unique'] is expected, (name, max_memory_mb, result)
+                assert result['method'] == ('sketch' if table.num_rows > n_rows * 1.05 else method), (name, result)
+                assert result['values'] == table.num_rows - table[COLUMN].null_count
+    # -0.0 and 0.0 are the same value, and the last partition check sees them together
+    zeros = pa.table({COLUMN: pa.array([0.0] + list(np.arange(1, 50_000, dtype=np.float64)) + [-0.0])})
+    assert not unique_check.check_unique(zeros, COLUMN, max_memory_mb=0.1)['unique']
+
+    # a value hashes the same wherever it is: in a slice, after other strings, in a large_string array
+    hashes = unique_check.hash_array(strings)
+    assert np.array_equal(unique_check.hash_array(strings.slice(1000, 10)), hashes[1000:1010])
+    assert np.array_equal(unique_check.hash_array(strings.cast(pa.large_string())), hashes)
+    assert len(np.unique(hashes)) == n_rows
+    # the sketch, within 4 standard errors
+    for values in (strings, pa.array(np.arange(3 * n_rows))):
+        sketch = unique_check.HyperLogLog()
+        sketch.update(unique_check.hash_array(values))
+        assert abs(sketch.estimate() / len(values) - 1) < 4 * sketch.relative_error, (values.type, sketch.estimate())
+    try:
+        unique_check.check_unique(pa.table({COLUMN: strings}), COLUMN, max_memory_mb=0)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('expected a ValueError for max_memory_mb=0')
+
+
+def run_variant(
+    variant: str,
+    path: str,
+    n_rows: int,
+    dataset: str,
+    max_memory_mb: float,
+) -> dict:
+    result, stats = measure(VARIANTS[variant], path, max_memory_mb)
+
+    return {
+        'variant': variant,
+        'rows': n_rows,
+        'dataset': dataset,
+        'max_memory_mb': max_memory_mb if variant == 'bounded' else '-',
+        'unique': result['unique'],
+        'method': result['method'],
+        'partitions': result['partitions'],
+        **stats,
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000_000, 30_000_000])
+    parser.add_argument('--max-memory-mb', type=float, nargs='+', default=[64, 1024])
+    args = parser.parse_args()
+
+    check_unique()
+    print('uniqueness check passed\n')
+    rows = []
+    for n_rows in args.rows:
+        for dataset in DATASETS:
+            with tempfile.TemporaryDirectory() as root:
+                path = f'{root}/ids.parquet'
+                write_ids(path, n_rows, dataset)
+                rows.append(run_isolated(run_variant, 'count_distinct', path, n_rows, dataset, 0))
+                rows += [run_isolated(run_variant, 'bounded', path, n_rows, dataset, budget) for budget in args.max_memory_mb]
+    print_table(rows)
@@ -0,0 +1,113 @@
+"""
+
+Small utilities shared by the benchmark scripts in this folder: loading helper modules straight from
+the example folders, and measuring wall time and peak memory of a function call.
+
+"""
+
+import importlib.util
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import psutil
+import pyarrow as pa
+
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def load_example_module(
+    relative_path: str,
+    module_name: str,
+):
+    """
+
+    Import a file from one of the example folders (e.g. '01-quick-start/arrow_utils.py') under
+    module_name: example folders are not packages, and several of them ship files with the same name.
+
+    """
+    spec = importlib.util.spec_from_file_location(module_name, REPO_ROOT / relative_path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def measure(
+    fn,
+    *args,
+    sample_every: float = 0.005,
+    **kwargs,
+):
+    """
+
+    Call fn(*args, **kwargs) and return its result together with a dict of stats: wall time, and peak
+    RSS and Arrow memory pool bytes above what the process was using before the call.
+
+    """
+    process = psutil.Process()
+    base_rss = process.memory_info().rss
+    base_arrow = pa.total_allocated_bytes()
+    peaks = {'rss': base_rss, 'arrow': base_arrow}
+    done = threading.Event()
+
+    def _sample():
+        while not done.is_set():
+            peaks['rss'] = max(peaks['rss'], process.memory_info().rss)
+            peaks['arrow'] = max(peaks['arrow'], pa.total_allocated_bytes())
+            time.sleep(sample_every)
+
+    sampler = threading.Thread(target=_sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        wall_time = time.perf_counter() - start
+        done.set()
+        sampler.join()
+    # the call may have finished between two samples
+    peaks['rss'] = max(peaks['rss'], process.memory_info().rss)
+    peaks['arrow'] = max(peaks['arrow'], pa.total_allocated_bytes())
+
+    return result, {
+        'wall_s': round(wall_time, 3),
+        'peak_rss_mb': round((peaks['rss'] - base_rss) / 1024 ** 2, 1),
+        'peak_arrow_mb': round((peaks['arrow'] - base_arrow) / 1024 ** 2, 1),
+    }
+
+
+def run_isolated(
+    fn,
+    *args,
+):
+    """
+
+    Run fn(*args) in a fresh process and return its result: memory freed by a previous variant is not
+    always given back to the OS, so each variant of a benchmark gets a process of its own.
+
+    fn must be importable (i.e. defined at the top level of a module) and return something picklable.
+
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def print_table(
+    rows: list,
+) -> None:
+    """
+
+    Print a list of dicts (all with the same keys) as an aligned text table.
+
+    """
+    if not rows:
+        return
+    columns = list(rows[0].keys())
+    widths = {c: max(len(str(c)), *(len(str(r[c])) for r in rows)) for c in columns}
+    print('  '.join(str(c).ljust(widths[c]) for c in columns))
+    for r in rows:
+        print('  '.join(str(r[c]).ljust(widths[c]) for c in columns))
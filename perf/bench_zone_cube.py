@@ -0,0 +1,214 @@
+"""
+
+Check and benchmark the hourly zone cube of 15-hourly-zone-cube (zone_cube.py) against the models it serves:
+
+* top_pickup_locations (02): the trips / zones join and the pandas group by, vs the cube
+* zone_avg_waiting_times (04): the join, the waiting times and the DuckDB group by, vs the cube
+* stats_by_taxi_zones (14): the Polars join and the per zone stats of log_trip_miles (mean and standard
+  deviation, the median cannot come from the cube), vs the cube
+
+For each model we first check that the tables computed from the cube (and from its roll up over the dropoff
+locations) equal the tables computed from the trips, over the same time window. We then report the wall time
+of each model from the trips, and from the roll up, and the number of rows of the trips, the cube and the roll up.
+
+To run:
+
+python bench_zone_cube.py --rows 5000000 20000000
+
+"""
+
+import sys
+import time
+from argparse import ArgumentParser
+from datetime import datetime, timezone
+
+import duckdb
+import numpy as np
+import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from bench_utils import REPO_ROOT, load_example_module, print_table
+from synthetic_taxi import make_taxi_trips, make_taxi_zones
+
+
+TRIPS_START = '2022-12-20'
+TRIPS_DAYS = 30
+# the time windows of the three models, moved inside the synthetic trips
+WINDOWS = {
+    'top_pickup_locations': (datetime(2023, 1, 1, 5, tzinfo=timezone.utc), datetime(2023, 1, 10, 5, tzinfo=timezone.utc)),
+    'zone_avg_waiting_times': (datetime(2022, 12, 21, 5, tzinfo=timezone.utc), datetime(2023, 1, 1, 5, tzinfo=timezone.utc)),
+    'stats_by_taxi_zones': (datetime(2022, 12, 20, 5, tzinfo=timezone.utc), datetime(2023, 1, 15, 5, tzinfo=timezone.utc)),
+}
+
+
+def _zone_cube():
+    return load_example_module('15-hourly-zone-cube/zone_cube.py', 'hourly_zone_cube')
+
+
+def _arrow_utils():
+    return load_example_module('04-data-quality-expectations/arrow_utils.py', 'quality_arrow_utils')
+
+
+def _taxi_notebook():
+    sys.path.insert(0, str(REPO_ROOT / '14-marimo'))
+    import taxi_notebook
+
+    return taxi_notebook
+
+
+def _in_window(table: pa.Table, column: str, window: tuple) -> pa.Table:
+    start, end = window
+    values = table[column]
+    return table.filter(pc.and_(pc.greater_equal(values, pa.scalar(start)), pc.less(values, pa.scalar(end))))
+
+
+def raw_top_pickup_locations(trips, zones):
+    # trips_and_zones and top_pickup_locations (02)
+    joined = _arrow_utils().join_trips_with_zones(trips, zones, 'PULocationID', 'LocationID', dictionary_encode=True)
+    return (
+        joined.to_pandas()
+        .groupby(['PULocationID', 'Borough', 'Zone'], observed=True)
+        .agg(number_of_trips=('pickup_datetime', 'count'))
+        .reset_index()
+        .sort_values(by='number_of_trips', ascending=False)
+        .astype({'Borough': 'object', 'Zone': 'object'})
+    )
+
+
+def raw_zone_avg_waiting_times(trips, zones):
+    # normalized_taxi_trips, taxi_trip_waiting_times and zone_avg_waiting_times (04)
+    taxi_trip_waiting_times = _arrow_utils().join_trips_with_zones(trips, zones, 'PULocationID', 'LocationID', dictionary_encode=True)
+    taxi_trip_waiting_times = taxi_trip_waiting_times.append_column(
+        'waiting_time_minutes',
+        pc.minutes_between(taxi_trip_waiting_times['request_datetime'], taxi_trip_waiting_times['on_scene_datetime'])
+    )
+    return duckdb.sql("""
+    SELECT
+        Borough::VARCHAR AS Borough,
+        Zone::VARCHAR AS Zone,
+        AVG(waiting_time_minutes) AS avg_waiting_time
+    FROM taxi_trip_waiting_times
+    GROUP BY taxi_trip_waiting_times.Borough, taxi_trip_waiting_times.Zone
+    ORDER BY avg_waiting_time DESC;
+    """).arrow()
+
+
+def raw_stats_by_taxi_zones(trips, zones):
+    # trips_and_zones and compute_stats_by_zone (14), with the stats the cube can serve
+    notebook = _taxi_notebook()
+    parent_df = notebook.join_taxi_tables(pl.from_arrow(trips), pl.from_arrow(zones.select(['LocationID', 'Zone'])))
+    return (
+        notebook.clean_trips_by_zone(parent_df)
+        .group_by('Zone')
+        .agg(
+            pl.len().cast(pl.Int64).alias('number_of_trips'),
+            pl.col('log_trip_miles').mean().alias('mean_log_trip_miles'),
+            pl.col('log_trip_miles').std().alias('std_log_trip_miles'),
+        )
+    )
+
+
+RAW_MODELS = {
+    'top_pickup_locations': raw_top_pickup_locations,
+    'zone_avg_waiting_times': raw_zone_avg_waiting_times,
+    'stats_by_taxi_zones': raw_stats_by_taxi_zones,
+}
+
+
+def _as_pandas(table, keys) -> pd.DataFrame:
+    # pandas, Arrow and Polars results all become pandas DataFrames
+    df = table if isinstance(table, pd.DataFrame) else table.to_pandas()
+    return df.sort_values(keys, na_position='last').reset_index(drop=True)
+
+
+KEYS = {
+    'top_pickup_locations': ['PULocationID'],
+    'zone_avg_waiting_times': ['Borough', 'Zone'],
+    'stats_by_taxi_zones': ['Zone'],
+}
+
+
+def _trips(n_rows: int, **kwargs) -> pa.Table:
+    trips = make_taxi_trips(n_rows, start=TRIPS_START, days=TRIPS_DAYS, **kwargs)
+    # some trips point to a zone that does not exist, and some have no or too many miles
+    locations = pa.chunked_array([c.to_numpy() * 2 for c in trips['PULocationID'].chunks])
+    trips = trips.set_column(trips.schema.get_field_index('PULocationID'), 'PULocationID', locations)
+    miles = trips['trip_miles'].to_numpy().copy()
+    miles[::101] = 0.0
+    miles[::103] = 250.0
+
+    return trips.set_column(trips.schema.get_field_index('trip_miles'), 'trip_miles', pa.array(miles))
+
+
+def check_equivalence(n_rows: int = 300_000) -> None:
+    zone_cube = _zone_cube()
+    trips = _trips(n_rows, batch_size=n_rows // 7)
+    zones = make_taxi_zones()
+    cube = zone_cube.build_zone_cube(trips)
+    pickup_cube = zone_cube.roll_up(cube, ['hour', 'PULocationID'])
+
+    # the cube adds up to the trips
+    assert pc.sum(cube['trip_count']).as_py() == trips.num_rows
+    for measure in ('trip_miles', 'base_passenger_fare', 'tips'):
+        for cube_table in (cube, pickup_cube):
+            assert np.isclose(pc.sum(cube_table[f'{measure}_sum']).as_py(), pc.sum(trips[measure]).as_py(), rtol=1e-12)
+            expected = pc.sum(pc.multiply(trips[measure], trips[measure])).as_py()
+            assert np.isclose(pc.sum(cube_table[f'{measure}_sum_sq']).as_py(), expected, rtol=1e-12)
+
+    for model, window in WINDOWS.items():
+        expected = _as_pandas(RAW_MODELS[model](_in_window(trips, 'pickup_datetime', window), zones), KEYS[model])
+        for cube_table in (cube, pickup_cube):
+            actual = getattr(zone_cube, model)(_in_window(cube_table, 'hour', window), zones)
+            actual = _as_pandas(actual, KEYS[model])
+            assert list(actual.columns) == list(expected.columns), (model, actual.columns, expected.columns)
+            # counts are exact, means and standard deviations are equal up to the order of the float sums
+            pd.testing.assert_frame_equal(actual, expected, check_dtype=False, rtol=1e-9)
+
+
+def run(n_rows: int) -> list:
+    zone_cube = _zone_cube()
+    trips = _trips(n_rows)
+    zones = make_taxi_zones()
+    start = time.perf_counter()
+    cube = zone_cube.build_zone_cube(trips)
+    build_s = time.perf_counter() - start
+    pickup_cube = zone_cube.roll_up(cube, ['hour', 'PULocationID'])
+    rows = [{
+        'model': 'hourly_zone_cube',
+        'trips': n_rows,
+        'cube_rows': cube.num_rows,
+        'roll_up_rows': pickup_cube.num_rows,
+        'raw_s': None,
+        'cube_s': round(build_s, 3),
+    }]
+    for model, window in WINDOWS.items():
+        window_trips = _in_window(trips, 'pickup_datetime', window)
+        window_cube = _in_window(pickup_cube, 'hour', window)
+        start = time.perf_counter()
+        RAW_MODELS[model](window_trips, zones)
+        raw_s = time.perf_counter() - start
+        start = time.perf_counter()
+        getattr(zone_cube, model)(window_cube, zones)
+        cube_s = time.perf_counter() - start
+        rows.append({
+            'model': model,
+            'trips': window_trips.num_rows,
+            'cube_rows': None,
+            'roll_up_rows': window_cube.num_rows,
+            'raw_s': round(raw_s, 3),
+            'cube_s': round(cube_s, 3),
+        })
+
+    return rows
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[5_000_000, 20_000_000])
+    args = parser.parse_args()
+
+    check_equivalence()
+    print('equivalence check passed\n')
+    print_table([row for n_rows in args.rows for row in run(n_rows)])
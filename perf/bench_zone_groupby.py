@@ -0,0 +1,91 @@
+"""
+
+Benchmark the group bys run downstream of the trips / zones join, with the zone attributes as plain strings
+or as dictionary arrays (see arrow_utils.join_trips_with_zones):
+
+* pandas: the top_pickup_locations group by (02), including the to_pandas conversion
+* duckdb: the zone_avg_waiting_times GROUP BY Borough, Zone (04)
+
+Each run happens in its own process; we report wall time and peak RSS on top of the joined table.
+
+To run:
+
+python bench_zone_groupby.py --rows 5000000 20000000
+
+"""
+
+from argparse import ArgumentParser
+
+import pyarrow.compute as pc
+
+from bench_utils import load_example_module, measure, run_isolated, print_table
+from synthetic_taxi import make_taxi_trips, make_taxi_zones
+
+
+def _pandas_top_pickup_locations(table):
+    df = table.to_pandas()
+    return (
+        df
+        .groupby(['PULocationID', 'Borough', 'Zone'], observed=True)
+        .agg(number_of_trips=('pickup_datetime', 'count'))
+        .reset_index()
+        .sort_values(by='number_of_trips', ascending=False)
+    )
+
+
+def _duckdb_zone_avg_waiting_times(table):
+    import duckdb
+
+    taxi_trip_waiting_times = table.append_column(
+        'waiting_time_minutes',
+        pc.minutes_between(table['request_datetime'], table['on_scene_datetime'])
+    )
+    con = duckdb.connect()
+    con.register('taxi_trip_waiting_times', taxi_trip_waiting_times)
+    return con.sql("""
+    SELECT
+        Borough::VARCHAR AS Borough,
+        Zone::VARCHAR AS Zone,
+        AVG(waiting_time_minutes) AS avg_waiting_time
+    FROM taxi_trip_waiting_times
+    GROUP BY taxi_trip_waiting_times.Borough, taxi_trip_waiting_times.Zone
+    ORDER BY avg_waiting_time DESC
+    """).df()
+
+
+ENGINES = {
+    'pandas': _pandas_top_pickup_locations,
+    'duckdb': _duckdb_zone_avg_waiting_times,
+}
+
+
+def run_variant(
+    engine: str,
+    dictionary_encode: bool,
+    n_rows: int,
+) -> dict:
+    arrow_utils = load_example_module('01-quick-start/arrow_utils.py', 'quick_start_arrow_utils')
+    table = arrow_utils.join_trips_with_zones(
+        make_taxi_trips(n_rows), make_taxi_zones(), dictionary_encode=dictionary_encode
+    )
+    result, stats = measure(ENGINES[engine], table)
+
+    return {
+        'engine': engine,
+        'zones': 'dictionary' if dictionary_encode else 'plain',
+        'rows': n_rows,
+        'joined_mb': round(table.nbytes / 1024 ** 2, 1),
+        'groups': len(result),
+        **stats
+    }
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[5_000_000, 20_000_000])
+    args = parser.parse_args()
+
+    print_table([
+        run_isolated(run_variant, engine, dictionary_encode, n_rows)
+        for n_rows in args.rows for engine in ENGINES for dictionary_encode in (False, True)
+    ])
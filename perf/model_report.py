@@ -0,0 +1,121 @@
+"""
+
+Summarize the JSON lines emitted by the @instrumented models (see instrumentation.py in 01, 02, 03 and 04),
+one row per model: number of runs, median and max wall time, median CPU time, peak RSS and Arrow memory,
+and median input and output rows.
+
+The lines can come from the saved output of a run with --param perf_log=-, or from a BAUPLAN_PERF_LOG file:
+lines that are not model records are skipped. With --baseline, each model is compared with the same model in the
+baseline runs, and the script exits with an error if its median wall time or peak Arrow memory grew by more than
+--threshold.
+
+To run:
+
+bauplan run --param perf_log=- > runs.jsonl
+python model_report.py runs.jsonl --baseline baseline.jsonl --threshold 0.2
+
+"""
+
+import json
+import sys
+from argparse import ArgumentParser
+
+import numpy as np
+
+from bench_utils import print_table
+
+
+RECORD_EVENT = 'model_perf'
+# the stats compared with the baseline, where a larger value is a regression
+REGRESSION_STATS = ('median_wall_s', 'max_peak_arrow_mb')
+
+
+def read_records(
+    paths: list,
+) -> list:
+    records = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line.startswith('{'):
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get('event') == RECORD_EVENT and 'error' not in record:
+                    records.append(record)
+
+    return records
+
+
+def summarize(
+    records: list,
+) -> dict:
+    """
+
+    The stats of each model over its runs, as a dict model -> stats.
+
+    """
+    by_model = {}
+    for record in records:
+        by_model.setdefault(record['model'], []).append(record)
+
+    summary = {}
+    for model, runs in sorted(by_model.items()):
+        def values(key):
+            return np.array([run[key] for run in runs], dtype=np.float64)
+
+        summary[model] = {
+            'runs': len(runs),
+            'median_wall_s': round(float(np.median(values('wall_s'))), 3),
+            'max_wall_s': round(float(values('wall_s').max()), 3),
+            'median_cpu_s': round(float(np.median(values('cpu_s'))), 3),
+            'max_peak_rss_mb': round(float(values('peak_rss_bytes').max()) / 1024 ** 2, 1),
+            'max_peak_arrow_mb': round(float(values('peak_arrow_bytes').max()) / 1024 ** 2, 1),
+            'median_input_rows': int(np.median(values('input_rows'))),
+            'median_output_rows': int(np.median(values('output_rows'))),
+        }
+
+    return summary
+
+
+def regressions(
+    summary: dict,
+    baseline: dict,
+    threshold: float,
+) -> list:
+    """
+
+    The (model, stat, baseline value, value) of the REGRESSION_STATS that grew by more than threshold
+    (e.g. 0.2 for 20%) over the baseline. Models that are not in the baseline are not compared.
+
+    """
+    found = []
+    for model, stats in summary.items():
+        if model not in baseline:
+            continue
+        for stat in REGRESSION_STATS:
+            before, after = baseline[model][stat], stats[stat]
+            if after > before * (1 + threshold) and after - before > 0.01:
+                found.append((model, stat, before, after))
+
+    return found
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('paths', nargs='+', help='files with the JSON lines of the runs')
+    parser.add_argument('--baseline', nargs='+', default=None, help='files with the JSON lines of the baseline runs')
+    parser.add_argument('--threshold', type=float, default=0.2)
+    args = parser.parse_args()
+
+    summary = summarize(read_records(args.paths))
+    print_table([{'model': model, **stats} for model, stats in summary.items()])
+    if args.baseline:
+        found = regressions(summary, summarize(read_records(args.baseline)), args.threshold)
+        for model, stat, before, after in found:
+            print(f"\nREGRESSION {model}: {stat} went from {before} to {after}")
+        if found:
+            sys.exit(1)
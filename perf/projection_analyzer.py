@@ -0,0 +1,229 @@
+"""
+
+Static analysis of bauplan projects, looking for columns that a bauplan.Model scan reads from the lake
+but that no function downstream ever uses, e.g. tolls and sales_tax in the 01 quick-start.
+
+For each function we collect the columns it references (string literals, SQL identifiers, and the same in the
+local helper functions it imports and calls), and we follow the DAG from the sinks up to the scans:
+
+* a function needs from its inputs the columns it references, plus the columns its children need from it,
+  unless it projects or aggregates its input (e.g. a group by, df[['a', 'b']], a SQL GROUP BY);
+* a materialized model may be read by anyone later, and an expectation may check any column (e.g. through a
+  list of checks defined outside of the function), so they need all the columns of their inputs;
+* a model nobody reads and that is not materialized only needs what it references (use --keep-sink-columns
+  to be conservative and keep everything such models return);
+* a column the filter of a scan uses is never reported, even if nothing downstream reads it.
+
+Unused scan columns are reported with an estimate of the bytes saved per run, and --write removes them from
+the columns=[...] list in place.
+
+To print the report for all projects in the repo:
+
+python projection_analyzer.py
+
+To trim the scans of a project:
+
+python projection_analyzer.py ../02-data-visualization-app/pipeline --write
+
+"""
+
+import ast
+import re
+from argparse import ArgumentParser
+from datetime import datetime
+from pathlib import Path
+
+from bauplan_ast import find_projects, parse_project, children_of, local_functions, with_helpers
+from bench_utils import REPO_ROOT
+from synthetic_taxi import TRIPS_SCHEMA
+
+
+# method / function names projecting or aggregating their input: the output only has the columns they name
+PROJECTING_CALLS = {'groupby', 'group_by', 'agg', 'aggregate', 'value_counts', 'pivot_table', 'select'}
+# SQL words of a filter, which are not columns
+FILTER_KEYWORDS = {'and', 'or', 'not', 'in', 'is', 'null', 'between', 'like', 'true', 'false'}
+# approximate daily volume of the tables we know, to turn a filter window into rows per run
+ROWS_PER_DAY = {
+    'taxi_fhvhv': 650_000,
+}
+# approximate in-memory (Arrow) width of the columns we know, in bytes per row
+BYTES_PER_VALUE = {field.name: field.type.bit_width // 8 for field in TRIPS_SCHEMA}
+WINDOW_PATTERN = re.compile(r">=\s*'([^']+)'.*<\s*'([^']+)'")
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+
+
+def analyze_project(
+    project_dir: Path,
+    keep_sink_columns: bool = False,
+) -> list:
+    """
+
+    Return a list of dicts, one per bauplan.Model scan with unused columns: the model owning the scan,
+    the scan (a ModelInput) and the unused columns.
+
+    """
+    models = parse_project(project_dir)
+    children = children_of(models)
+    helpers = local_functions(project_dir)
+    facts = {name: _function_facts(model.node, helpers) for name, model in models.items()}
+    required = {}
+
+    def required_from(name):
+        # the columns the children of a model need from its output (None means all of them)
+        if name not in required:
+            model = models[name]
+            needed = set()
+            if model.materialized or (keep_sink_columns and not children[name]):
+                needed = None
+            for child in children[name]:
+                child_needs = needed_by(child)
+                needed = None if needed is None or child_needs is None else needed | child_needs
+            required[name] = needed
+        return required[name]
+
+    def needed_by(name):
+        # the columns a function needs from each of its inputs (None means all of them)
+        referenced, projects, needs_all = facts[name]
+        if needs_all or models[name].materialized or models[name].kind == 'expectation':
+            return None
+        if projects:
+            return referenced
+        downstream = required_from(name)
+        return None if downstream is None else referenced | downstream
+
+    report = []
+    for model in models.values():
+        needed = needed_by(model.name)
+        if needed is None:
+            continue
+        for scan in model.inputs:
+            if scan.table in models or scan.columns is None:
+                continue
+            unused = [c for c in scan.columns if c not in needed and c not in filter_columns(scan.filter)]
+            if unused:
+                report.append({'owner': model, 'scan': scan, 'unused': unused})
+
+    return report
+
+
+def filter_columns(
+    scan_filter: str,
+) -> set:
+    """
+
+    The columns a filter= string uses: its identifiers, leaving out quoted literals and SQL keywords.
+
+    """
+    if not scan_filter:
+        return set()
+    unquoted = re.sub(r"'[^']*'", ' ', scan_filter)
+
+    return {name for name in IDENTIFIER_PATTERN.findall(unquoted) if name.lower() not in FILTER_KEYWORDS}
+
+
+def estimate_bytes_saved(
+    scan,
+    unused: list,
+):
+    """
+
+    Estimate the bytes per run that dropping the unused columns saves, from the pickup window in the filter
+    and the approximate volume of the table, or return None if we do not know the table or the columns.
+
+    """
+    if scan.table not in ROWS_PER_DAY or not scan.filter or any(c not in BYTES_PER_VALUE for c in unused):
+        return None
+    window = WINDOW_PATTERN.search(scan.filter)
+    if window is None:
+        return None
+    start, end = (datetime.fromisoformat(w) for w in window.groups())
+    days = (end - start).total_seconds() / 86400
+
+    return int(days * ROWS_PER_DAY[scan.table] * sum(BYTES_PER_VALUE[c] for c in unused))
+
+
+def trim_columns(
+    report: list
+) -> None:
+    """
+
+    Remove the unused columns from the columns=[...] list of each scan, in place: a column alone on its line
+    loses the whole line, otherwise only the string and its comma are removed.
+
+    """
+    by_path = {}
+    for entry in report:
+        columns = next(k.value for k in entry['scan'].call.keywords if k.arg == 'columns')
+        nodes = [e for e in columns.elts if e.value in entry['unused']]
+        by_path.setdefault(entry['owner'].path, []).extend(nodes)
+
+    for path, nodes in by_path.items():
+        lines = path.read_bytes().splitlines(keepends=True)
+        # edit from the bottom of the file up, so that earlier offsets stay valid
+        for node in sorted(nodes, key=lambda n: (n.lineno, n.col_offset), reverse=True):
+            line = lines[node.lineno - 1]
+            end = node.end_col_offset
+            rest = line[end:].lstrip()
+            if rest.startswith(b','):
+                end = len(line) - len(rest) + 1
+            trimmed = line[:node.col_offset] + line[end:].lstrip(b' ')
+            # the last column of an inline list leaves a dangling comma behind
+            trimmed = re.sub(rb',\s*\]', b']', trimmed)
+            lines[node.lineno - 1] = b'' if not trimmed.strip() else trimmed
+        path.write_bytes(b''.join(lines))
+
+
+def _function_facts(
+    function: ast.FunctionDef,
+    helpers: dict,
+):
+    """
+
+    Return (referenced columns, whether the function projects its input, whether it needs all its input
+    columns) for a function, including the local helper functions it imports and calls.
+
+    """
+    referenced, projects, needs_all = set(), False, False
+    # the body only: the signature lists the scanned columns, which does not mean they are used
+    nodes = function.body + with_helpers(function, helpers)[1:]
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Constant) and isinstance(child.value, str):
+                referenced.add(child.value)
+                if re.search(r'\bselect\b', child.value, re.IGNORECASE):
+                    referenced.update(IDENTIFIER_PATTERN.findall(child.value))
+                    projects = projects or bool(re.search(r'\bgroup\s+by\b', child.value, re.IGNORECASE))
+            elif isinstance(child, ast.Call):
+                name = child.func.attr if isinstance(child.func, ast.Attribute) else getattr(child.func, 'id', None)
+                projects = projects or name in PROJECTING_CALLS
+                # dropna() without a subset looks at every column
+                needs_all = needs_all or (name == 'dropna' and not any(k.arg == 'subset' for k in child.keywords))
+            elif isinstance(child, ast.Subscript) and isinstance(child.slice, ast.List):
+                projects = True
+
+    return referenced, projects, needs_all
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('projects', type=Path, nargs='*', help='bauplan project folders (default: all in the repo)')
+    parser.add_argument('--write', action='store_true', help='remove the unused columns from the scans in place')
+    parser.add_argument(
+        '--keep-sink-columns',
+        action='store_true',
+        help='assume the output of models nobody reads is used, even if they are not materialized'
+    )
+    args = parser.parse_args()
+
+    for project_dir in args.projects or find_projects(REPO_ROOT):
+        report = analyze_project(project_dir, keep_sink_columns=args.keep_sink_columns)
+        for entry in report:
+            scan = entry['scan']
+            print(f"{entry['owner'].path}: {entry['owner'].name}({scan.param}=bauplan.Model('{scan.table}'))")
+            print(f"  unused columns: {', '.join(entry['unused'])}")
+            bytes_saved = estimate_bytes_saved(scan, entry['unused'])
+            if bytes_saved is not None:
+                print(f"  estimated bytes saved per run: {bytes_saved / 1024 ** 3:.2f} GB")
+            print()
+        if args.write:
+            trim_columns(report)
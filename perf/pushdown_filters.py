@@ -0,0 +1,594 @@
+"""
+
+Static analysis of the models.py files of bauplan projects, looking for simple predicates (a column compared
+to a literal) that a model applies in Python right after reading its input, for example:
+
+    df = data.to_pandas()
+    df = df[(df['trip_miles'] > 1.0) & (df['tips'] > 0.0)]
+
+or filters passed as (column, operator, value) tuples, as in arrow_utils.filter_and_log_trip_miles.
+
+Such predicates can be pushed down into the filter= string of the bauplan.Model scanning the data, so that
+less data leaves object storage. When the input is another model of the same project, we push through it
+only if that model is not materialized, this is its only consumer, and neither it nor the local helpers it
+calls ever name the column (e.g. trips_and_zones in 01, which joins every trip with its zone): a model could
+compute, replace or rename it, and the filter would then hold on the scanned column, not on the one we see.
+A predicate the filter already implies (e.g. trip_miles > 0.0 under trip_miles > 1.0) is not pushed again.
+The Python filters are left in place: they are still correct, and now cheap.
+
+For every proposal, we also estimate the rows saved on a local synthetic taxi_fhvhv table, with realistic
+values, in the time window of the current filter.
+
+To print the proposals for all projects in the repo:
+
+python pushdown_filters.py
+
+To rewrite the filter= strings in place for some projects:
+
+python pushdown_filters.py ../01-quick-start ../03-ml-regression-model/pipeline --write
+
+"""
+
+import ast
+import math
+import re
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+from operator import eq, ge, gt, le, lt, ne
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from bauplan_ast import find_projects, parse_project, children_of, literal_value, local_functions, with_helpers
+from bench_utils import REPO_ROOT
+from synthetic_taxi import make_taxi_trips
+
+
+# Python comparison operators, their SQL spelling and the pyarrow.compute function evaluating them
+OPERATORS = {
+    ast.Gt: '>',
+    ast.GtE: '>=',
+    ast.Lt: '<',
+    ast.LtE: '<=',
+    ast.Eq: '==',
+    ast.NotEq: '!=',
+}
+SQL_OPERATORS = {'>': '>', '>=': '>=', '<': '<', '<=': '<=', '==': '=', '!=': '!='}
+PYTHON_OPERATORS = {'>': gt, '>=': ge, '<': lt, '<=': le, '==': eq, '!=': ne}
+ARROW_OPERATORS = {
+    '>': pc.greater,
+    '>=': pc.greater_equal,
+    '<': pc.less,
+    '<=': pc.less_equal,
+    '==': pc.equal,
+    '!=': pc.not_equal,
+}
+# a column compared to a literal in a filter= string: 'quoted string', number, TRUE or FALSE
+FILTER_PREDICATE = re.compile(
+    r"^\s*(\w+)\s*(>=|<=|!=|<>|=|>|<)\s*('(?:[^']|'')*'|-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|TRUE|FALSE)\s*$",
+    re.IGNORECASE,
+)
+AND_PATTERN = re.compile(r'\s+AND\s+', re.IGNORECASE)
+OR_PATTERN = re.compile(r'\bOR\b', re.IGNORECASE)
+IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+# the tables we can estimate the rows saved for: a function generating a realistic synthetic version of them
+# (skewed zones, trips with no miles or more than 200 miles, ...), and the column of their time window
+SYNTHETIC_TABLES = {
+    'taxi_fhvhv': (make_taxi_trips, 'pickup_datetime'),
+}
+
+
+def find_post_scan_predicates(
+    model
+) -> list:
+    """
+
+    Return the (param, column, operator, value) predicates that a model applies to its inputs
+    right after reading them, i.e. before any other change to the data.
+
+    """
+    params = {model_input.param for model_input in model.inputs}
+
+    return _pandas_predicates(model.node, params) + _tuple_predicates(model.node, params)
+
+
+def to_sql(
+    column: str,
+    operator: str,
+    value,
+) -> str:
+    if isinstance(value, bool):
+        literal = 'TRUE' if value else 'FALSE'
+    elif isinstance(value, str):
+        literal = "'{}'".format(value.replace("'", "''"))
+    else:
+        literal = repr(value)
+
+    return f"{column} {SQL_OPERATORS[operator]} {literal}"
+
+
+def parse_filter(
+    scan_filter: str,
+) -> list:
+    """
+
+    Return the (column, operator, value) predicates a filter= string ANDs together, with the operators spelled
+    as in Python. Conjuncts that are not a column compared to a literal are skipped, and a filter with an OR
+    gives no predicates at all: what we return always holds on every row the filter keeps.
+
+    """
+    if not scan_filter or OR_PATTERN.search(re.sub(r"'(?:[^']|'')*'", "''", scan_filter)):
+        return []
+    predicates = []
+    for conjunct in AND_PATTERN.split(scan_filter.strip()):
+        match = FILTER_PREDICATE.match(conjunct.strip('() '))
+        if match is None:
+            continue
+        column, sql_operator, literal = match.groups()
+        if literal.startswith("'"):
+            value = literal[1:-1].replace("''", "'")
+        elif literal.upper() in ('TRUE', 'FALSE'):
+            value = literal.upper() == 'TRUE'
+        else:
+            value = float(literal) if any(c in literal for c in '.eE') else int(literal)
+        predicates.append((column, {'=': '==', '<>': '!='}.get(sql_operator, sql_operator), value))
+
+    return predicates
+
+
+def implies(
+    existing: tuple,
+    predicate: tuple,
+) -> bool:
+    """
+
+    True if every value satisfying the existing (column, operator, value) predicate satisfies predicate too,
+    e.g. trip_miles > 1.0 implies trip_miles > 0.0. Strings are only compared for equality: a filter compares
+    timestamps as strings, and their order as strings need not be their order in time.
+
+    """
+    (column, op, value), (other_column, other_op, other_value) = existing, predicate
+    if column != other_column:
+        return False
+    if (op, value) == (other_op, other_value):
+        return True
+    numbers = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (value, other_value))
+    if not numbers or op == '!=':
+        return False
+    if op == '==':
+        return PYTHON_OPERATORS[other_op](value, other_value)
+    # the existing predicate keeps a half line above value (> or >=) or below it (< or <=)
+    if op in ('>', '>='):
+        if other_op in ('>', '>='):
+            return value > other_value or (value == other_value and (op == '>' or other_op == '>='))
+        if other_op == '!=':
+            return value > other_value or (value == other_value and op == '>')
+        return False
+    if other_op in ('<', '<='):
+        return value < other_value or (value == other_value and (op == '<' or other_op == '<='))
+    if other_op == '!=':
+        return value < other_value or (value == other_value and op == '<')
+
+    return False
+
+
+def propose_pushdowns(
+    project_dir: Path
+) -> list:
+    """
+
+    Return a list of proposals, one for each bauplan.Model scan that can get a narrower filter: dicts with the
+    model owning the scan, the scan itself (a ModelInput), the predicates to push and the resulting filter.
+
+    """
+    models = parse_project(project_dir)
+    children = children_of(models)
+    helpers = local_functions(project_dir)
+    proposals = {}
+    for model in models.values():
+        for param, column, operator, value in find_post_scan_predicates(model):
+            target = _resolve_target(models, children, helpers, model, param, column)
+            if target is None:
+                continue
+            owner, scan = target
+            if any(implies(existing, (column, operator, value)) for existing in parse_filter(scan.filter)):
+                continue
+            proposal = proposals.setdefault(id(scan.call), {
+                'owner': owner,
+                'scan': scan,
+                'predicates': [],
+                'found_in': [],
+            })
+            if (column, operator, value) not in proposal['predicates']:
+                proposal['predicates'].append((column, operator, value))
+                proposal['found_in'].append(model.name)
+
+    for proposal in proposals.values():
+        pushed = [to_sql(*p) for p in proposal['predicates']]
+        existing = [proposal['scan'].filter] if proposal['scan'].filter else []
+        # AND binds tighter than OR: keep an existing filter with an OR in one piece
+        existing = [f'({f})' if OR_PATTERN.search(f) else f for f in existing]
+        proposal['new_filter'] = ' AND '.join(existing + pushed)
+
+    return list(proposals.values())
+
+
+def estimate_rows_saved(
+    proposal: dict,
+    n_rows: int,
+):
+    """
+
+    Evaluate the pushed predicates on n_rows of a realistic synthetic version of the scanned table, in the time
+    window of the current filter, and return the number of rows they remove out of the rows the current filter
+    reads, and that number of rows (None if we cannot generate the table).
+
+    """
+    scan = proposal['scan']
+    if scan.table not in SYNTHETIC_TABLES:
+        return None
+    make_table, time_column = SYNTHETIC_TABLES[scan.table]
+    table = make_table(n_rows, realistic=True, **_time_window(parse_filter(scan.filter), time_column))
+    read = _apply(table, parse_filter(scan.filter))
+
+    return read.num_rows - _apply(read, proposal['predicates']).num_rows, read.num_rows
+
+
+def _time_window(
+    predicates: list,
+    column: str,
+) -> dict:
+    # the start and number of days of the window the predicates keep on column, or {} (the default window of
+    # the synthetic table) if they do not bound it on both sides
+    lower, upper = None, None
+    for name, operator, value in predicates:
+        if name != column or not isinstance(value, str):
+            continue
+        bound = _as_utc(value)
+        if operator in ('>', '>='):
+            lower = bound if lower is None else max(lower, bound)
+        elif operator in ('<', '<='):
+            upper = bound if upper is None else min(upper, bound)
+    if lower is None or upper is None or upper <= lower:
+        return {}
+
+    return {'start': lower.replace(tzinfo=None).isoformat(), 'days': math.ceil((upper - lower) / timedelta(days=1))}
+
+
+def _apply(
+    table,
+    predicates: list,
+):
+    # the rows of table satisfying all the (column, operator, value) predicates
+    mask = None
+    for column, operator, value in predicates:
+        if isinstance(value, str) and pa.types.is_timestamp(table.schema.field(column).type):
+            # a filter= string compares timestamps with ISO strings
+            value = pa.scalar(_as_utc(value), type=table.schema.field(column).type)
+        condition = ARROW_OPERATORS[operator](table[column], value)
+        mask = condition if mask is None else pc.and_kleene(mask, condition)
+
+    return table if mask is None else table.filter(mask)
+
+
+def _as_utc(
+    value: str,
+) -> datetime:
+    # an ISO timestamp, in UTC if it has no offset
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+    return timestamp.astimezone(timezone.utc)
+
+
+def rewrite_filters(
+    proposals: list
+) -> None:
+    """
+
+    Replace the filter= string of each scan with its new filter, in place. Scans without a filter= argument
+    are left alone (we only print the proposal), so that we never have to guess how to format the call.
+
+    """
+    by_path = {}
+    for proposal in proposals:
+        keywords = {k.arg: k.value for k in proposal['scan'].call.keywords}
+        if 'filter' in keywords:
+            by_path.setdefault(proposal['owner'].path, []).append((keywords['filter'], proposal['new_filter']))
+
+    for path, edits in by_path.items():
+        # AST offsets are in bytes of UTF-8 encoded lines
+        source = path.read_bytes()
+        line_starts = [0]
+        for line in source.splitlines(keepends=True):
+            line_starts.append(line_starts[-1] + len(line))
+        # edit from the bottom of the file up, so that earlier offsets stay valid
+        for node, new_filter in sorted(edits, key=lambda e: (e[0].lineno, e[0].col_offset), reverse=True):
+            start = line_starts[node.lineno - 1] + node.col_offset
+            end = line_starts[node.end_lineno - 1] + node.end_col_offset
+            source = source[:start] + f'"{new_filter}"'.encode() + source[end:]
+        path.write_bytes(source)
+
+
+def _pandas_predicates(
+    function: ast.FunctionDef,
+    params: set,
+) -> list:
+    """
+
+    Follow the dataframes created with <param>.to_pandas() through the function body, and collect the predicates
+    of df = df[<mask>] statements until the dataframe is changed in any other way.
+
+    """
+    frames = {}  # dataframe variable -> input param it was converted from
+    predicates = []
+    for statement in function.body:
+        if _is_to_pandas(statement, params):
+            frames[statement.targets[0].id] = statement.value.func.value.id
+            continue
+        frame_filter = _frame_filter(statement, frames)
+        if frame_filter is not None:
+            target, source, mask = frame_filter
+            for column, operator, value in _conjuncts(mask, source):
+                predicates.append((frames[source], column, operator, value))
+            frames[target] = frames[source]
+            continue
+        # any other write to a dataframe we follow: stop following it
+        for name in _written_names(statement):
+            frames.pop(name, None)
+
+    return predicates
+
+
+def _tuple_predicates(
+    function: ast.FunctionDef,
+    params: set,
+) -> list:
+    """
+
+    Collect the (column, operator, literal) tuples of filter lists passed, directly or through a variable,
+    to a function call whose first argument is an input param, e.g. filter_and_log_trip_miles(data, filters).
+
+    """
+    lists = {
+        statement.targets[0].id: statement.value
+        for statement in function.body
+        if isinstance(statement, ast.Assign)
+        and len(statement.targets) == 1
+        and isinstance(statement.targets[0], ast.Name)
+        and isinstance(statement.value, ast.List)
+    }
+    predicates = []
+    for node in ast.walk(function):
+        if not (isinstance(node, ast.Call) and node.args and isinstance(node.args[0], ast.Name)):
+            continue
+        if node.args[0].id not in params:
+            continue
+        for arg in node.args[1:] + [k.value for k in node.keywords]:
+            filter_list = lists.get(arg.id) if isinstance(arg, ast.Name) else arg
+            if isinstance(filter_list, ast.List):
+                predicates.extend((node.args[0].id, *p) for p in _filter_tuples(filter_list))
+
+    return predicates
+
+
+def _filter_tuples(
+    filter_list: ast.List
+) -> list:
+    tuples = []
+    for element in filter_list.elts:
+        if not (isinstance(element, ast.Tuple) and len(element.elts) == 3):
+            continue
+        try:
+            column, operator, value = (literal_value(e) for e in element.elts)
+        except ValueError:
+            # e.g. a datetime built at runtime
+            continue
+        if operator in SQL_OPERATORS:
+            tuples.append((column, operator, value))
+
+    return tuples
+
+
+def _is_to_pandas(
+    statement: ast.stmt,
+    params: set,
+) -> bool:
+    return (
+        isinstance(statement, ast.Assign)
+        and len(statement.targets) == 1
+        and isinstance(statement.targets[0], ast.Name)
+        and isinstance(statement.value, ast.Call)
+        and isinstance(statement.value.func, ast.Attribute)
+        and statement.value.func.attr == 'to_pandas'
+        and isinstance(statement.value.func.value, ast.Name)
+        and statement.value.func.value.id in params
+    )
+
+
+def _frame_filter(
+    statement: ast.stmt,
+    frames: dict,
+):
+    """
+
+    If statement is target = source[<mask>] with source a dataframe we follow, return (target, source, mask).
+
+    """
+    if not (
+        isinstance(statement, ast.Assign)
+        and len(statement.targets) == 1
+        and isinstance(statement.targets[0], ast.Name)
+        and isinstance(statement.value, ast.Subscript)
+        and isinstance(statement.value.value, ast.Name)
+        and statement.value.value.id in frames
+    ):
+        return None
+    mask = statement.value.slice
+    # df['col'] and df[['a', 'b']] are projections, not filters
+    if isinstance(mask, (ast.Constant, ast.List)):
+        return None
+
+    return statement.targets[0].id, statement.value.value.id, mask
+
+
+def _conjuncts(
+    mask: ast.AST,
+    frame: str,
+) -> list:
+    """
+
+    Split a mask like (df['a'] > 1) & (df['b'] < 2) into column-vs-literal predicates, skipping the others
+    (which is safe, since we only push down a subset of an AND).
+
+    """
+    if isinstance(mask, ast.BinOp) and isinstance(mask.op, ast.BitAnd):
+        return _conjuncts(mask.left, frame) + _conjuncts(mask.right, frame)
+    if isinstance(mask, ast.BoolOp) and isinstance(mask.op, ast.And):
+        return [p for value in mask.values for p in _conjuncts(value, frame)]
+    if not (isinstance(mask, ast.Compare) and len(mask.ops) == 1 and type(mask.ops[0]) in OPERATORS):
+        return []
+
+    operator = OPERATORS[type(mask.ops[0])]
+    left, right = mask.left, mask.comparators[0]
+    if _column_of(right, frame) is not None:
+        # literal <op> column: flip it
+        left, right = right, left
+        operator = {'>': '<', '>=': '<=', '<': '>', '<=': '>='}.get(operator, operator)
+    column = _column_of(left, frame)
+    try:
+        value = literal_value(right)
+    except ValueError:
+        return []
+
+    return [(column, operator, value)] if column is not None else []
+
+
+def _column_of(
+    node: ast.AST,
+    frame: str,
+):
+    if (
+        isinstance(node, ast.Subscript)
+        and isinstance(node.value, ast.Name)
+        and node.value.id == frame
+        and isinstance(node.slice, ast.Constant)
+        and isinstance(node.slice.value, str)
+    ):
+        return node.slice.value
+
+    return None
+
+
+def _written_names(
+    statement: ast.stmt
+) -> set:
+    """
+
+    Return the variables a statement assigns or changes in place (df = ..., df['col'] = ..., df.x += ...).
+
+    """
+    targets = []
+    if isinstance(statement, ast.Assign):
+        targets = statement.targets
+    elif isinstance(statement, (ast.AugAssign, ast.AnnAssign)):
+        targets = [statement.target]
+    names = set()
+    for target in targets:
+        while isinstance(target, (ast.Subscript, ast.Attribute)):
+            target = target.value
+        if isinstance(target, ast.Name):
+            names.add(target.id)
+        elif isinstance(target, ast.Tuple):
+            names.update(e.id for e in target.elts if isinstance(e, ast.Name))
+    # method calls like df.drop(..., inplace=True) may change a dataframe as well
+    if isinstance(statement, ast.Expr) and isinstance(statement.value, ast.Call):
+        func = statement.value.func
+        if isinstance(func, ast.Attribute) and isinstance(func.value, ast.Name):
+            names.add(func.value.id)
+
+    return names
+
+
+def _resolve_target(
+    models: dict,
+    children: dict,
+    helpers: dict,
+    model,
+    param: str,
+    column: str,
+):
+    """
+
+    Return the (model, ModelInput) scan a predicate on model's input param can be pushed into, or None.
+
+    """
+    model_input = next(i for i in model.inputs if i.param == param)
+    if model_input.table not in models:
+        # the input is a scan of a table of the lake
+        if model_input.columns is not None and column not in model_input.columns:
+            return None
+        return model, model_input
+
+    # the input is another model: go through it only if nobody else sees its output, and if the column we
+    # filter on is the column it scanned
+    parent = models[model_input.table]
+    if parent.materialized or children[parent.name] != [model.name]:
+        return None
+    if _names_column(parent, helpers, column):
+        return None
+    scans = [
+        i for i in parent.inputs
+        if i.table not in models and i.columns is not None and column in i.columns
+    ]
+
+    return (parent, scans[0]) if len(scans) == 1 else None
+
+
+
+def _names_column(
+    model,
+    helpers: dict,
+    column: str,
+) -> bool:
+    """
+
+    True if the body of model, or a local helper function it calls, names column: as a string literal, or as
+    an identifier in a string (e.g. a SQL query). We cannot tell reading a column from writing, replacing or
+    renaming it, so any mention counts.
+
+    """
+    nodes = model.node.body + with_helpers(model.node, helpers)[1:]
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Constant) and isinstance(child.value, str):
+                if column in IDENTIFIER_PATTERN.findall(child.value):
+                    return True
+
+    return False
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('projects', type=Path, nargs='*', help='bauplan project folders (default: all in the repo)')
+    parser.add_argument('--write', action='store_true', help='rewrite the filter= strings in place')
+    parser.add_argument('--rows', type=int, default=1_000_000, help='rows of the synthetic tables for the estimates')
+    args = parser.parse_args()
+
+    for project_dir in args.projects or find_projects(REPO_ROOT):
+        proposals = propose_pushdowns(project_dir)
+        for proposal in proposals:
+            scan = proposal['scan']
+            print(f"{proposal['owner'].path}: {proposal['owner'].name}({scan.param}=bauplan.Model('{scan.table}'))")
+            print(f"  predicates found in: {', '.join(sorted(set(proposal['found_in'])))}")
+            print(f"  current filter: {scan.filter}")
+            print(f"  proposed filter: {proposal['new_filter']}")
+            estimate = estimate_rows_saved(proposal, args.rows)
+            if estimate is not None:
+                rows_saved, rows_read = estimate
+                print(f"  rows saved on synthetic {scan.table}: {rows_saved} / {rows_read} ({rows_saved / max(rows_read, 1):.1%})")
+            print()
+        if args.write:
+            rewrite_filters(proposals)
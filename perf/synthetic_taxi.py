@@ -0,0 +1,315 @@
+"""
+
+Synthetic stand-ins for the taxi_fhvhv and taxi_zones tables of the bauplan sandbox, so that the
+taxi examples (01, 02, 03, 04 and 14) can be profiled offline, without scanning the data lake.
+
+Only the columns used by the examples are generated, with the same names and Arrow types.
+
+Trips come in two flavours:
+
+* uniform (the default of make_taxi_trips): every column drawn from a simple distribution, which is what most
+  benchmarks in this folder need to compare two implementations on the same data
+* realistic: pickups following the hours of the day, a few pickup and dropoff zones getting most of the trips,
+  log-normal trip miles with some zero-mile and some > 200 miles trips, fares and tips that depend on the trip,
+  and no on_scene_datetime for about a quarter of the trips (as in taxi_fhvhv, where not every company reports it)
+
+Every batch of trips is drawn from its own random generator, seeded by (seed, stream, batch index): the same
+arguments always give the same trips, whether the batches are kept in memory (make_taxi_trips) or streamed to
+Parquet one row group at a time (write_taxi_trips).
+
+To write a partitioned copy of the tables (e.g. to scan it with DuckDB or Polars):
+
+python synthetic_taxi.py --rows 100000000 --start 2023-01-01 --days 90 --partition month --out /tmp/taxi
+
+"""
+
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+
+N_ZONES = 265
+BOROUGHS = ['Manhattan', 'Brooklyn', 'Queens', 'Bronx', 'Staten Island', 'EWR']
+SERVICE_ZONES = ['Yellow Zone', 'Boro Zone', 'Airports', 'EWR']
+TIMESTAMP_TYPE = pa.timestamp('us', tz='UTC')
+TRIPS_SCHEMA = pa.schema([
+    ('request_datetime', TIMESTAMP_TYPE),
+    ('on_scene_datetime', TIMESTAMP_TYPE),
+    ('pickup_datetime', TIMESTAMP_TYPE),
+    ('dropoff_datetime', TIMESTAMP_TYPE),
+    ('PULocationID', pa.int64()),
+    ('DOLocationID', pa.int64()),
+    ('trip_miles', pa.float64()),
+    ('trip_time', pa.int64()),
+    ('base_passenger_fare', pa.float64()),
+    ('tolls', pa.float64()),
+    ('sales_tax', pa.float64()),
+    ('tips', pa.float64()),
+])
+
+DAY_US = 24 * 3600 * 1_000_000
+HOUR_US = 3600 * 1_000_000
+# share of the pickups of each hour of the day: quiet nights, a morning and an evening peak
+HOURLY_PROFILE = np.array([
+    3.0, 2.2, 1.6, 1.2, 1.1, 1.4, 2.4, 3.6, 4.6, 4.6, 4.3, 4.3,
+    4.5, 4.6, 4.9, 5.3, 5.7, 6.2, 6.6, 6.3, 5.8, 5.6, 5.3, 4.3,
+])
+HOURLY_PROFILE = HOURLY_PROFILE / HOURLY_PROFILE.sum()
+# average speed (mph) at each hour of the day: trips are slower at rush hours
+HOURLY_SPEED = np.array([
+    18, 19, 20, 20, 20, 18, 15, 12, 10, 11, 12, 12,
+    12, 12, 11, 10, 10, 10, 11, 13, 14, 15, 16, 17,
+], dtype=np.float64)
+# pickup and dropoff zones follow a Zipf law of this exponent, over a fixed shuffle of the LocationIDs
+# (so that the busiest zones are not simply the first ones): the busiest zone gets ~5% of the trips
+ZONE_SKEW = 0.6
+ZONE_IDS = np.random.default_rng(0).permutation(np.arange(1, N_ZONES + 1, dtype=np.int64))
+ZONE_WEIGHTS = 1.0 / np.arange(1, N_ZONES + 1) ** ZONE_SKEW
+ZONE_WEIGHTS = ZONE_WEIGHTS / ZONE_WEIGHTS.sum()
+ON_SCENE_NULL_FRACTION = 0.25
+ZERO_MILES_FRACTION = 0.002
+LONG_TRIP_FRACTION = 0.0002
+PARTITIONS = ('none', 'month', 'day')
+
+
+def make_taxi_zones() -> pa.Table:
+    """
+
+    A taxi_zones-like table: one row per LocationID, with Borough, Zone and service_zone.
+
+    """
+    location_ids = np.arange(1, N_ZONES + 1, dtype=np.int64)
+
+    return pa.table({
+        'LocationID': location_ids,
+        'Borough': [BOROUGHS[i % len(BOROUGHS)] for i in range(N_ZONES)],
+        'Zone': [f'Zone {i}' for i in location_ids],
+        'service_zone': [SERVICE_ZONES[i % len(SERVICE_ZONES)] for i in range(N_ZONES)],
+    })
+
+
+def make_taxi_trips(
+    n_rows: int,
+    start: str = '2023-01-01',
+    days: int = 31,
+    seed: int = 42,
+    batch_size: int = 1_000_000,
+    realistic: bool = False,
+) -> pa.Table:
+    """
+
+    A taxi_fhvhv-like table with n_rows trips picked up in [start, start + days), built in batches
+    of batch_size rows (so the table is chunked, like the output of a scan).
+
+    """
+    batches = iter_taxi_trips(n_rows, start, days, seed=seed, batch_size=batch_size, realistic=realistic)
+
+    return pa.Table.from_batches(batches, schema=TRIPS_SCHEMA)
+
+
+def iter_taxi_trips(
+    n_rows: int,
+    start: str = '2023-01-01',
+    days: int = 31,
+    seed: int = 42,
+    batch_size: int = 1_000_000,
+    realistic: bool = False,
+    stream: int = 0,
+):
+    """
+
+    Generator version of make_taxi_trips: yield the trips one RecordBatch of batch_size rows at a time.
+    Batch i is drawn from a generator seeded by (seed, stream, i), so it does not depend on the other batches.
+
+    """
+    start_us = np.datetime64(start, 'us').astype(np.int64)
+    window_us = days * DAY_US
+    make_batch = _make_realistic_trips_batch if realistic else _make_trips_batch
+    for index, offset in enumerate(range(0, n_rows, batch_size)):
+        rng = np.random.default_rng([seed, stream, index])
+        yield make_batch(rng, min(batch_size, n_rows - offset), start_us, window_us)
+
+
+def write_taxi_trips(
+    root: str,
+    n_rows: int,
+    start: str = '2023-01-01',
+    days: int = 31,
+    partition: str = 'month',
+    seed: int = 42,
+    batch_size: int = 1_000_000,
+    realistic: bool = True,
+    compression: str = 'snappy',
+) -> list:
+    """
+
+    Write n_rows trips under root as Parquet files, one per time partition ('month' or 'day' of the pickup, as
+    Hive style directories, e.g. pickup_month=2023-01/part-0.parquet), or a single file for 'none'.
+
+    Each partition gets its share of the rows (in proportion to its length) and is generated and written one
+    row group of batch_size rows at a time: memory stays bounded by batch_size, whatever n_rows is.
+    Return the paths of the files written.
+
+    """
+    if partition not in PARTITIONS:
+        raise ValueError(f"Unknown partition {partition}, use one of {PARTITIONS}")
+    root = Path(root)
+    paths = []
+    for stream, (name, first_day, n_days, rows) in enumerate(_partitions(n_rows, start, days, partition)):
+        path = root / name / 'part-0.parquet' if name else root / 'part-0.parquet'
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with pq.ParquetWriter(path, TRIPS_SCHEMA, compression=compression) as writer:
+            batches = iter_taxi_trips(rows, first_day, n_days, seed, batch_size, realistic, stream)
+            for batch in batches:
+                writer.write_batch(batch, row_group_size=batch_size)
+        paths.append(path)
+
+    return paths
+
+
+def _partitions(
+    n_rows: int,
+    start: str,
+    days: int,
+    partition: str,
+) -> list:
+    # (directory name, first day, number of days, number of rows) of each partition of the window
+    first = np.datetime64(start, 'D')
+    end = first + days
+    if partition == 'none':
+        bounds = [first, end]
+    elif partition == 'day':
+        bounds = list(np.arange(first, end + 1))
+    else:
+        months = np.arange(first.astype('datetime64[M]') + 1, end.astype('datetime64[M]') + 1)
+        bounds = [first, *[m.astype('datetime64[D]') for m in months if m.astype('datetime64[D]') < end], end]
+    lengths = np.diff(np.array(bounds, dtype='datetime64[D]')).astype(np.int64)
+    # largest remainder rounding, so that the rows add up to n_rows
+    shares = n_rows * lengths / lengths.sum()
+    rows = np.floor(shares).astype(np.int64)
+    rows[np.argsort(rows - shares)[:n_rows - rows.sum()]] += 1
+
+    partitions = []
+    for day, length, count in zip(bounds[:-1], lengths, rows):
+        if partition == 'none':
+            name = None
+        elif partition == 'day':
+            name = f'pickup_date={day}'
+        else:
+            name = f"pickup_month={day.astype('datetime64[M]')}"
+        partitions.append((name, str(day), int(length), int(count)))
+
+    return partitions
+
+
+def _make_trips_batch(
+    rng: np.random.Generator,
+    n_rows: int,
+    start_us: int,
+    window_us: int,
+) -> pa.RecordBatch:
+    pickup = start_us + rng.integers(0, window_us, n_rows)
+    on_scene = pickup - rng.integers(0, 300, n_rows) * 1_000_000
+    request = on_scene - rng.integers(60, 900, n_rows) * 1_000_000
+    trip_miles = rng.exponential(5.0, n_rows)
+    trip_time = (trip_miles * rng.uniform(120, 300, n_rows)).astype(np.int64)
+    fare = 3.0 + trip_miles * 2.5 + rng.normal(0.0, 2.0, n_rows)
+    tips = np.where(rng.random(n_rows) < 0.2, fare * rng.uniform(0.1, 0.25, n_rows), 0.0)
+
+    return pa.RecordBatch.from_arrays([
+        pa.array(request, TIMESTAMP_TYPE),
+        pa.array(on_scene, TIMESTAMP_TYPE),
+        pa.array(pickup, TIMESTAMP_TYPE),
+        pa.array(pickup + trip_time * 1_000_000, TIMESTAMP_TYPE),
+        pa.array(rng.integers(1, N_ZONES + 1, n_rows)),
+        pa.array(rng.integers(1, N_ZONES + 1, n_rows)),
+        pa.array(trip_miles),
+        pa.array(trip_time),
+        pa.array(fare),
+        pa.array(np.where(rng.random(n_rows) < 0.05, 6.55, 0.0)),
+        pa.array(fare * 0.08875),
+        pa.array(tips),
+    ], schema=TRIPS_SCHEMA)
+
+
+def _make_realistic_trips_batch(
+    rng: np.random.Generator,
+    n_rows: int,
+    start_us: int,
+    window_us: int,
+) -> pa.RecordBatch:
+    # the window is made of whole days: pick a day, then an hour following HOURLY_PROFILE, then a time in the hour
+    n_days = max(window_us // DAY_US, 1)
+    hour = rng.choice(24, size=n_rows, p=HOURLY_PROFILE)
+    pickup = start_us + rng.integers(0, n_days, n_rows) * DAY_US + hour * HOUR_US + rng.integers(0, HOUR_US, n_rows)
+
+    # the cab is requested a few minutes before it shows up (longer at rush hours), and the trip starts soon after
+    wait_s = rng.gamma(2.0, 120.0, n_rows) * (1.0 + 0.5 * (HOURLY_SPEED[hour] < 12))
+    boarding_s = rng.exponential(45.0, n_rows)
+    on_scene = pickup - (boarding_s * 1_000_000).astype(np.int64)
+    request = on_scene - (wait_s * 1_000_000).astype(np.int64)
+    on_scene_is_null = rng.random(n_rows) < ON_SCENE_NULL_FRACTION
+
+    # most trips are a few miles, some are cancelled rides with no miles, and a few are (wrongly) huge
+    trip_miles = np.round(rng.lognormal(np.log(2.8), 0.85, n_rows), 3)
+    is_zero = rng.random(n_rows) < ZERO_MILES_FRACTION
+    is_long = rng.random(n_rows) < LONG_TRIP_FRACTION
+    trip_miles[is_zero] = 0.0
+    trip_miles[is_long] = np.round(rng.uniform(200.0, 600.0, is_long.sum()), 3)
+    speed = HOURLY_SPEED[hour] * rng.uniform(0.7, 1.3, n_rows)
+    trip_time = (trip_miles / speed * 3600 + rng.integers(60, 300, n_rows)).astype(np.int64)
+
+    # fares grow with miles and minutes, with surge pricing on some trips
+    surge = np.where(rng.random(n_rows) < 0.15, rng.uniform(1.2, 2.0, n_rows), 1.0)
+    fare = np.round(np.maximum(2.5 + 1.75 * trip_miles + 0.6 * trip_time / 60, 7.0) * surge, 2)
+    tolls = np.where(rng.random(n_rows) < np.where(trip_miles > 10, 0.3, 0.03), 6.55, 0.0)
+    tips = np.where(rng.random(n_rows) < 0.2, np.round(fare * rng.gamma(4.0, 0.04, n_rows), 2), 0.0)
+
+    return pa.RecordBatch.from_arrays([
+        pa.array(request, TIMESTAMP_TYPE),
+        pa.array(on_scene, TIMESTAMP_TYPE, mask=on_scene_is_null),
+        pa.array(pickup, TIMESTAMP_TYPE),
+        pa.array(pickup + trip_time * 1_000_000, TIMESTAMP_TYPE),
+        pa.array(ZONE_IDS[rng.choice(N_ZONES, size=n_rows, p=ZONE_WEIGHTS)]),
+        pa.array(ZONE_IDS[rng.choice(N_ZONES, size=n_rows, p=ZONE_WEIGHTS)]),
+        pa.array(trip_miles),
+        pa.array(trip_time),
+        pa.array(fare),
+        pa.array(tolls),
+        pa.array(np.round(fare * 0.08875, 2)),
+        pa.array(tips),
+    ], schema=TRIPS_SCHEMA)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--rows', type=int, default=10_000_000)
+    parser.add_argument('--out', required=True, help='folder for taxi_fhvhv/ and taxi_zones.parquet')
+    parser.add_argument('--start', default='2023-01-01')
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--partition', choices=PARTITIONS, default='month')
+    parser.add_argument('--batch-size', type=int, default=1_000_000, help='rows per row group')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--uniform', action='store_true', help='uniform trips instead of realistic ones')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    out = Path(args.out)
+    out.mkdir(parents=True, exist_ok=True)
+    pq.write_table(make_taxi_zones(), out / 'taxi_zones.parquet')
+    paths = write_taxi_trips(
+        out / 'taxi_fhvhv',
+        args.rows,
+        start=args.start,
+        days=args.days,
+        partition=args.partition,
+        seed=args.seed,
+        batch_size=args.batch_size,
+        realistic=not args.uniform,
+    )
+    size_in_gb = round(sum(p.stat().st_size for p in paths) / 1024 ** 3, 3)
+    print(f"{args.rows} trips written to {len(paths)} files ({size_in_gb} GB) in {time.perf_counter() - start_time:.1f}s")